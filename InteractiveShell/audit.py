@@ -0,0 +1,157 @@
+"""Structured audit trail of shell and SSH activity, written as JSON lines."""
+
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+MAX_BYTES = 5 * 1024 * 1024  # rotate the log past this size
+BACKUPS = 5                  # rotated files kept: audit.jsonl.1 ... audit.jsonl.5
+FLUSH_INTERVAL = 1.0         # seconds to gather records into one write
+BATCH_SIZE = 500             # records that trigger a write without waiting
+COMMAND_LIMIT = 1000         # characters of a command kept in the log
+
+
+class AuditLog:  # pylint: disable=too-many-instance-attributes
+    """Buffers audit records in memory and appends them from a worker thread.
+
+    `record` never blocks or touches the disk, so it is safe to call from
+    message handlers. Records are written in batches every `FLUSH_INTERVAL`,
+    and the file is rotated once it passes `MAX_BYTES`.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = MAX_BYTES, backups: int = BACKUPS):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.records = 0
+        self._pending: list[str] = []
+        self._wake = asyncio.Event()
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, event: str, user=None, **fields):
+        """Queue one record. `user` is a Discord user; other fields must be JSON-serialisable."""
+        now = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+        entry = {"time": now, "event": event}
+        if user is not None:
+            entry["user"] = str(user)
+            entry["user_id"] = user.id
+        entry.update(fields)
+        self._pending.append(json.dumps(entry, default=str))
+        self.records += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        if len(self._pending) >= BATCH_SIZE:
+            self._wake.set()
+
+    async def close(self):
+        """Write any buffered records and stop the writer."""
+        self._closed = True
+        self._wake.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self._flush()
+
+    async def _run(self):
+        while self._pending and not self._closed:
+            try:
+                await asyncio.wait_for(self._wake.wait(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self._flush()
+
+    async def _flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except OSError as e:
+            print(f"[InteractiveShell] Failed to write audit log: {e}")
+
+    def _write(self, batch: list[str]):
+        """Append a batch, rotating first if it would overflow the file. Blocking."""
+        data = ("\n".join(batch) + "\n").encode()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            size = 0
+        if size and size + len(data) > self.max_bytes:
+            self._rotate()
+        with open(self.path, "ab") as f:
+            f.write(data)
+
+    def _rotate(self):
+        for index in range(self.backups - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{index}")
+            if older.exists():
+                os.replace(older, self.path.with_name(f"{self.path.name}.{index + 1}"))
+        if self.backups:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+
+
+class CommandLog:  # pylint: disable=too-many-instance-attributes
+    """Per-session accounting that turns input and output into `command` records.
+
+    A command's record is written when its exit status is reported, when the
+    next command is sent, or when the session ends. Output that arrives in
+    between is attributed to it. Sessions that can't report a status per
+    command log `status: null`; the shell's own exit status is on `session_end`.
+    """
+
+    def __init__(self, audit: AuditLog, kind: str, user, **context):
+        self.audit = audit
+        self.kind = kind
+        self.user = user
+        self.context = context
+        self.started = time.monotonic()
+        self.commands = 0
+        self.output_bytes = 0
+        self._command: Optional[str] = None
+        self._command_started = 0.0
+        self._command_bytes = 0
+        audit.record("session_start", user, kind=kind, **context)
+
+    def command(self, text: str):
+        """A line of input was sent to the session."""
+        self._finish(None)
+        self.commands += 1
+        self._command = text[:COMMAND_LIMIT]
+        self._command_started = time.monotonic()
+        self._command_bytes = 0
+
+    def output(self, nbytes: int):
+        """The session produced `nbytes` of output."""
+        self.output_bytes += nbytes
+        self._command_bytes += nbytes
+
+    def status(self, code: int):
+        """The running command exited with `code`."""
+        self._finish(code)
+
+    def close(self, status: Optional[int] = None):
+        """The session ended, with the shell's exit status if known."""
+        self._finish(status)
+        self.audit.record(
+            "session_end", self.user, kind=self.kind, status=status,
+            duration=round(time.monotonic() - self.started, 3),
+            commands=self.commands, output_bytes=self.output_bytes, **self.context,
+        )
+
+    def _finish(self, status: Optional[int]):
+        if self._command is None:
+            return
+        self.audit.record(
+            "command", self.user, kind=self.kind, command=self._command, status=status,
+            duration=round(time.monotonic() - self._command_started, 3),
+            output_bytes=self._command_bytes, **self.context,
+        )
+        self._command = None
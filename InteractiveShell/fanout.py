@@ -0,0 +1,91 @@
+"""Runs one command on many hosts with bounded concurrency."""
+
+import asyncio
+import time
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional
+
+DEFAULT_PARALLEL = 10
+OUTPUT_LIMIT = 4000  # characters of output kept per host for the summary
+
+# (target, command) -> (exit status, combined output). Raises on connection failure.
+Runner = Callable[[str, str], Awaitable[tuple[Optional[int], str]]]
+
+
+class HostResult:  # pylint: disable=too-few-public-methods
+    """How one host ran the command."""
+
+    __slots__ = ("target", "status", "duration", "output", "error")
+
+    def __init__(
+        self, target: str, status: Optional[int] = None, duration: float = 0.0,
+        output: str = "", error: Optional[str] = None
+    ):
+        self.target = target
+        self.status = status
+        self.duration = duration
+        self.output = output
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        """Whether the command ran and exited with status 0."""
+        return self.error is None and self.status == 0
+
+    def line(self) -> str:
+        """One-line status for the live progress output."""
+        mark = "✅" if self.ok else "❌"
+        outcome = self.error or f"exit {self.status}"
+        return f"{mark} {self.target}: {outcome} ({self.duration:.1f}s)"
+
+
+def parse_target(spec: str) -> tuple[Optional[str], str, int]:
+    """Split `user@host:port` into (user, host, port). User and port are optional."""
+    user, _, hostport = spec.rpartition("@")
+    host, _, port = hostport.partition(":")
+    if not host:
+        raise ValueError(f"no host in {spec!r}")
+    return user or None, host, int(port) if port else 22
+
+
+async def fan_out(
+    targets: Iterable[str], command: str, runner: Runner, limit: int = DEFAULT_PARALLEL
+) -> AsyncIterator[HostResult]:
+    """Run `command` on every target, at most `limit` at a time, yielding results as they finish."""
+    slots = asyncio.Semaphore(limit)
+
+    async def run(target: str) -> HostResult:
+        async with slots:
+            start = time.monotonic()
+            try:
+                status, output = await runner(target, command)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                error = str(e) or type(e).__name__
+                return HostResult(target, duration=time.monotonic() - start, error=error)
+            if len(output) > OUTPUT_LIMIT:
+                output = output[:OUTPUT_LIMIT] + "\n[output truncated]"
+            return HostResult(target, status, time.monotonic() - start, output)
+
+    tasks = [asyncio.create_task(run(target)) for target in dict.fromkeys(targets)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def format_summary(command: str, results: list[HostResult]) -> str:
+    """A plain text report of every host's result, failures first."""
+    failed = sum(1 for result in results if not result.ok)
+    lines = [
+        f"$ {command}",
+        f"{len(results)} hosts, {len(results) - failed} succeeded, {failed} failed",
+        "",
+    ]
+    for result in sorted(results, key=lambda r: (r.ok, r.target)):
+        lines.append(f"=== {result.line()}")
+        if result.output:
+            lines.append(result.output.rstrip("\n"))
+        lines.append("")
+    return "\n".join(lines)
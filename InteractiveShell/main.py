@@ -1,123 +1,303 @@
 """Main module for the InteractiveShell cog."""
 
 import asyncio
-from datetime import datetime
+import time
+from pathlib import Path
 
-from redbot.core import commands
+from redbot.core import Config, commands
 from redbot.core.bot import Red
 
+from .audit import AuditLog, CommandLog
+from .output import OutputPump
+from .routing import SessionRouter
+from .sessions import (
+    DEFAULT_LIMITS, DEFAULT_NAME, MAX_SESSIONS, SessionGroup, ShellSession, apply_limits
+)
+from .terminal import PtyShell
+
 # Attempt to import optional SSH handler
 try:
-    from . import ssh_handler
+    from .ssh_handler import SSHCommands, SSHPool
     HAS_PARAMIKO = True
 except (ImportError, ModuleNotFoundError):
     HAS_PARAMIKO = False
 
+    class SSHCommands:  # pylint: disable=too-few-public-methods
+        """Placeholder used when paramiko isn't installed."""
+
 
-class InteractiveShell(commands.Cog):
+class InteractiveShell(SSHCommands, commands.Cog):  # pylint: disable=too-many-instance-attributes
     """A cog for an interactive shell session."""
 
     def __init__(self, bot: Red):
         self.bot = bot
-        self.sessions = {}
+        self.sessions: dict[tuple[int, int], SessionGroup] = {}  # (channel id, author id)
+        self.router = SessionRouter(bot)
+        self.config = Config.get_conf(self, identifier=0x5E11C0DE, force_registration=True)
+        self.config.register_global(ssh_groups={}, shell_limits=DEFAULT_LIMITS)
         if HAS_PARAMIKO:
             self.ssh_clients = {}
-        self.log_file = "shell_session_log.txt"
+            self.ssh_pool = SSHPool()
+        self.audit = AuditLog(Path(__file__).parent / "data" / "audit.jsonl")
+
+    async def cog_unload(self):
+        """End open sessions, close SSH connections and write out the audit log."""
+        self.router.close()
+        for group in list(self.sessions.values()):
+            for session in list(group.shells.values()):
+                session.terminate()
+        if HAS_PARAMIKO:
+            sessions = list(self.ssh_clients.values())
+            self.ssh_clients.clear()
+            await asyncio.gather(*(s.close() for s in sessions), return_exceptions=True)
+            await self.ssh_pool.close()
+        await self.audit.close()
 
     def log_attempt(self, user, session_type):
-        """Log an attempt to start a shell or SSH session."""
-        try:
-            with open(self.log_file, "a", encoding="utf-8") as f:
-                f.write(
-                    f"{datetime.utcnow().isoformat()} - {user} "
-                    f"(ID: {user.id}) attempted to start a {session_type} session.\n"
-                )
-        except OSError:
-            # Suppressed log failure, common in readonly containers
-            pass
+        """Record an attempt to start a shell or SSH session, whether or not it succeeds."""
+        self.audit.record("attempt", user, kind=session_type)
 
     @commands.command()
     @commands.is_owner()
-    async def start_shell(self, ctx):
-        """Start an interactive shell session."""
+    async def start_shell(self, ctx, name: str = DEFAULT_NAME, mode: str = "pipe"):
+        """Start a named interactive shell session in this channel.
+
+        Pass `pty` as the mode for a terminal whose screen is shown in one
+        live-updating message, for programs like `top`, progress bars and REPLs.
+        Plain messages go to the newest shell; start a message with `@name ` to
+        send it to another one, or switch with `[p]shell_use`.
+        """
+        if name.lower() in ("pipe", "pty") and mode == "pipe":
+            # `[p]start_shell pty` from before sessions had names
+            name, mode = DEFAULT_NAME, name.lower()
         self.log_attempt(ctx.author, "shell")
-    
-        if ctx.author.id in self.sessions:
-            await ctx.send("You already have an active shell session.")
+
+        key = (ctx.channel.id, ctx.author.id)
+        group = self.sessions.get(key)
+        if group is None and key in self.router.routes:
+            await ctx.send("You already have an SSH session running in this channel.")
+            return
+        if group is not None and name in group.shells:
+            await ctx.send(f"You already have a shell named `{name}` in this channel.")
+            return
+        if group is not None and len(group.shells) >= MAX_SESSIONS:
+            await ctx.send(f"You can have at most {MAX_SESSIONS} shells per channel.")
             return
-    
-        proc = await asyncio.create_subprocess_shell(
+
+        limits = await self.config.shell_limits()
+        kind = "pty" if mode.lower() == "pty" else "shell"
+        log = CommandLog(self.audit, kind, ctx.author, channel_id=ctx.channel.id, session=name)
+        if kind == "pty":
+            await self._run_pty_shell(ctx, name, log, limits)
+        else:
+            await self._run_pipe_shell(ctx, name, log, limits)
+
+    async def _run_pipe_shell(self, ctx, name: str, log: CommandLog, limits: dict):
+        """Run a pipe-mode shell until it exits."""
+        # bash leads its own process group so ending the session also ends its jobs
+        proc = await asyncio.create_subprocess_exec(
             "/bin/bash",
             stdin=asyncio.subprocess.PIPE,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
         )
-    
-        self.sessions[ctx.author.id] = proc
-        await ctx.send("Started interactive shell session. Type 'exit' to end the session.")
-    
+        session = ShellSession(name, "shell", proc, log)
+        if not await self._limit(ctx, session, proc.pid, limits):
+            await proc.wait()
+            log.close(proc.returncode)
+            return
+        self._attach(ctx, session)
+        await ctx.send(f"Started shell `{name}`. Type 'exit' to end the session.")
+
+        # Output is batched into large messages; a slow channel pauses the shell
+        pump = OutputPump(ctx.send, filename=f"{name}_output.txt", on_output=log.output)
+
         async def reader(stream, label: str):
             try:
-                while True:
-                    chunk = await stream.read(200)
-                    if not chunk:
-                        break
-                    text = chunk.decode(errors="replace")
-                    # Prefix stderr so you know which is which
-                    prefix = "" if label == "stdout" else "[stderr]\n"
-                    await ctx.send(f"```\n{prefix}{text}\n```")
+                await pump.pipe(stream, label)
             except asyncio.CancelledError:
                 pass
-            except Exception as e:
+            except Exception as e:  # pylint: disable=broad-exception-caught
                 await ctx.send(f"{label} reader error: {e}")
-    
+
         # Run both readers concurrently until the process exits
         stdout_task = asyncio.create_task(reader(proc.stdout, "stdout"))
         stderr_task = asyncio.create_task(reader(proc.stderr, "stderr"))
-    
-        try:
+
+        async def finished():
             await proc.wait()  # Wait until the shell ends
+            await asyncio.gather(stdout_task, stderr_task)
+
+        try:
+            await self._supervise(ctx, session, finished(), limits)
         finally:
             stdout_task.cancel()
             stderr_task.cancel()
-            if ctx.author.id in self.sessions:
-                del self.sessions[ctx.author.id]
-            await ctx.send("Shell session has ended.")
+            await pump.close()
+            self._detach(ctx, session)
+            log.close(proc.returncode)
+            await ctx.send(f"Shell `{name}` has ended.")
 
+    async def _run_pty_shell(self, ctx, name: str, log: CommandLog, limits: dict):
+        """Run a terminal session until the shell exits."""
+        shell = PtyShell(ctx.send, on_output=log.output, on_status=log.status)
+        await shell.start()
+        session = ShellSession(name, "pty", shell, log)
+        if not await self._limit(ctx, session, shell.proc.pid, limits):
+            await shell.wait()
+            log.close(shell.proc.returncode)
+            return
+        self._attach(ctx, session)
+        await ctx.send(
+            f"Started terminal `{name}`. Type 'exit' to end it, or `^C`, `^D`, `^Z` "
+            "to send control keys."
+        )
+        try:
+            await self._supervise(ctx, session, shell.wait(), limits)
+        finally:
+            shell.terminate()
+            self._detach(ctx, session)
+            log.close(shell.proc.returncode)
+            await ctx.send(f"Terminal `{name}` has ended.")
 
-    @commands.Cog.listener()
-    async def on_message(self, message):
-        """Handle incoming messages for active shell sessions."""
-        if message.author.id not in self.sessions:
+    async def _limit(self, ctx, session: ShellSession, pid: int, limits: dict) -> bool:
+        """Apply the shell limits, or stop the shell if they can't be applied."""
+        try:
+            apply_limits(pid, limits)
+        except OSError as e:
+            session.terminate()
+            print(f"[InteractiveShell] Failed to apply shell limits: {e}")
+            await ctx.send(
+                f"❌ Couldn't apply the shell limits ({e}), so `{session.name}` was stopped."
+            )
+            return False
+        return True
+
+    async def _supervise(self, ctx, session: ShellSession, finished, limits: dict):
+        """Wait for a session to finish, stopping it at its wall-clock limit."""
+        task = asyncio.ensure_future(finished)
+        timeout = limits.get("wall_minutes", 0) * 60 or None
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            await ctx.send(
+                f"⏱️ `{session.name}` reached its {limits['wall_minutes']} minute limit "
+                "and was stopped."
+            )
+            session.terminate()
+            await task
+        finally:
+            if not task.done():
+                task.cancel()
+
+    def _attach(self, ctx, session: ShellSession):
+        """Start routing the author's messages in this channel to `session`."""
+        key = (ctx.channel.id, ctx.author.id)
+        group = self.sessions.get(key)
+        if group is None:
+            group = self.sessions[key] = SessionGroup()
+
+            async def on_idle():
+                await ctx.send("Closing shell sessions after a period of inactivity.")
+                for shell in list(group.shells.values()):
+                    shell.terminate()
+
+            self.router.add(ctx.channel.id, ctx.author.id, self._shell_input, on_idle)
+        group.add(session)
+
+    def _detach(self, ctx, session: ShellSession):
+        key = (ctx.channel.id, ctx.author.id)
+        group = self.sessions.get(key)
+        if group is None or group.shells.get(session.name) is not session:
+            return
+        group.remove(session.name)
+        if not group.shells:
+            del self.sessions[key]
+            self.router.remove(key)
+
+    async def _shell_input(self, message):
+        """Send a routed message to the shell it's meant for."""
+        group = self.sessions.get((message.channel.id, message.author.id))
+        if group is None:
+            return
+        session, content = group.target(message.content)
+        if session is None:
+            return
+        session.log.command(content)
+        if content.strip().lower() == "exit":
+            session.terminate()
+            await message.channel.send(f"Ending shell `{session.name}`.")
             return
 
-        proc = self.sessions[message.author.id]
-        if message.content.strip().lower() == "exit":
-            proc.terminate()
-            await message.channel.send("Ending shell session.")
-            del self.sessions[message.author.id]
+        if isinstance(session.proc, PtyShell):
+            session.proc.send_input(content)
             return
 
-        proc.stdin.write(f"{message.content}\n".encode())
-        await proc.stdin.drain()
+        session.proc.stdin.write(f"{content}\n".encode())
+        await session.proc.stdin.drain()
 
     @commands.command()
     @commands.is_owner()
-    async def end_shell(self, ctx):
-        """End the interactive shell session."""
-        if ctx.author.id not in self.sessions:
-            await ctx.send("You do not have an active shell session.")
+    async def end_shell(self, ctx, name: str = None):
+        """End a shell session in this channel, by default the focused one."""
+        group = self.sessions.get((ctx.channel.id, ctx.author.id))
+        session = group.shells.get(name or group.focus) if group else None
+        if session is None:
+            await ctx.send("You do not have an active shell session with that name here.")
             return
 
-        proc = self.sessions[ctx.author.id]
-        proc.terminate()
-        await ctx.send("Ending shell session.")
-        del self.sessions[ctx.author.id]
+        session.terminate()
+        await ctx.send(f"Ending shell `{session.name}`.")
 
+    @commands.command()
+    @commands.is_owner()
+    async def shell_use(self, ctx, name: str):
+        """Send your plain messages in this channel to the shell called `name`."""
+        group = self.sessions.get((ctx.channel.id, ctx.author.id))
+        if group is None or name not in group.shells:
+            await ctx.send(f"You do not have a shell named `{name}` here.")
+            return
+        group.focus = name
+        await ctx.send(f"Messages now go to `{name}`.")
+
+    @commands.command()
+    @commands.is_owner()
+    async def shell_list(self, ctx):
+        """List your shell sessions in this channel."""
+        group = self.sessions.get((ctx.channel.id, ctx.author.id))
+        if group is None:
+            await ctx.send("You have no shell sessions in this channel.")
+            return
+        now = time.monotonic()
+        lines = [
+            f"{'▶' if name == group.focus else '•'} `{name}` ({session.kind}, "
+            f"{int(now - session.started) // 60} min, {session.log.commands} commands)"
+            for name, session in group.shells.items()
+        ]
+        await ctx.send("\n".join(lines))
 
-# Patch in SSH commands if available
-if HAS_PARAMIKO:
-    ssh_handler.add_ssh_commands(InteractiveShell)  # pylint: disable=import-outside-toplevel
+    @commands.command()
+    @commands.is_owner()
+    async def shell_limits(self, ctx, setting: str = None, value: int = None):
+        """Show or change the limits new shells run under. 0 turns a limit off.
+
+        Settings: `cpu_seconds` and `memory_mb` per process, `file_mb` for the
+        largest file written, `wall_minutes` per session and `nice`.
+        """
+        limits = await self.config.shell_limits()
+        if setting is None:
+            lines = [f"`{key}`: {limits.get(key, 0)}" for key in DEFAULT_LIMITS]
+            await ctx.send("Limits for new shells:\n" + "\n".join(lines))
+            return
+        if setting not in DEFAULT_LIMITS or value is None or value < 0:
+            await ctx.send(f"❌ Usage: `shell_limits <{'|'.join(DEFAULT_LIMITS)}> <value>`")
+            return
+        if setting == "nice":
+            value = min(value, 19)
+        async with self.config.shell_limits() as stored:
+            stored[setting] = value
+        await ctx.send(f"✅ `{setting}` set to {value} for new shells.")
 
 
 def setup(bot):
@@ -0,0 +1,123 @@
+"""Coalesces shell output into as few Discord messages as possible."""
+
+import asyncio
+import codecs
+import io
+from typing import Awaitable, Callable, Optional
+
+import discord
+
+DISCORD_CHAR_LIMIT = 2000
+FENCE = "```\n{}\n```"
+MESSAGE_BUDGET = DISCORD_CHAR_LIMIT - len(FENCE.format(""))
+COALESCE_WINDOW = 0.5        # seconds to gather more output before sending
+ATTACHMENT_THRESHOLD = 6000  # pending characters that go out as a file instead
+HIGH_WATER = 256 * 1024      # pending characters before readers are paused
+READ_SIZE = 4096
+
+
+class OutputPump:  # pylint: disable=too-many-instance-attributes
+    """Buffers output from one or more streams and sends it in large batches.
+
+    Output is held for `COALESCE_WINDOW` so bursts become a single message close
+    to the 2000 character limit. Anything larger than `ATTACHMENT_THRESHOLD` is
+    sent as a text file. When Discord can't keep up the buffer reaches
+    `HIGH_WATER` and `write` blocks, so the readers stop draining the pipe and
+    the process itself stalls on its next write instead of the bot buffering
+    without limit.
+    """
+
+    def __init__(
+        self, send: Callable[..., Awaitable], filename: str = "output.txt",
+        on_output: Optional[Callable[[int], None]] = None
+    ):
+        self.send = send
+        self.filename = filename
+        self.on_output = on_output  # told the size of every raw chunk written
+        self.messages = 0
+        self._pending: list[str] = []
+        self._size = 0
+        self._label = "stdout"
+        self._decoders: dict[str, codecs.IncrementalDecoder] = {}
+        self._changed = asyncio.Condition()
+        self._closed = False
+        self._task = asyncio.create_task(self._run())
+
+    async def write(self, data: bytes, label: str = "stdout"):
+        """Queue raw output from the stream named `label`, waiting while the buffer is full."""
+        if self.on_output is not None:
+            self.on_output(len(data))
+        if label not in self._decoders:
+            self._decoders[label] = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        text = self._decoders[label].decode(data)
+        if not text:
+            return
+        if label != self._label:
+            # Mark where output switches between stdout and stderr
+            self._label = label
+            text = f"[{label}]\n{text}"
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._size < HIGH_WATER or self._closed)
+            self._pending.append(text)
+            self._size += len(text)
+            self._changed.notify_all()
+
+    async def pipe(self, stream: asyncio.StreamReader, label: str = "stdout"):
+        """Copy `stream` into the pump until it ends."""
+        while chunk := await stream.read(READ_SIZE):
+            await self.write(chunk, label)
+
+    async def close(self):
+        """Send whatever is still buffered and stop."""
+        async with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        await self._task
+
+    async def _run(self):
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+            if not self._closed:
+                await asyncio.sleep(COALESCE_WINDOW)
+            async with self._changed:
+                text = "".join(self._pending)
+                self._pending.clear()
+            try:
+                await self._flush(text)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # Keep draining, or writers would wait at HIGH_WATER forever
+                print(f"[InteractiveShell] Failed to send output: {e}")
+            finally:
+                async with self._changed:
+                    self._size -= len(text)
+                    self._changed.notify_all()
+
+    async def _flush(self, text: str):
+        if len(text) > ATTACHMENT_THRESHOLD:
+            self.messages += 1
+            await self.send(
+                file=discord.File(io.BytesIO(text.encode()), filename=self.filename)
+            )
+            return
+        for chunk in split_message(text):
+            self.messages += 1
+            await self.send(FENCE.format(chunk))
+
+
+def split_message(text: str, limit: int = MESSAGE_BUDGET) -> list[str]:
+    """Split `text` into code-block-safe pieces of at most `limit` characters, at newlines."""
+    text = text.replace("```", "`\u200b``")
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        # Drop only the newline the split happened at; blank lines are output too
+        text = text[cut + 1:] if text[cut] == "\n" else text[cut:]
+    if text.strip():
+        chunks.append(text)
+    return chunks
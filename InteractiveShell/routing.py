@@ -0,0 +1,92 @@
+"""Routes chat messages to the shell sessions that are waiting for them."""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+
+import discord
+from redbot.core.bot import Red
+
+IDLE_TIMEOUT = 30 * 60.0  # seconds without input before a session is closed
+REAP_INTERVAL = 60.0
+
+Key = tuple[int, int]  # (channel id, author id)
+
+
+class Route:  # pylint: disable=too-few-public-methods
+    """One session's message handler and what to do when it goes idle."""
+
+    __slots__ = ("handler", "on_idle", "last_input")
+
+    def __init__(
+        self, handler: Callable[[discord.Message], Awaitable],
+        on_idle: Callable[[], Awaitable]
+    ):
+        self.handler = handler
+        self.on_idle = on_idle
+        self.last_input = time.monotonic()
+
+
+class SessionRouter:
+    """Delivers messages to sessions by (channel, author).
+
+    The `on_message` listener is only registered while at least one session is
+    open, so a bot with no sessions pays nothing per message, and with sessions
+    open every other message costs one dict lookup. Sessions that get no input
+    for `IDLE_TIMEOUT` are closed through their `on_idle` callback.
+    """
+
+    def __init__(self, bot: Red, idle_timeout: float = IDLE_TIMEOUT):
+        self.bot = bot
+        self.idle_timeout = idle_timeout
+        self.routes: dict[Key, Route] = {}
+        self._reaper: Optional[asyncio.Task] = None
+
+    def add(
+        self, channel_id: int, author_id: int,
+        handler: Callable[[discord.Message], Awaitable], on_idle: Callable[[], Awaitable]
+    ) -> Optional[Key]:
+        """Route the author's messages in the channel to `handler`. None if already taken."""
+        key = (channel_id, author_id)
+        if key in self.routes:
+            return None
+        if not self.routes:
+            self.bot.add_listener(self._dispatch, "on_message")
+            self._reaper = asyncio.create_task(self._reap_loop())
+        self.routes[key] = Route(handler, on_idle)
+        return key
+
+    def remove(self, key: Key):
+        """Stop routing messages for `key`."""
+        if self.routes.pop(key, None) is not None and not self.routes:
+            self._stop()
+
+    def _stop(self):
+        self.bot.remove_listener(self._dispatch, "on_message")
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+
+    def close(self):
+        """Drop every route and unregister the listener. Sessions are closed by their owners."""
+        if self.routes:
+            self.routes.clear()
+            self._stop()
+
+    async def _dispatch(self, message: discord.Message):
+        route = self.routes.get((message.channel.id, message.author.id))
+        if route is None:
+            return
+        route.last_input = time.monotonic()
+        await route.handler(message)
+
+    async def _reap_loop(self):
+        while True:
+            await asyncio.sleep(REAP_INTERVAL)
+            cutoff = time.monotonic() - self.idle_timeout
+            for route in [r for r in self.routes.values() if r.last_input < cutoff]:
+                route.last_input = time.monotonic()  # don't retry before the next timeout
+                try:
+                    await route.on_idle()
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    print(f"[InteractiveShell] Failed to close idle session: {e}")
@@ -0,0 +1,110 @@
+"""Named shell sessions and the resource limits they run under."""
+
+import os
+import resource
+import signal
+import time
+from typing import Optional
+
+from .audit import CommandLog
+from .terminal import PtyShell
+
+DEFAULT_NAME = "shell"
+MAX_SESSIONS = 5  # per user per channel
+
+# 0 disables a limit. Memory, CPU and file size are per process, so one
+# runaway command is stopped without touching the rest of the session.
+DEFAULT_LIMITS = {
+    "cpu_seconds": 600,    # CPU time for any single process
+    "memory_mb": 2048,     # address space for any single process
+    "file_mb": 1024,       # largest file a process may write
+    "wall_minutes": 240,   # how long a whole session may run
+    "nice": 10,            # scheduling priority below the bot's
+}
+
+
+class ShellSession:  # pylint: disable=too-few-public-methods
+    """One named shell: a pipe-mode asyncio.subprocess.Process or a PtyShell."""
+
+    __slots__ = ("name", "kind", "proc", "log", "started")
+
+    def __init__(self, name: str, kind: str, proc, log: CommandLog):
+        self.name = name
+        self.kind = kind
+        self.proc = proc
+        self.log = log
+        self.started = time.monotonic()
+
+    def terminate(self):
+        """End the shell along with anything still running in it."""
+        if isinstance(self.proc, PtyShell):
+            self.proc.terminate()
+            return
+        try:
+            os.killpg(self.proc.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+class SessionGroup:
+    """A user's shells in one channel, and which one receives plain messages.
+
+    Messages go to the focused shell, which is the one started or selected most
+    recently. A message starting with `@name ` goes to that shell instead.
+    """
+
+    def __init__(self):
+        self.shells: dict[str, ShellSession] = {}
+        self.focus: Optional[str] = None
+
+    def add(self, session: ShellSession):
+        """Add a shell and focus it."""
+        self.shells[session.name] = session
+        self.focus = session.name
+
+    def remove(self, name: str):
+        """Forget a shell, moving focus to the newest remaining one."""
+        self.shells.pop(name, None)
+        if self.focus == name:
+            self.focus = next(reversed(self.shells), None)
+
+    def target(self, content: str) -> tuple[Optional[ShellSession], str]:
+        """The shell a message is meant for, and the input with any `@name` removed."""
+        if content.startswith("@"):
+            name, _, rest = content[1:].partition(" ")
+            if name in self.shells:
+                return self.shells[name], rest
+        return self.shells.get(self.focus), content
+
+
+def apply_limits(pid: int, limits: dict):
+    """Apply `limits` to a freshly started shell, before it is sent any input.
+
+    Limits are set from the bot after spawning rather than in a `preexec_fn`,
+    which can deadlock the child when the bot has other threads running.
+    Everything the shell starts afterwards inherits them. Raises OSError if a
+    limit can't be set, e.g. when the bot isn't allowed to.
+    """
+    megabyte = 1024 * 1024
+    try:
+        if limits.get("nice"):
+            current = os.getpriority(os.PRIO_PROCESS, 0)
+            os.setpriority(os.PRIO_PROCESS, pid, min(19, current + limits["nice"]))
+        if limits.get("cpu_seconds"):
+            # SIGXCPU at the soft limit, SIGKILL a few seconds later if ignored
+            cpu = limits["cpu_seconds"]
+            resource.prlimit(pid, resource.RLIMIT_CPU, (cpu, cpu + 5))
+        if limits.get("memory_mb"):
+            memory = limits["memory_mb"] * megabyte
+            resource.prlimit(pid, resource.RLIMIT_AS, (memory, memory))
+        if limits.get("file_mb"):
+            size = limits["file_mb"] * megabyte
+            resource.prlimit(pid, resource.RLIMIT_FSIZE, (size, size))
+    except ProcessLookupError:
+        return  # already exited
+    # If the host runs out of memory anyway, the shell goes before the bot
+    try:
+        with open(f"/proc/{pid}/oom_score_adj", "w", encoding="ascii") as f:
+            f.write("1000")
+    except OSError:
+        pass
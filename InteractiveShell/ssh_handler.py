@@ -1,16 +1,292 @@
 """Optional SSH session support for the InteractiveShell cog."""
 
 import asyncio
+import hashlib
+import hmac
 import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Callable, Optional
+
+import aiohttp
 import discord
 import paramiko
+from redbot.core import Config, commands
+from redbot.core.bot import Red
+
+from .audit import AuditLog, CommandLog
+from .fanout import DEFAULT_PARALLEL, fan_out, format_summary, parse_target
+from .output import OutputPump
+from .routing import SessionRouter
+from .transfer import DM_FILESIZE_LIMIT, MAX_PUT_BYTES, TransferError, sftp_get, sftp_put
+
+SSH_WORKERS = 16        # short calls: connects, sends, closes
+BULK_WORKERS = 16       # long calls: one-off commands and SFTP transfers
+CONNECT_TIMEOUT = 15.0
+RECV_SIZE = 32768
+KEEPALIVE_INTERVAL = 15    # seconds between keepalive packets on pooled transports
+IDLE_TIMEOUT = 300.0       # seconds an unused connection stays open
+REAP_INTERVAL = 30.0
+EXEC_TIMEOUT = 300.0       # seconds a one-off command may go without output
+EXEC_OUTPUT_CAP = 65536    # bytes of one-off command output kept
+
+# paramiko is blocking, so all of its I/O runs on threads instead of the event loop.
+# Calls that can take minutes get their own pool so they never hold up a connect,
+# and each interactive session reads its output on a dedicated thread.
+_executor = ThreadPoolExecutor(max_workers=SSH_WORKERS, thread_name_prefix="ssh")
+_bulk_executor = ThreadPoolExecutor(max_workers=BULK_WORKERS, thread_name_prefix="ssh-bulk")
+
+
+async def _run(func, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(
+        _executor, partial(func, *args, **kwargs)
+    )
+
+
+class _Connection:  # pylint: disable=too-few-public-methods
+    """An authenticated client in the pool and how many channels are using it."""
+
+    __slots__ = ("client", "secret", "users", "last_used")
+
+    def __init__(self, client: paramiko.SSHClient, secret: bytes):
+        self.client = client
+        self.secret = secret
+        self.users = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def alive(self) -> bool:
+        """Whether the transport is still up. Keepalives make dead peers show up here."""
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+
+class SSHPool:
+    """Authenticated SSH connections shared by (host, port, user).
+
+    Sessions and commands open new channels on an existing transport instead of
+    repeating the TCP and key exchange handshake. A connection is only reused
+    for the password it was opened with. Connections with no open channels are
+    closed after `IDLE_TIMEOUT`, and ones whose peer stopped answering
+    keepalives are dropped.
+    """
+
+    def __init__(self):
+        self.connects = 0
+        self.reuses = 0
+        self._connections: dict[tuple[str, int, str], _Connection] = {}
+        self._locks: dict[tuple[str, int, str], asyncio.Lock] = {}
+        self._reaper: Optional[asyncio.Task] = None
+
+    async def acquire(
+        self, host: str, username: str, password: Optional[str], port: int = 22
+    ) -> paramiko.SSHClient:
+        """A connected client for the given login. Pair every call with `release`.
+
+        Without a password the bot's SSH keys and agent are used.
+        """
+        key = (host, port, username)
+        secret = hashlib.sha256(password.encode()).digest() if password is not None else b""
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            conn = self._connections.get(key)
+            if conn is not None and conn.alive and hmac.compare_digest(conn.secret, secret):
+                self.reuses += 1
+            else:
+                client = await _open_client(host, port, username, password)
+                self.connects += 1
+                if conn is not None and conn.users == 0:
+                    await _run(conn.client.close)
+                conn = self._connections[key] = _Connection(client, secret)
+            conn.users += 1
+            conn.last_used = time.monotonic()
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_loop())
+        return conn.client
+
+    async def release(self, client: paramiko.SSHClient):
+        """Hand a client back. It stays open for reuse until it goes idle."""
+        for key, conn in list(self._connections.items()):
+            if conn.client is client:
+                conn.users -= 1
+                conn.last_used = time.monotonic()
+                if not conn.alive:
+                    del self._connections[key]
+                    await _run(client.close)
+                return
+        # Replaced by a connection with a different password while in use
+        await _run(client.close)
+
+    @asynccontextmanager
+    async def connection(
+        self, host: str, username: str, password: Optional[str], port: int = 22
+    ):
+        """`acquire` and `release` around a block."""
+        client = await self.acquire(host, username, password, port)
+        try:
+            yield client
+        finally:
+            await self.release(client)
+
+    async def run_command(  # pylint: disable=too-many-arguments
+        self, host: str, username: str, password: Optional[str], port: int, command: str
+    ) -> tuple[int, str]:
+        """Run one command on a new channel of a pooled connection. Returns (status, output)."""
+        async with self.connection(host, username, password, port) as client:
+            return await asyncio.get_running_loop().run_in_executor(
+                _bulk_executor, _exec_command, client, command
+            )
+
+    def stats(self) -> dict:
+        """Pool counters for status output."""
+        return {
+            "open": len(self._connections),
+            "in_use": sum(1 for conn in self._connections.values() if conn.users),
+            "connects": self.connects,
+            "reuses": self.reuses,
+        }
+
+    async def reap(self):
+        """Close connections that are idle or whose transport died."""
+        now = time.monotonic()
+        for key, conn in list(self._connections.items()):
+            idle = conn.users == 0 and now - conn.last_used > IDLE_TIMEOUT
+            if idle or not conn.alive:
+                del self._connections[key]
+                await _run(conn.client.close)
+
+    async def _reap_loop(self):
+        while self._connections:
+            await asyncio.sleep(REAP_INTERVAL)
+            await self.reap()
+
+    async def close(self):
+        """Close every pooled connection."""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+        connections = list(self._connections.values())
+        self._connections.clear()
+        for conn in connections:
+            await _run(conn.client.close)
+
+
+def _exec_command(client: paramiko.SSHClient, command: str) -> tuple[int, str]:
+    """Blocking part of `SSHPool.run_command`, run on the bulk thread pool."""
+    channel = client.get_transport().open_session(timeout=CONNECT_TIMEOUT)
+    try:
+        channel.set_combine_stderr(True)
+        channel.settimeout(EXEC_TIMEOUT)
+        channel.exec_command(command)
+        output = bytearray()
+        while data := channel.recv(RECV_SIZE):
+            # Keep draining past the cap so the command can finish and report its status
+            if len(output) < EXEC_OUTPUT_CAP:
+                output += data[:EXEC_OUTPUT_CAP - len(output)]
+        return channel.recv_exit_status(), output.decode(errors="replace")
+    finally:
+        channel.close()
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+async def _open_client(
+    host: str, port: int, username: str, password: Optional[str]
+) -> paramiko.SSHClient:
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    try:
+        await _run(
+            client.connect, host, port,
+            username=username, password=password,
+            timeout=CONNECT_TIMEOUT, banner_timeout=CONNECT_TIMEOUT, auth_timeout=CONNECT_TIMEOUT,
+        )
+    except BaseException:
+        await _run(client.close)
+        raise
+    client.get_transport().set_keepalive(KEEPALIVE_INTERVAL)
+    return client
+
+
+class SSHSession:  # pylint: disable=too-many-instance-attributes
+    """An interactive shell channel on a pooled SSH connection.
+
+    Commands are typed into the same remote shell, so `cd`, variables and
+    background jobs carry over between messages. Output is read by a thread of
+    the session's own and streamed into an OutputPump as it arrives. While the pump is
+    full the reader blocks, so the SSH window closes and the remote side pauses.
+    """
+
+    def __init__(self, pool: SSHPool, host: str, username: str, password: str, port: int = 22):
+        self.pool = pool
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.client: Optional[paramiko.SSHClient] = None
+        self.channel: Optional[paramiko.Channel] = None
+        self._reader: Optional[asyncio.Future] = None
+
+    async def connect(self):
+        """Get an authenticated connection from the pool, connecting if there isn't one."""
+        self.client = await self.pool.acquire(self.host, self.username, self.password, self.port)
 
-DISCORD_CHAR_LIMIT = 2000
+    async def start_shell(self, pump: OutputPump):
+        """Open the interactive shell and start streaming its output into `pump`."""
+        self.channel = await _run(self.client.invoke_shell, term="dumb", width=200)
+        loop = asyncio.get_running_loop()
+        self._reader = loop.create_future()
+        threading.Thread(
+            target=self._read_output, args=(pump, loop, self._reader),
+            name=f"ssh-reader-{self.host}", daemon=True,
+        ).start()
 
+    def _read_output(self, pump: OutputPump, loop: asyncio.AbstractEventLoop, done: asyncio.Future):
+        """Copy channel output into the pump. Runs on its own thread until the channel closes."""
+        try:
+            while data := self.channel.recv(RECV_SIZE):
+                asyncio.run_coroutine_threadsafe(pump.write(data), loop).result()
+        finally:
+            loop.call_soon_threadsafe(_resolve, done)
 
-def add_ssh_commands(cls):
-    """Dynamically attach SSH command methods to the given cog class."""
+    async def send(self, line: str):
+        """Type a line into the remote shell."""
+        await _run(self.channel.sendall, f"{line}\n".encode())
 
+    async def wait_closed(self):
+        """Wait until the remote shell exits or the connection drops."""
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+    async def close(self):
+        """Close the channel and return the connection to the pool."""
+        if self.channel is not None:
+            await _run(self.channel.close)
+        await self.wait_closed()
+        if self.client is not None:
+            client, self.client = self.client, None
+            await self.pool.release(client)
+
+
+class SSHCommands:
+    """SSH commands mixed into the InteractiveShell cog when paramiko is installed."""
+
+    # Provided by the cog
+    bot: Red
+    ssh_clients: dict[int, SSHSession]
+    ssh_pool: SSHPool
+    config: Config
+    audit: AuditLog
+    router: SessionRouter
+    log_attempt: Callable
+
+    @commands.command()
+    @commands.is_owner()
     async def start_ssh(self, ctx, ip: str, username: str, password: str):
         """Start an SSH session."""
         self.log_attempt(ctx.author, "SSH")
@@ -18,77 +294,262 @@ def add_ssh_commands(cls):
         if ctx.author.id in self.ssh_clients:
             await ctx.send("You already have an active SSH session.")
             return
+        if (ctx.channel.id, ctx.author.id) in self.router.routes:
+            await ctx.send("You already have a session running in this channel.")
+            return
 
-        client = await _connect_ssh(ctx, ip, username, password)
-        if client is None:
+        session = await _connect_ssh(ctx, self.ssh_pool, ip, username, password)
+        if session is None:
             return
 
-        self.ssh_clients[ctx.author.id] = client
+        self.ssh_clients[ctx.author.id] = session
         await ctx.send(
             f"Connected to {ip} as {username}. "
             "Type 'exit' or use '[p]end_ssh' to end the session."
         )
 
-        await self.handle_ssh_session(ctx, client)
+        await self.handle_ssh_session(ctx, session)
 
+    @commands.command()
+    @commands.is_owner()
     async def end_ssh(self, ctx):
         """End the interactive SSH session."""
         if ctx.author.id not in self.ssh_clients:
             await ctx.send("You do not have an active SSH session.")
             return
 
-        client = self.ssh_clients[ctx.author.id]
-        client.close()
+        session = self.ssh_clients.pop(ctx.author.id)
         await ctx.send("Ending SSH session.")
-        del self.ssh_clients[ctx.author.id]
+        await session.close()
+
+    @commands.group()
+    @commands.is_owner()
+    async def ssh_group(self, ctx):
+        """Manage named groups of hosts for `[p]ssh_run`."""
+
+    @ssh_group.command(name="add")
+    async def ssh_group_add(self, ctx, name: str, *targets: str):
+        """Add `user@host[:port]` targets to a group, creating it if needed."""
+        if not targets:
+            await ctx.send("❌ Give at least one `user@host[:port]` target.")
+            return
+        try:
+            for target in targets:
+                parse_target(target)
+        except ValueError:
+            await ctx.send("❌ Targets look like `user@host` or `user@host:port`.")
+            return
+        async with self.config.ssh_groups() as groups:
+            hosts = groups.setdefault(name, [])
+            hosts.extend(t for t in targets if t not in hosts)
+            count = len(hosts)
+        await ctx.send(f"✅ Group `{name}` has {count} host(s).")
 
-    async def handle_ssh_session(self, ctx, client):
-        """Handle interactive SSH command input from a user."""
-        def check(m):
-            return m.author == ctx.author and m.channel == ctx.channel
+    @ssh_group.command(name="remove")
+    async def ssh_group_remove(self, ctx, name: str, *targets: str):
+        """Remove targets from a group, or the whole group if none are given."""
+        async with self.config.ssh_groups() as groups:
+            if name not in groups:
+                await ctx.send(f"❌ No group named `{name}`.")
+                return
+            if targets:
+                groups[name] = [t for t in groups[name] if t not in targets]
+            if not targets or not groups[name]:
+                del groups[name]
+        await ctx.send(f"✅ Updated group `{name}`.")
+
+    @ssh_group.command(name="list")
+    async def ssh_group_list(self, ctx):
+        """Show the configured host groups."""
+        groups = await self.config.ssh_groups()
+        if not groups:
+            await ctx.send("No host groups configured.")
+            return
+        lines = [f"**{name}** ({len(hosts)}): {', '.join(hosts)}" for name, hosts in groups.items()]
+        await ctx.send("\n".join(lines)[:2000])
+
+    @commands.command()
+    @commands.is_owner()
+    async def ssh_run(self, ctx, group: str, *, command: str):
+        """Run a command on every host in a group, several hosts at a time.
+
+        Hosts are reached with the bot's SSH keys. Results are posted as each
+        host finishes, followed by a file with every host's output.
+        """
+        targets = (await self.config.ssh_groups()).get(group)
+        if not targets:
+            await ctx.send(f"❌ No group named `{group}`.")
+            return
+        self.log_attempt(ctx.author, f"SSH fan-out ({group}: {command})")
+
+        async def runner(target: str, cmd: str):
+            user, host, port = parse_target(target)
+            return await self.ssh_pool.run_command(host, user, None, port, cmd)
+
+        await ctx.send(f"Running on {len(targets)} host(s) in `{group}`...")
+        pump = OutputPump(ctx.send, filename="ssh_run_progress.txt")
+        results = []
+        try:
+            async for result in fan_out(targets, command, runner, DEFAULT_PARALLEL):
+                results.append(result)
+                self.audit.record(
+                    "command", ctx.author, kind="ssh_run", group=group, host=result.target,
+                    command=command, status=result.status, error=result.error,
+                    duration=round(result.duration, 3), output_bytes=len(result.output.encode()),
+                )
+                await pump.write(f"{result.line()}\n".encode())
+        finally:
+            await pump.close()
+        summary = format_summary(command, results)
+        failed = sum(1 for result in results if not result.ok)
+        await ctx.send(
+            f"Finished: {len(results) - failed} succeeded, {failed} failed.",
+            file=discord.File(io.BytesIO(summary.encode()), filename=f"ssh_run_{group}.txt"),
+        )
 
-        while True:
-            try:
-                message = await self.bot.wait_for("message", check=check)
+    @asynccontextmanager
+    async def _transfer_client(self, ctx, target: Optional[str]):
+        """The client for a transfer: `target` via the pool, or the user's open session."""
+        if target is None:
+            session = self.ssh_clients.get(ctx.author.id)
+            if session is None or session.client is None:
+                raise TransferError("Start a session with `[p]start_ssh` or name a `user@host`.")
+            yield session.client
+            return
+        user, host, port = parse_target(target)
+        async with self.ssh_pool.connection(host, user, None, port) as client:
+            yield client
+
+    @commands.command()
+    @commands.is_owner()
+    async def ssh_get(self, ctx, remote_path: str, target: Optional[str] = None):
+        """Download a file from the SSH host as an attachment.
+
+        Uses your open SSH session, or `user@host[:port]` with the bot's keys.
+        """
+        limit = ctx.guild.filesize_limit if ctx.guild else DM_FILESIZE_LIMIT
+        try:
+            async with ctx.typing(), self._transfer_client(ctx, target) as client:
+                spool, transfer = await sftp_get(_bulk_executor, client, remote_path, limit)
+            self.audit.record(
+                "transfer", ctx.author, direction="get", host=target, path=remote_path,
+                bytes=transfer.size, duration=round(transfer.seconds, 3),
+            )
+            with spool:
+                await ctx.send(
+                    f"✅ Downloaded {transfer.describe()}",
+                    file=discord.File(spool, filename=transfer.name),
+                )
+        except TransferError as e:
+            await ctx.send(f"❌ {e}")
+        except (paramiko.SSHException, OSError, ValueError) as e:
+            await ctx.send(f"❌ Transfer failed: {e}")
+
+    @commands.command()
+    @commands.is_owner()
+    async def ssh_put(self, ctx, remote_path: str, target: Optional[str] = None):
+        """Upload the attached file to the SSH host.
+
+        A `remote_path` ending in `/` keeps the attachment's name. Uses your
+        open SSH session, or `user@host[:port]` with the bot's keys.
+        """
+        if not ctx.message.attachments:
+            await ctx.send("❌ Attach the file to upload.")
+            return
+        attachment = ctx.message.attachments[0]
+        if attachment.size > MAX_PUT_BYTES:
+            await ctx.send(f"❌ Uploads are limited to {MAX_PUT_BYTES // 1_000_000} MB.")
+            return
+        if remote_path.endswith("/"):
+            remote_path += attachment.filename
+        try:
+            async with ctx.typing(), self._transfer_client(ctx, target) as client:
+                async with aiohttp.ClientSession() as http:
+                    transfer = await sftp_put(
+                        _bulk_executor, client, http, attachment.url, remote_path
+                    )
+            self.audit.record(
+                "transfer", ctx.author, direction="put", host=target, path=remote_path,
+                bytes=transfer.size, duration=round(transfer.seconds, 3),
+            )
+            await ctx.send(f"✅ Uploaded {transfer.describe()}")
+        except TransferError as e:
+            await ctx.send(f"❌ {e}")
+        except (paramiko.SSHException, aiohttp.ClientError, OSError, ValueError) as e:
+            await ctx.send(f"❌ Transfer failed: {e}")
+
+    async def handle_ssh_session(self, ctx, session: SSHSession):
+        """Relay the user's messages into the remote shell until it closes."""
+        log = CommandLog(
+            self.audit, "ssh", ctx.author, host=f"{session.username}@{session.host}",
+            channel_id=ctx.channel.id,
+        )
+        pump = OutputPump(ctx.send, filename="ssh_output.txt", on_output=log.output)
+        try:
+            await session.start_shell(pump)
+        except paramiko.SSHException as e:
+            await ctx.send(f"SSH error: {e}")
+            self.ssh_clients.pop(ctx.author.id, None)
+            await session.close()
+            await pump.close()
+            log.close()
+            return
+
+        inbox: asyncio.Queue = asyncio.Queue()
+
+        async def on_idle():
+            await ctx.send("Closing SSH session after a period of inactivity.")
+            await session.close()
+
+        route = self.router.add(ctx.channel.id, ctx.author.id, inbox.put, on_idle)
+        if route is None:
+            # Another session is already reading this user's messages in this channel
+            await ctx.send(
+                "❌ You already have a session reading your messages in this channel. "
+                "End it first, or start the SSH session in another channel."
+            )
+            self.ssh_clients.pop(ctx.author.id, None)
+            await session.close()
+            await pump.close()
+            log.close()
+            return
+        closed = asyncio.ensure_future(session.wait_closed())
+        try:
+            while not closed.done():
+                waiter = asyncio.ensure_future(inbox.get())
+                await asyncio.wait({waiter, closed}, return_when=asyncio.FIRST_COMPLETED)
+                if not waiter.done():
+                    waiter.cancel()
+                    break
+                message = waiter.result()
+                if self.ssh_clients.get(ctx.author.id) is not session:
+                    break  # ended with [p]end_ssh
+                log.command(message.content)
                 if message.content.strip().lower() == "exit":
-                    client.close()
                     await ctx.send("Ending SSH session.")
-                    del self.ssh_clients[ctx.author.id]
                     break
+                await session.send(message.content)
+        except (paramiko.SSHException, OSError) as e:
+            await ctx.send(f"SSH command error: {e}")
+        except asyncio.CancelledError:
+            await ctx.send("SSH session was cancelled.")
+        finally:
+            self.router.remove(route)
+            if self.ssh_clients.get(ctx.author.id) is session:
+                del self.ssh_clients[ctx.author.id]
+            await session.close()
+            closed.cancel()
+            await pump.close()
+            log.close()
+            await ctx.send("SSH session has ended.")
+
 
-                _, stdout, stderr = client.exec_command(message.content)
-                output = stdout.read().decode() + stderr.read().decode()
-
-                if len(output) > DISCORD_CHAR_LIMIT:
-                    await _send_output_as_file(ctx, output)
-                else:
-                    await ctx.send(f"```\n{output}\n```")
-
-            except UnicodeDecodeError:
-                await ctx.send("Received output could not be decoded (non-UTF-8).")
-                continue
-            except paramiko.SSHException as e:
-                await ctx.send(f"SSH command error: {e}")
-                break
-            except asyncio.CancelledError:
-                await ctx.send("SSH session was cancelled.")
-                break
-            except Exception as e:  # pylint: disable=broad-exception-caught
-                await ctx.send(f"Unexpected error during session: {e}")
-                break
-
-    cls.start_ssh = start_ssh
-    cls.end_ssh = end_ssh
-    cls.handle_ssh_session = handle_ssh_session
-
-
-async def _connect_ssh(ctx, ip, username, password):
-    """Try to connect to an SSH server and return the client object if successful."""
+async def _connect_ssh(ctx, pool, ip, username, password) -> Optional[SSHSession]:
+    """Try to connect to an SSH server and return the session if successful."""
+    session = SSHSession(pool, ip, username, password)
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(ip, username=username, password=password)
-        return client
+        await session.connect()
+        return session
     except paramiko.AuthenticationException:
         await ctx.send("Authentication failed. Check your username and password.")
     except paramiko.SSHException as e:
@@ -97,11 +558,5 @@ async def _connect_ssh(ctx, ip, username, password):
         await ctx.send(f"Network or hostname error: {e}")
     except Exception as e:  # pylint: disable=broad-exception-caught
         await ctx.send(f"Unexpected error during connection: {e}")
+    await session.close()
     return None
-
-
-async def _send_output_as_file(ctx, output):
-    """Send long SSH output as a file attachment."""
-    buffer = io.BytesIO(output.encode())
-    buffer.seek(0)
-    await ctx.send(file=discord.File(fp=buffer, filename="ssh_output.txt"))
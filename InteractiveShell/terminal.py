@@ -0,0 +1,375 @@
+"""Pseudo-terminal shell sessions rendered into a single, periodically edited message."""
+
+import asyncio
+import codecs
+import fcntl
+import os
+import pty
+import signal
+import struct
+import termios
+from typing import Awaitable, Callable, Optional
+
+import discord
+
+from .output import DISCORD_CHAR_LIMIT, FENCE
+
+COLUMNS = 80
+ROWS = 24
+EDIT_INTERVAL = 1.5  # seconds between edits of the live message
+# Makes the shell report each command's exit status with an OSC sequence the screen hides
+STATUS_PROMPT_COMMAND = r"printf '\033]777;status;%d\007' $?"
+CONTROL_KEYS = {"^C": "\x03", "^D": "\x04", "^Z": "\x1a", "^L": "\x0c", "^[": "\x1b"}
+
+
+class Screen:  # pylint: disable=too-many-instance-attributes
+    """A small VT100-style screen buffer.
+
+    It understands the cursor movement, erase, scroll and alternate screen
+    sequences that shells, `top`, progress bars and REPLs rely on, and ignores
+    colours and anything else it doesn't know.
+    """
+
+    def __init__(self, columns: int = COLUMNS, rows: int = ROWS):
+        self.columns = columns
+        self.rows = rows
+        self.lines = [[" "] * columns for _ in range(rows)]
+        self.x = 0
+        self.y = 0
+        self.top = 0
+        self.bottom = rows - 1
+        self._saved = (0, 0)
+        self._state = "text"
+        self._params = ""
+        self._osc = ""
+        self.osc_handler: Optional[Callable[[str], None]] = None
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def render(self) -> str:
+        """The screen as text, without trailing blanks."""
+        text = "\n".join("".join(line).rstrip() for line in self.lines)
+        return text.rstrip("\n")
+
+    def feed(self, data: bytes):
+        """Apply raw terminal output to the screen."""
+        for char in self._decoder.decode(data):
+            state = self._state
+            if state == "text":
+                self._text(char)
+            elif state == "esc":
+                self._escape(char)
+            elif state == "csi":
+                if "\x40" <= char <= "\x7e":
+                    self._state = "text"
+                    self._csi(char, self._params)
+                else:
+                    self._params += char
+            elif state == "osc":
+                # Window titles etc. end with BEL or ESC \
+                if char in "\x07\x1b":
+                    self._state = "text" if char == "\x07" else "esc"
+                    if self.osc_handler is not None:
+                        self.osc_handler(self._osc)
+                elif len(self._osc) < 256:
+                    self._osc += char
+            else:  # "charset": ESC ( B and friends take one more character
+                self._state = "text"
+
+    def _text(self, char: str):
+        if char >= " " and char != "\x7f":
+            if self.x >= self.columns:
+                self.x = 0
+                self._linefeed()
+            self.lines[self.y][self.x] = char
+            self.x += 1
+        elif char == "\x1b":
+            self._state = "esc"
+        elif char == "\r":
+            self.x = 0
+        elif char in "\n\x0b\x0c":
+            self._linefeed()
+        elif char == "\b":
+            self.x = max(0, min(self.x, self.columns) - 1)
+        elif char == "\t":
+            self.x = min(self.columns - 1, (self.x // 8 + 1) * 8)
+
+    def _escape(self, char: str):
+        self._state = "text"
+        if char == "[":
+            self._state, self._params = "csi", ""
+        elif char == "]":
+            self._state, self._osc = "osc", ""
+        elif char in "()*+":
+            self._state = "charset"
+        elif char == "7":
+            self._saved = (self.x, self.y)
+        elif char == "8":
+            self.x, self.y = self._saved
+        elif char == "D":
+            self._linefeed()
+        elif char == "E":
+            self.x = 0
+            self._linefeed()
+        elif char == "M":
+            if self.y == self.top:
+                self._scroll(-1)
+            else:
+                self.y = max(0, self.y - 1)
+        elif char == "c":
+            self.lines = [self._blank() for _ in range(self.rows)]
+            self.x = self.y = self.top = 0
+            self.bottom = self.rows - 1
+
+    def _csi(self, final: str, params: str):  # pylint: disable=too-many-branches
+        private = params.startswith("?")
+        values = [int(p) if p.isdigit() else 0 for p in params.lstrip("?").split(";")]
+        first = values[0] or 1
+        if private:
+            if final in "hl" and values[0] in (47, 1047, 1049):
+                # Switching to or from the alternate screen starts from a blank one
+                self._erase_display(2)
+        elif final == "A":
+            self.y = max(self.top if self.y >= self.top else 0, self.y - first)
+        elif final in "Be":
+            self.y = min(self.bottom if self.y <= self.bottom else self.rows - 1, self.y + first)
+        elif final in "Ca":
+            self.x = min(self.columns - 1, self.x + first)
+        elif final == "D":
+            self.x = max(0, min(self.x, self.columns) - first)
+        elif final in "EF":
+            self.x = 0
+            self.y = max(0, min(self.rows - 1, self.y + (first if final == "E" else -first)))
+        elif final in "G`":
+            self.x = min(self.columns, first) - 1
+        elif final == "d":
+            self.y = min(self.rows, first) - 1
+        elif final in "Hf":
+            row = values[0] or 1
+            column = values[1] if len(values) > 1 and values[1] else 1
+            self.y, self.x = min(self.rows, row) - 1, min(self.columns, column) - 1
+        elif final == "J":
+            self._erase_display(values[0])
+        elif final == "K":
+            self._erase_line(values[0])
+        elif final in "LM":
+            self._insert_lines(first if final == "L" else -first)
+        elif final in "P@X":
+            self._edit_chars(final, first)
+        elif final in "ST":
+            self._scroll(first if final == "S" else -first)
+        elif final == "r":
+            top = values[0] or 1
+            bottom = values[1] if len(values) > 1 and values[1] else self.rows
+            if top < bottom <= self.rows:
+                self.top, self.bottom = top - 1, bottom - 1
+                self.x = self.y = 0
+
+    def _linefeed(self):
+        if self.y == self.bottom:
+            self._scroll(1)
+        elif self.y < self.rows - 1:
+            self.y += 1
+
+    def _blank(self) -> list[str]:
+        return [" "] * self.columns
+
+    def _scroll(self, count: int):
+        """Scroll the scroll region up by `count` lines, or down if negative."""
+        region = self.lines[self.top:self.bottom + 1]
+        count = max(-len(region), min(len(region), count))
+        if count > 0:
+            region = region[count:] + [self._blank() for _ in range(count)]
+        elif count < 0:
+            region = [self._blank() for _ in range(-count)] + region[:count]
+        self.lines[self.top:self.bottom + 1] = region
+
+    def _insert_lines(self, count: int):
+        if not self.top <= self.y <= self.bottom:
+            return
+        saved_top, self.top = self.top, self.y
+        self._scroll(-count)
+        self.top = saved_top
+
+    def _edit_chars(self, final: str, count: int):
+        line = self.lines[self.y]
+        x = min(self.x, self.columns - 1)
+        if final == "P":
+            del line[x:x + count]
+            line.extend(" " * (self.columns - len(line)))
+        elif final == "@":
+            line[x:x] = " " * count
+            del line[self.columns:]
+        else:
+            line[x:x + count] = " " * len(line[x:x + count])
+
+    def _erase_line(self, mode: int):
+        line = self.lines[self.y]
+        x = min(self.x, self.columns)
+        if mode == 0:
+            line[x:] = " " * (self.columns - x)
+        elif mode == 1:
+            line[:x + 1] = " " * min(self.columns, x + 1)
+        else:
+            self.lines[self.y] = self._blank()
+
+    def _erase_display(self, mode: int):
+        if mode == 0:
+            self._erase_line(0)
+            rows = range(self.y + 1, self.rows)
+        elif mode == 1:
+            self._erase_line(1)
+            rows = range(0, self.y)
+        else:
+            rows = range(self.rows)
+        for row in rows:
+            self.lines[row] = self._blank()
+
+
+class PtyShell:  # pylint: disable=too-many-instance-attributes
+    """A shell on a pseudo-terminal whose screen is mirrored into one Discord message.
+
+    Programs see a real 80x24 terminal, so they line-buffer, draw progress bars
+    and redraw full screens. However much they print, the bot makes at most
+    one edit per `EDIT_INTERVAL`.
+    """
+
+    def __init__(
+        self, send: Callable[..., Awaitable], command: str = "/bin/bash",
+        on_output: Optional[Callable[[int], None]] = None,
+        on_status: Optional[Callable[[int], None]] = None,
+    ):
+        self.send = send
+        self.command = command
+        self.on_output = on_output  # told the size of every chunk of terminal output
+        self.on_status = on_status  # told the exit status of each command bash runs
+        self.screen = Screen()
+        self.screen.osc_handler = self._on_osc
+        self.proc = None  # asyncio.subprocess.Process once started
+        self.edits = 0
+        self._master: Optional[int] = None
+        self._message: Optional[discord.Message] = None
+        self._changed = asyncio.Event()
+        self._repost = False
+        self._input = bytearray()  # typed input the terminal hasn't accepted yet
+        self._render_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Spawn the shell and start mirroring its screen."""
+        master, slave = pty.openpty()
+        fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack("HHHH", ROWS, COLUMNS, 0, 0))
+        env = {
+            **os.environ, "TERM": "vt100", "COLUMNS": str(COLUMNS), "LINES": str(ROWS),
+            "PROMPT_COMMAND": STATUS_PROMPT_COMMAND,
+        }
+        try:
+            self.proc = await asyncio.create_subprocess_exec(
+                self.command, "-i",
+                stdin=slave, stdout=slave, stderr=slave,
+                start_new_session=True, env=env,
+            )
+        except BaseException:
+            os.close(master)
+            raise
+        finally:
+            os.close(slave)
+        self._master = master
+        os.set_blocking(master, False)
+        asyncio.get_running_loop().add_reader(master, self._on_readable)
+        self._render_task = asyncio.create_task(self._render_loop())
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._master, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""  # EIO once the last process holding the terminal exits
+        if not data:
+            asyncio.get_running_loop().remove_reader(self._master)
+            return
+        if self.on_output is not None:
+            self.on_output(len(data))
+        self.screen.feed(data)
+        self._changed.set()
+
+    def _on_osc(self, payload: str):
+        kind, _, value = payload.partition(";status;")
+        if kind == "777" and value.isdigit() and self.on_status is not None:
+            self.on_status(int(value))
+
+    def send_input(self, content: str):
+        """Type a message into the terminal. `^C`, `^D`, `^Z`, `^L` and `^[` send control keys."""
+        key = CONTROL_KEYS.get(content.strip().upper())
+        data = key if key is not None else content + "\r"
+        # The next render starts a new message below the user's input
+        self._repost = True
+        pending = bool(self._input)
+        self._input += data.encode()
+        if not pending:
+            self._write_input()
+
+    def _write_input(self):
+        """Write queued input, waiting for the terminal to drain when its buffer is full."""
+        loop = asyncio.get_running_loop()
+        try:
+            written = os.write(self._master, self._input)
+        except BlockingIOError:
+            written = 0
+        except OSError:
+            self._input.clear()  # the terminal is gone
+            written = 0
+        del self._input[:written]
+        if self._input:
+            loop.add_writer(self._master, self._write_input)
+        else:
+            loop.remove_writer(self._master)
+
+    def terminate(self):
+        """Hang up the terminal, as closing a terminal window would."""
+        if self.proc is not None and self.proc.returncode is None:
+            try:
+                os.killpg(self.proc.pid, signal.SIGHUP)
+            except ProcessLookupError:
+                pass
+
+    async def wait(self):
+        """Wait for the shell to exit, then show its final screen."""
+        await self.proc.wait()
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(self._master)
+        loop.remove_writer(self._master)
+        # Pick up anything written just before exit
+        try:
+            while data := os.read(self._master, 65536):
+                self.screen.feed(data)
+        except OSError:
+            pass
+        os.close(self._master)
+        self._render_task.cancel()
+        await asyncio.gather(self._render_task, return_exceptions=True)
+        await self._render()
+
+    async def _render_loop(self):
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            try:
+                await self._render()
+            except discord.HTTPException as e:
+                print(f"[InteractiveShell] Failed to update terminal: {e}")
+            await asyncio.sleep(EDIT_INTERVAL)
+
+    async def _render(self):
+        lines = self.screen.render().replace("```", "`\u200b``").split("\n")
+        budget = DISCORD_CHAR_LIMIT - len(FENCE.format(""))
+        while len(lines) > 1 and len("\n".join(lines)) > budget:
+            lines.pop(0)
+        content = FENCE.format("\n".join(lines) or " ")
+        if self._message is None or self._repost:
+            self._repost = False
+            self._message = await self.send(content)
+        elif self._message.content != content:
+            self._message = await self._message.edit(content=content)
+        else:
+            return
+        self.edits += 1
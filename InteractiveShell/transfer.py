@@ -0,0 +1,146 @@
+"""Chunked SFTP transfers between SSH hosts and Discord attachments."""
+
+import asyncio
+import posixpath
+import tempfile
+import time
+from functools import partial
+from typing import BinaryIO, Optional
+
+import aiohttp
+import paramiko
+
+CHUNK_SIZE = 256 * 1024
+READ_WINDOW = 1024 * 1024   # bytes of SFTP reads in flight at once
+SPOOL_MEMORY = 1024 * 1024  # downloads larger than this spool to disk
+MAX_PUT_BYTES = 100_000_000  # decimal, like the MB shown to users
+DM_FILESIZE_LIMIT = 10 * 1024 * 1024
+
+
+class TransferError(Exception):
+    """A transfer was refused or failed, with a message fit for the user."""
+
+
+class Transfer:  # pylint: disable=too-few-public-methods
+    """Size and timing of a finished transfer."""
+
+    __slots__ = ("name", "size", "seconds")
+
+    def __init__(self, name: str, size: int, seconds: float):
+        self.name = name
+        self.size = size
+        self.seconds = seconds
+
+    def describe(self) -> str:
+        """e.g. "backup.tar (12.3 MB in 1.2s, 10.1 MB/s)"."""
+        megabytes = self.size / 1_000_000
+        rate = megabytes / self.seconds if self.seconds > 0 else 0.0
+        return f"{self.name} ({megabytes:.1f} MB in {self.seconds:.1f}s, {rate:.1f} MB/s)"
+
+
+async def _run(executor, func, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(func, *args))
+
+
+def _get(client: paramiko.SSHClient, path: str, spool: BinaryIO, limit: int) -> int:
+    """Copy a remote file into `spool` a chunk at a time. Blocking."""
+    with client.open_sftp() as sftp:
+        size = sftp.stat(path).st_size
+        if size > limit:
+            raise TransferError(
+                f"{path} is {size / 1_000_000:.1f} MB, over the "
+                f"{limit / 1_000_000:.0f} MB attachment limit here."
+            )
+        with sftp.open(path, "rb") as remote:
+            # Pipeline reads one window at a time: paramiko keeps every prefetched
+            # reply in memory until it is read, so prefetching the whole file would
+            # buffer all of it
+            copied = 0
+            while copied < size:
+                window = min(READ_WINDOW, size - copied)
+                chunk = b"".join(remote.readv([(copied, window)]))
+                if not chunk:
+                    break
+                copied += len(chunk)
+                spool.write(chunk)
+    spool.seek(0)
+    return copied
+
+
+async def sftp_get(executor, client: paramiko.SSHClient, path: str, limit: int):
+    """Download `path` into a spooled temporary file. Returns (file, Transfer).
+
+    Only `SPOOL_MEMORY` bytes are ever kept in memory; the rest goes to disk.
+    The caller closes the file.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY)  # pylint: disable=consider-using-with
+    start = time.monotonic()
+    try:
+        size = await _run(executor, _get, client, path, spool, limit)
+    except BaseException:
+        spool.close()
+        raise
+    return spool, Transfer(posixpath.basename(path) or "download", size, time.monotonic() - start)
+
+
+def _open_remote(client: paramiko.SSHClient, path: str):
+    sftp = client.open_sftp()
+    try:
+        remote = sftp.open(f"{path}.part", "wb")
+    except BaseException:
+        sftp.close()
+        raise
+    remote.set_pipelined(True)
+    return sftp, remote
+
+
+def _finish_remote(sftp: paramiko.SFTPClient, remote, path: str, ok: bool):
+    """Close the upload and move it into place, or delete it if it failed."""
+    try:
+        remote.close()
+        if ok:
+            try:
+                sftp.posix_rename(f"{path}.part", path)
+            except IOError:
+                # Servers without the posix-rename extension
+                sftp.rename(f"{path}.part", path)
+        else:
+            sftp.remove(f"{path}.part")
+    finally:
+        sftp.close()
+
+
+async def sftp_put(  # pylint: disable=too-many-arguments
+    executor, client: paramiko.SSHClient, session: aiohttp.ClientSession,
+    url: str, path: str, *, limit: Optional[int] = MAX_PUT_BYTES
+) -> Transfer:
+    """Stream the file at `url` into `path` on the host, one chunk at a time.
+
+    The upload is written to `path.part` and renamed when complete, so a
+    failed transfer never leaves a truncated file at `path`.
+    """
+    start = time.monotonic()
+    sftp, remote = await _run(executor, _open_remote, client, path)
+    copied = 0
+    ok = False
+    try:
+        async with session.get(url) as response:
+            if response.status != 200:
+                raise TransferError(f"Couldn't download the attachment (HTTP {response.status}).")
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                copied += len(chunk)
+                if limit is not None and copied > limit:
+                    raise TransferError(
+                        f"The attachment is over the {limit / 1_000_000:.0f} MB upload limit."
+                    )
+                await _run(executor, remote.write, chunk)
+        ok = True
+    finally:
+        try:
+            await _run(executor, _finish_remote, sftp, remote, path, ok)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            if ok:
+                raise TransferError(f"Couldn't finish writing `{path}`: {e}") from e
+            # Don't let a failed cleanup hide why the upload failed
+            print(f"[InteractiveShell] Failed to clean up {path}.part: {e}")
+    return Transfer(posixpath.basename(path), copied, time.monotonic() - start)
@@ -0,0 +1,7 @@
+"""Development tools for the ImageGen cog: a mock WebUI server and a load test harness.
+
+Neither is loaded by Red; they're run by hand or in CI::
+
+    python -m imagegen.devtools.mock_webui --port 7860 --latency 5
+    python -m imagegen.devtools.loadtest --jobs 20 --concurrency 5
+"""
@@ -0,0 +1,291 @@
+"""End-to-end load test for the ImageGen cog against the mock WebUI.
+
+Drives the real `draw` and `enhance` commands with fake Discord contexts,
+with a real ImageGenerator talking HTTP to a MockWebUI. It reports latency
+percentiles, throughput, memory growth and how many Discord edits each job
+cost. Needs no GPU and no Discord connection, so it can run in CI::
+
+    python -m imagegen.devtools.loadtest --jobs 20 --concurrency 5 --latency 1
+"""
+
+import argparse
+import asyncio
+import json
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import asynccontextmanager, redirect_stdout
+from io import BytesIO, StringIO
+from typing import Optional
+
+from PIL import Image
+
+from ..generator import ImageGenerator
+from ..imagegen import ImageGen
+from .mock_webui import MockWebUI
+
+
+class FakeMessage:  # pylint: disable=too-few-public-methods
+    """Records the edits a command makes to its reply."""
+
+    def __init__(self, content: str):
+        self.content = content
+        self.created = time.monotonic()
+        self.edits = 0
+        self.uploaded = 0
+        self.first_image: Optional[float] = None
+
+    async def edit(self, content=None, attachments=None, view=None):  # pylint: disable=unused-argument
+        """Stand-in for discord.Message.edit."""
+        self.edits += 1
+        if content is not None:
+            self.content = content
+        for attachment in attachments or ():
+            self.uploaded += len(attachment.fp.read())
+            if self.first_image is None:
+                self.first_image = time.monotonic()
+        return self
+
+
+class FakeAttachment:  # pylint: disable=too-few-public-methods
+    """An uploaded PNG for `enhance`."""
+
+    content_type = "image/png"
+
+    def __init__(self, data: bytes):
+        self._data = data
+
+    async def read(self) -> bytes:
+        """Stand-in for discord.Attachment.read."""
+        return self._data
+
+
+class FakeChannel:  # pylint: disable=too-few-public-methods
+    """A non-NSFW text channel."""
+
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+
+    def is_nsfw(self) -> bool:
+        """Stand-in for discord.TextChannel.is_nsfw."""
+        return False
+
+
+class FakeContext:  # pylint: disable=too-few-public-methods
+    """Just enough of commands.Context for `draw` and `enhance`."""
+
+    def __init__(self, channel_id: int, attachments=()):
+        self.guild = None
+        self.author = object()
+        self.channel = FakeChannel(channel_id)
+        self.message = type("Message", (), {"attachments": list(attachments)})()
+        self.replies: list[FakeMessage] = []
+
+    async def reply(self, content: str, mention_author: bool = True):  # pylint: disable=unused-argument
+        """Stand-in for Context.reply."""
+        message = FakeMessage(content)
+        self.replies.append(message)
+        return message
+
+    @asynccontextmanager
+    async def typing(self):
+        """Stand-in for Context.typing."""
+        yield
+
+
+class _Value:  # pylint: disable=too-few-public-methods
+    def __init__(self, value):
+        self._value = value
+
+    async def __call__(self):
+        return self._value
+
+
+class HarnessConfig:  # pylint: disable=too-few-public-methods
+    """The Config values the commands read, without Red's data manager."""
+
+    def __init__(self, api_url: str, loras: str = ""):
+        self.api_url = _Value(api_url)
+        self._loras = loras
+
+    def channel(self, _channel):
+        """Stand-in for Config.channel()."""
+        return type("Channel", (), {"loras": _Value(self._loras)})()
+
+    def guild(self, _guild):
+        """Stand-in for Config.guild()."""
+        return type("Guild", (), {"shortcuts": _Value({})})()
+
+
+def percentile(values: list[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of `values`."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def _rounded(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 3)
+
+
+def _rss_mb() -> float:
+    """Current resident set size in MB."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1_000_000
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1000
+
+
+def _sample_png(size: int = 512) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (size, size), (120, 160, 200)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def run(args) -> dict:  # pylint: disable=too-many-locals
+    """Run the load test and return the report."""
+    mock = MockWebUI(
+        latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+        image_scale=args.image_scale, tagger_latency=args.tagger_latency, seed=args.seed,
+    ).start()
+    cog = ImageGen.__new__(ImageGen)
+    cog.bot = None
+    cog.config = HarnessConfig(mock.url)
+    cog.image_generator = ImageGenerator()
+    cog.image_generator.set_url(mock.url)
+
+    sample = _sample_png()
+    slots = asyncio.Semaphore(args.concurrency)
+    jobs = []
+
+    async def job(index: int):
+        kind = args.mode if args.mode != "mixed" else ("enhance" if index % 2 else "draw")
+        async with slots:
+            if kind == "enhance":
+                ctx = FakeContext(index, [FakeAttachment(sample)])
+                command = ImageGen.enhance.callback(  # pylint: disable=no-member
+                    cog, ctx, text="0.4"
+                )
+            else:
+                ctx = FakeContext(index)
+                command = ImageGen.draw.callback(  # pylint: disable=no-member
+                    cog, ctx, text=f"test prompt {index}, steps=20"
+                )
+            start = time.monotonic()
+            try:
+                await asyncio.wait_for(command, args.job_timeout)
+                outcome = "ok"
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                outcome = f"error: {type(e).__name__}"
+            message = ctx.replies[-1] if ctx.replies else None
+            first_image = message.first_image if message else None
+            jobs.append({
+                "kind": kind,
+                "outcome": outcome,
+                "latency": time.monotonic() - start,
+                "first_image": first_image - start if first_image else None,
+                "edits": message.edits if message else 0,
+                "uploaded": message.uploaded if message else 0,
+            })
+
+    tracemalloc.start()
+    rss_before = _rss_mb()
+    started = time.monotonic()
+    # The commands print every prompt; keep the report readable
+    with redirect_stdout(StringIO()):
+        await asyncio.gather(*(job(i) for i in range(args.jobs)))
+    elapsed = time.monotonic() - started
+    heap_now, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    mock.stop()
+
+    done = [j for j in jobs if j["outcome"] == "ok"]
+    latencies = [j["latency"] for j in done]
+    first_images = [j["first_image"] for j in done if j["first_image"] is not None]
+    return {
+        "jobs": len(jobs),
+        "ok": len(done),
+        "timeouts": sum(1 for j in jobs if j["outcome"] == "timeout"),
+        "errors": sum(1 for j in jobs if j["outcome"].startswith("error")),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_jobs_per_min": round(len(done) / elapsed * 60, 2) if elapsed else 0.0,
+        "latency_s": {
+            "p50": _rounded(percentile(latencies, 0.50)),
+            "p99": _rounded(percentile(latencies, 0.99)),
+            "max": _rounded(max(latencies, default=None)),
+        },
+        "first_image_s": {"p50": _rounded(percentile(first_images, 0.50))},
+        "edits_per_job": {
+            "mean": round(sum(j["edits"] for j in jobs) / len(jobs), 2) if jobs else 0.0,
+            "max": max((j["edits"] for j in jobs), default=0),
+        },
+        "uploaded_mb_per_job": round(sum(j["uploaded"] for j in jobs) / len(jobs) / 1e6, 3)
+        if jobs else 0.0,
+        "memory": {
+            "rss_growth_mb": round(_rss_mb() - rss_before, 1),
+            "python_heap_mb": round(heap_now / 1e6, 1),
+            "python_heap_peak_mb": round(heap_peak / 1e6, 1),
+            "cached_images": len(cog.image_generator.images),
+        },
+        "mock": {"requests": dict(mock.requests), "failures_injected": mock.failures},
+    }
+
+
+def _print_report(report: dict):
+    latency = report["latency_s"]
+
+    def seconds(value):
+        return "-" if value is None else f"{value:.2f}s"
+
+    print(f"jobs        {report['ok']}/{report['jobs']} ok, {report['timeouts']} timed out, "
+          f"{report['errors']} errors in {report['elapsed_s']}s")
+    print(f"throughput  {report['throughput_jobs_per_min']} jobs/min")
+    print(f"latency     p50 {seconds(latency['p50'])}  p99 {seconds(latency['p99'])}  "
+          f"max {seconds(latency['max'])}  first image p50 "
+          f"{seconds(report['first_image_s']['p50'])}")
+    print(f"discord     {report['edits_per_job']['mean']} edits/job "
+          f"(max {report['edits_per_job']['max']}), "
+          f"{report['uploaded_mb_per_job']} MB uploaded/job")
+    memory = report["memory"]
+    print(f"memory      RSS +{memory['rss_growth_mb']} MB, heap {memory['python_heap_mb']} MB "
+          f"(peak {memory['python_heap_peak_mb']} MB), "
+          f"{memory['cached_images']} images left in the generator cache")
+    print(f"mock        {report['mock']['requests']}")
+
+
+def main():
+    """Command line entry point. Exits 1 if a job failed or p99 is over `--max-p99`."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--jobs", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--mode", choices=("draw", "enhance", "mixed"), default="draw")
+    parser.add_argument("--latency", type=float, default=1.0, help="mock seconds per image")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--image-scale", type=float, default=0.25)
+    parser.add_argument("--tagger-latency", type=float, default=0.05)
+    parser.add_argument("--job-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--max-p99", type=float, default=None, help="fail above this p99 (s)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+
+    p99 = report["latency_s"]["p99"]
+    too_slow = args.max_p99 is not None and (p99 is None or p99 > args.max_p99)
+    failed = report["ok"] < report["jobs"] and not args.failure_rate
+    sys.exit(1 if too_slow or failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""A CPU-only stand-in for the Stable Diffusion WebUI API.
+
+Implements the endpoints ImageGen uses: `sdapi/v1/txt2img`, `sdapi/v1/img2img`,
+`internal/progress` with live previews, and `tagger/v1/interrogate`. Generation
+just sleeps for the configured latency while progress advances, then returns
+a generated PNG, so the cog's queueing, polling and editing can be measured
+without a GPU.
+"""
+
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image, ImageDraw
+
+TAGS = [
+    "1girl", "solo", "long_hair", "smile", "outdoors", "sky", "cloud", "tree",
+    "looking_at_viewer", "blue_eyes", "short_hair", "holding", "day", "flower",
+]
+
+
+class _Job:  # pylint: disable=too-few-public-methods
+    """A generation the mock is pretending to run, or has queued behind another."""
+
+    __slots__ = ("started", "duration", "width", "height", "seed")
+
+    def __init__(self, duration: float, width: int, height: int, seed: int):
+        self.started: Optional[float] = None  # None while waiting for the GPU
+        self.duration = duration
+        self.width = width
+        self.height = height
+        self.seed = seed
+
+    @property
+    def progress(self) -> float:
+        """Fraction complete, 0 to 1."""
+        if self.started is None:
+            return 0.0
+        return min(1.0, (time.monotonic() - self.started) / self.duration) if self.duration else 1.0
+
+
+class MockWebUI:  # pylint: disable=too-many-instance-attributes
+    """A threaded HTTP server that behaves like a slow, occasionally failing WebUI.
+
+    Args:
+        latency: Seconds each txt2img or img2img request takes.
+        jitter: Random extra latency, up to this fraction of `latency`.
+        failure_rate: Chance a generation returns HTTP 500 halfway through.
+        image_scale: Output size as a fraction of the requested width and height.
+        image_size: Fixed (width, height) for outputs, overriding `image_scale`.
+        preview_scale: Live preview size as a fraction of the output.
+        tagger_latency: Seconds each tagger request takes.
+        serial: Run one generation at a time like a single GPU does.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self, host: str = "127.0.0.1", port: int = 0, *, latency: float = 2.0,
+        jitter: float = 0.0, failure_rate: float = 0.0, image_scale: float = 1.0,
+        image_size: Optional[tuple[int, int]] = None, preview_scale: float = 0.25,
+        tagger_latency: float = 0.1, serial: bool = True, seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.image_scale = image_scale
+        self.image_size = image_size
+        self.preview_scale = preview_scale
+        self.tagger_latency = tagger_latency
+        self.requests: dict[str, int] = {}
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._jobs: dict[str, _Job] = {}
+        self._lock = threading.Lock()
+        self._gpu = threading.Lock() if serial else None
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to give the cog, e.g. http://127.0.0.1:7860."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockWebUI":
+        """Serve on a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Shut the server down."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        """Serve on the calling thread until interrupted."""
+        self._server.serve_forever()
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Dispatches POSTs to the mock's endpoint methods."""
+
+            def do_POST(self):  # pylint: disable=missing-function-docstring
+                routes = {
+                    "/sdapi/v1/txt2img": mock.generate,
+                    "/sdapi/v1/img2img": mock.generate,
+                    "/internal/progress": mock.progress,
+                    "/tagger/v1/interrogate": mock.interrogate,
+                }
+                route = routes.get(self.path.split("?")[0])
+                if route is None:
+                    self._reply(404, {"detail": "Not Found"})
+                    return
+                with mock._lock:  # pylint: disable=protected-access
+                    mock.requests[self.path] = mock.requests.get(self.path, 0) + 1
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self._reply(422, {"detail": "Invalid JSON"})
+                    return
+                self._reply(*route(body))
+
+            def _reply(self, status: int, data: dict):
+                payload = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+        return Handler
+
+    def _size(self, width: int, height: int) -> tuple[int, int]:
+        if self.image_size:
+            return self.image_size
+        return max(8, int(width * self.image_scale)), max(8, int(height * self.image_scale))
+
+    def generate(self, body: dict) -> tuple[int, dict]:
+        """txt2img and img2img: wait out the latency, then return one image."""
+        task_id = body.get("force_task_id") or f"task({time.monotonic_ns()})"
+        width, height = self._size(int(body.get("width", 512)), int(body.get("height", 512)))
+        seed = body.get("seed", -1)
+        if seed == -1:
+            seed = self._random.randrange(2**32)
+        duration = self.latency * (1 + self._random.uniform(0, self.jitter))
+        fail = self._random.random() < self.failure_rate
+
+        # Registered before waiting for the GPU, so progress reports it as queued
+        job = _Job(duration, width, height, seed)
+        with self._lock:
+            self._jobs[task_id] = job
+        if self._gpu is not None:
+            self._gpu.acquire()  # pylint: disable=consider-using-with
+        try:
+            job.started = time.monotonic()
+            time.sleep(duration / 2 if fail else duration)
+        finally:
+            with self._lock:
+                self._jobs.pop(task_id, None)
+            if self._gpu is not None:
+                self._gpu.release()
+
+        if fail:
+            with self._lock:
+                self.failures += 1
+            return 500, {"error": "OutOfMemoryError", "detail": "CUDA out of memory (mock)"}
+        image = _render(width, height, seed, 1.0)
+        return 200, {"images": [image], "parameters": body, "info": json.dumps({"seed": seed})}
+
+    def progress(self, body: dict) -> tuple[int, dict]:
+        """internal/progress: how far a task is, with a preview if one is newer than asked for."""
+        task_id = body.get("id_task")
+        with self._lock:
+            job = self._jobs.get(task_id)
+        if job is None:
+            return 200, {
+                "active": False, "queued": False, "completed": True, "progress": None,
+                "eta": None, "live_preview": None, "id_live_preview": -1, "textinfo": None,
+            }
+        if job.started is None:
+            return 200, {
+                "active": False, "queued": True, "completed": False, "progress": None,
+                "eta": None, "live_preview": None, "id_live_preview": -1, "textinfo": "In queue...",
+            }
+        progress = job.progress
+        preview_id = int(progress * 20)  # a new preview every 5%
+        data = {
+            "active": True, "queued": False, "completed": False, "progress": progress,
+            "eta": job.duration * (1 - progress), "live_preview": None,
+            "id_live_preview": preview_id, "textinfo": None,
+        }
+        if body.get("live_preview", True) and preview_id > body.get("id_live_preview", -1):
+            scale = self.preview_scale
+            preview = _render(
+                max(8, int(job.width * scale)), max(8, int(job.height * scale)), job.seed, progress
+            )
+            data["live_preview"] = f"data:image/png;base64,{preview}"
+        return 200, data
+
+    def interrogate(self, body: dict) -> tuple[int, dict]:
+        """tagger/v1/interrogate: confident-looking scores for a fixed tag list."""
+        if not body.get("image"):
+            return 422, {"detail": "image is required"}
+        time.sleep(self.tagger_latency)
+        threshold = float(body.get("threshold", 0.35))
+        rng = random.Random(len(body["image"]))
+        tags = {tag: round(rng.uniform(threshold, 1.0), 4) for tag in rng.sample(TAGS, 8)}
+        return 200, {"caption": {"tag": tags, "rating": {"general": 0.9, "sensitive": 0.1}}}
+
+
+def _render(width: int, height: int, seed: int, progress: float) -> str:
+    """A base64 PNG: a seeded gradient that sharpens as `progress` approaches 1."""
+    rng = random.Random(seed)
+    start = tuple(rng.randrange(256) for _ in range(3))
+    end = tuple(rng.randrange(256) for _ in range(3))
+    strip = Image.new("RGB", (1, 256))
+    strip.putdata([
+        tuple(int(a + (b - a) * i / 255) for a, b in zip(start, end)) for i in range(256)
+    ])
+    image = strip.resize((width, height))
+    if progress < 1.0:
+        # Previews are noisier the earlier they are
+        noise = Image.effect_noise((width, height), 100 * (1 - progress)).convert("RGB")
+        image = Image.blend(image, noise, 0.5 * (1 - progress))
+        ImageDraw.Draw(image).rectangle((0, 0, int(width * progress), 3), fill=(255, 255, 255))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def main():
+    """Run the mock server from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7860)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--image-scale", type=float, default=1.0)
+    parser.add_argument("--tagger-latency", type=float, default=0.1)
+    parser.add_argument("--parallel", action="store_true", help="don't serialise generations")
+    args = parser.parse_args()
+    mock = MockWebUI(
+        args.host, args.port, latency=args.latency, jitter=args.jitter,
+        failure_rate=args.failure_rate, image_scale=args.image_scale,
+        tagger_latency=args.tagger_latency, serial=not args.parallel,
+    )
+    print(f"Mock WebUI listening on {mock.url}")
+    try:
+        mock.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
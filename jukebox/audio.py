@@ -0,0 +1,274 @@
+"""Audio sources and helpers used by the jukebox player."""
+
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+import discord
+import numpy as np
+
+from .metrics import StreamStats
+
+BYTES_PER_SECOND = discord.opus.Encoder.SAMPLING_RATE * discord.opus.Encoder.SAMPLE_SIZE
+FRAME_SIZE = discord.opus.Encoder.FRAME_SIZE
+DUCK_GAIN = 0.3      # music level while someone is speaking
+DUCK_RAMP = 0.1      # gain change per 20 ms frame, so ducking takes ~200 ms
+
+
+class TrackedSource(discord.AudioSource):
+    """Wraps a PCM source and counts the bytes actually handed to the voice client.
+
+    The voice client only calls `read` when it is about to send a frame, so the
+    count stops while paused and excludes ffmpeg start-up, giving an exact position.
+    """
+
+    def __init__(self, original: discord.AudioSource, path: str, start: float = 0.0):
+        self.original = original
+        self.path = path
+        self.start = start
+        self.duration: Optional[float] = None
+        self.announce = True
+        self.bytes_read = 0
+        self._buffer: deque[bytes] = deque()
+
+    @property
+    def position(self) -> float:
+        """Seconds into the track of the last frame that was delivered."""
+        return self.start + self.bytes_read / BYTES_PER_SECOND
+
+    @property
+    def remaining(self) -> Optional[float]:
+        """Seconds left in the track, if its duration is known."""
+        if self.duration is None:
+            return None
+        return max(0.0, self.duration - self.position)
+
+    def prime(self, frames: int):
+        """Decode `frames` frames ahead of time so the first reads never wait on ffmpeg.
+
+        Blocks on the ffmpeg pipe, so call it from a worker thread.
+        """
+        for _ in range(frames):
+            data = self.original.read()
+            if not data:
+                break
+            self._buffer.append(data)
+
+    def read(self) -> bytes:
+        data = self._buffer.popleft() if self._buffer else self.original.read()
+        self.bytes_read += len(data)
+        return data
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        self._buffer.clear()
+        self.original.cleanup()
+
+
+class Mixer(discord.AudioSource):  # pylint: disable=too-many-instance-attributes
+    """Plays a music deck with TTS overlays mixed on top, ducking the music under speech.
+
+    A prefetched next deck is swapped in the moment the current one runs dry, or
+    faded in over `crossfade` seconds when the current deck's duration is known.
+    `read` runs on the voice client's player thread while the event loop swaps
+    decks and adds overlays, so shared state is guarded by a lock and replaced
+    sources are cleaned up from the player thread.
+    """
+
+    def __init__(self, music: Optional[TrackedSource], volume: float, crossfade: float = 0.0):
+        self.music = music
+        self.volume = volume
+        self.crossfade = crossfade
+        self.on_track_change: Optional[Callable[[], None]] = None
+        self.stats: Optional[StreamStats] = None
+        self._next: Optional[TrackedSource] = None
+        self._duck = 1.0
+        self._overlays: list[discord.AudioSource] = []
+        self._retired: list[discord.AudioSource] = []
+        self._lock = threading.Lock()
+
+    @property
+    def next(self) -> Optional[TrackedSource]:
+        """The prefetched deck that will play after the current one."""
+        return self._next
+
+    def add_overlay(self, source: discord.AudioSource):
+        """Start playing `source` over the music immediately."""
+        with self._lock:
+            self._overlays.append(source)
+
+    def set_next(self, source: Optional[TrackedSource]):
+        """Queue `source` to take over as soon as the current deck ends."""
+        with self._lock:
+            if self._next is not None:
+                self._retired.append(self._next)
+            self._next = source
+
+    def skip(self):
+        """Drop the current deck; the next one, if any, starts on the following frame."""
+        with self._lock:
+            if self.music is not None:
+                self._retired.append(self.music)
+            self.music = None
+
+    def replace(self, source: TrackedSource):
+        """Swap the current deck for `source` without signalling a track change."""
+        with self._lock:
+            if self.music is not None:
+                self._retired.append(self.music)
+            self.music = source
+
+    def read(self) -> bytes:  # pylint: disable=too-many-branches, too-many-locals
+        started = time.perf_counter()
+        self._cleanup_retired()
+        changed = False
+        with self._lock:
+            if self.music is None and self._next is not None:
+                self.music, self._next = self._next, None
+                changed = True
+            music, upcoming, overlays = self.music, self._next, list(self._overlays)
+
+        speech = []
+        for overlay in overlays:
+            data = overlay.read()
+            if data:
+                speech.append(data)
+            else:
+                with self._lock:
+                    self._overlays.remove(overlay)
+                overlay.cleanup()
+
+        duck_from = self._duck
+        target = DUCK_GAIN if speech else 1.0
+        if duck_from < target:
+            self._duck = min(target, duck_from + DUCK_RAMP)
+        elif duck_from > target:
+            self._duck = max(target, duck_from - DUCK_RAMP)
+        gain_from, gain_to = self.volume * duck_from, self.volume * self._duck
+
+        layers = [(frame, 1.0, 1.0) for frame in speech]
+        fade = self._fade(music) if upcoming is not None else 1.0
+        data, decode = _timed_read(music)
+        if data:
+            layers.append((data, gain_from * fade, gain_to * fade))
+        if fade < 1.0:
+            incoming = upcoming.read()
+            if incoming:
+                layers.append((incoming, gain_from * (1 - fade), gain_to * (1 - fade)))
+
+        if music is not None and not data:
+            with self._lock:
+                if self.music is music:
+                    self._retired.append(music)
+                    self.music, self._next = self._next, None
+                    changed = True
+                    # Fill this frame from the new deck so the handoff has no gap
+                    if self.music is not None and fade == 1.0:
+                        incoming = self.music.read()
+                        if incoming:
+                            layers.append((incoming, gain_from, gain_to))
+
+        if changed and self.on_track_change is not None:
+            self.on_track_change()
+        if not layers:
+            return b""
+        mixed = mix_frames(layers)
+        if self.stats is not None:
+            self.stats.frame(time.perf_counter() - started, decode, changed)
+        return mixed
+
+    def _fade(self, music: Optional[TrackedSource]) -> float:
+        """Gain of the outgoing deck: 1.0 until the crossfade window, then down to 0."""
+        if music is None or self.crossfade <= 0:
+            return 1.0
+        remaining = music.remaining
+        if remaining is None or remaining >= self.crossfade:
+            return 1.0
+        return remaining / self.crossfade
+
+    def _cleanup_retired(self):
+        with self._lock:
+            retired, self._retired = self._retired, []
+        for source in retired:
+            source.cleanup()
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        with self._lock:
+            for source in (self.music, self._next, *self._overlays):
+                if source is not None:
+                    self._retired.append(source)
+            self.music, self._next, self._overlays = None, None, []
+        self._cleanup_retired()
+
+
+def _timed_read(source: Optional[discord.AudioSource]) -> tuple[bytes, float]:
+    """Read a frame from `source`, returning it with how long the read blocked."""
+    if source is None:
+        return b"", 0.0
+    started = time.perf_counter()
+    data = source.read()
+    return data, time.perf_counter() - started
+
+
+def mix_frames(layers: list[tuple[bytes, float, float]]) -> bytes:
+    """Sum PCM frames, each scaled by a gain ramped linearly across the frame."""
+    mixed = np.zeros(FRAME_SIZE // 2, dtype=np.float32)
+    for frame, gain_from, gain_to in layers:
+        samples = np.frombuffer(frame, dtype=np.int16)
+        if gain_from == gain_to:
+            gain = gain_from
+        else:
+            # Ramp per stereo sample pair so the level change doesn't click
+            gain = np.repeat(np.linspace(gain_from, gain_to, len(samples) // 2), 2)
+        mixed[:len(samples)] += samples * gain
+    return np.clip(mixed, -32768, 32767).astype(np.int16).tobytes()
+
+
+def ffmpeg_source(path: str, seek: float = 0.0) -> discord.FFmpegPCMAudio:
+    """Spawn ffmpeg for `path`, seeking on the input so the offset is sample accurate."""
+    ffmpeg_opts = {"options": "-vn"}
+    if seek:
+        ffmpeg_opts["before_options"] = f"-ss {seek:.3f}"
+    return discord.FFmpegPCMAudio(path, **ffmpeg_opts)
+
+
+def format_time(seconds: float) -> str:
+    """Format seconds as m:ss or h:mm:ss."""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02}:{secs:02}"
+    return f"{minutes}:{secs:02}"
+
+
+def progress_bar(position: float, duration: Optional[float], width: int = 16) -> str:
+    """Render a text progress bar with elapsed and total time."""
+    if not duration:
+        return f"`{format_time(position)}`"
+    ratio = min(1.0, max(0.0, position / duration))
+    filled = int(ratio * (width - 1))
+    gauge = "▬" * filled + "🔘" + "─" * (width - 1 - filled)
+    return f"`{gauge}` `{format_time(position)} / {format_time(duration)}`"
+
+
+def parse_timestamp(value: str) -> Optional[float]:
+    """Parse `90`, `1:30`, `1:02:03` or `12.5` into seconds."""
+    try:
+        parts = [float(part) for part in value.strip().split(":")]
+    except ValueError:
+        return None
+    # float() also accepts "inf", "nan" and "1e400"
+    if not parts or len(parts) > 3 or any(not math.isfinite(p) or p < 0 for p in parts):
+        return None
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + part
+    return seconds if math.isfinite(seconds) else None
@@ -0,0 +1,181 @@
+"""One ffmpeg decoder shared by every guild playing the same part of a track."""
+
+import threading
+from typing import Callable
+
+import discord
+
+from .audio import FRAME_SIZE
+
+FRAMES_PER_SECOND = 50
+RING_FRAMES = 500  # 10 s of decoded PCM kept, so late joiners and slow guilds catch up
+LOOKAHEAD = 50     # the decoder runs at most 1 s ahead of its fastest listener
+
+
+class SharedDecoder:  # pylint: disable=too-many-instance-attributes
+    """Decodes a track once into a ring of PCM frames that any number of listeners read.
+
+    A dedicated thread fills the ring, paced by the fastest listener. A listener
+    that stalls (e.g. a paused guild) never holds the others back; if it falls
+    more than the ring behind it skips forward to the oldest frame still kept.
+    """
+
+    def __init__(self, original: discord.AudioSource, path: str, start: float):
+        self.original = original
+        self.path = path
+        self.start = start
+        self.head = 0  # index of the next frame to decode
+        self.eof = False
+        self.closed = False
+        self.listeners: set["BroadcastSource"] = set()
+        self._slots: list[bytes] = [b""] * RING_FRAMES
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._decode, name=f"jukebox-broadcast-{path}", daemon=True
+        )
+        self._thread.start()
+
+    def frame_at(self, seconds: float) -> int:
+        """Ring index of the frame `seconds` into the track."""
+        return round((seconds - self.start) * FRAMES_PER_SECOND)
+
+    def can_join(self, frame: int) -> bool:
+        """Whether a listener starting at `frame` can be served from this decoder."""
+        with self._cond:
+            return (
+                not self.closed and not self.eof
+                and max(0, self.head - RING_FRAMES) <= frame <= self.head + LOOKAHEAD
+            )
+
+    def _decode(self):
+        try:
+            while True:
+                with self._cond:
+                    while not self.closed and (
+                        not self.listeners or self.head - self._leader() >= LOOKAHEAD
+                    ):
+                        self._cond.wait()
+                    if self.closed:
+                        return
+                data = self.original.read()
+                with self._cond:
+                    if not data:
+                        self.eof = True
+                        return
+                    self._slots[self.head % RING_FRAMES] = data
+                    self.head += 1
+                    self._cond.notify_all()
+        finally:
+            with self._cond:
+                self.eof = True
+                self._cond.notify_all()
+            self.original.cleanup()
+
+    def _leader(self) -> int:
+        return max(listener.cursor for listener in self.listeners)
+
+    def read(self, listener: "BroadcastSource") -> bytes:
+        """The listener's next frame, waiting for the decoder if it is caught up."""
+        with self._cond:
+            while listener.cursor >= self.head and not self.eof and not self.closed:
+                self._cond.wait()
+            if listener.cursor >= self.head:
+                return b""
+            oldest = self.head - RING_FRAMES
+            if listener.cursor < oldest:
+                listener.skipped += oldest - listener.cursor
+                listener.cursor = oldest
+            data = self._slots[listener.cursor % RING_FRAMES]
+            listener.cursor += 1
+            self._cond.notify_all()
+            return data
+
+    def add(self, listener: "BroadcastSource"):
+        """Attach a listener."""
+        with self._cond:
+            self.listeners.add(listener)
+            self._cond.notify_all()
+
+    def remove(self, listener: "BroadcastSource") -> bool:
+        """Detach a listener. Returns True, and stops decoding, once none are left."""
+        with self._cond:
+            self.listeners.discard(listener)
+            if not self.listeners:
+                self.closed = True
+            self._cond.notify_all()
+            return self.closed
+
+
+class BroadcastSource(discord.AudioSource):
+    """One guild's view of a SharedDecoder."""
+
+    def __init__(self, decoder: SharedDecoder, cursor: int, on_close: Callable[[], None]):
+        self.decoder = decoder
+        self.cursor = cursor
+        self.skipped = 0
+        self._on_close = on_close
+        self._closed = False
+
+    def read(self) -> bytes:
+        data = self.decoder.read(self)
+        return data if len(data) == FRAME_SIZE else b""
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        if not self._closed:
+            self._closed = True
+            self._on_close()
+
+
+class BroadcastHub:
+    """Hands out shared decoders, grouping listeners by track and playback offset."""
+
+    def __init__(self, spawn: Callable[[str, float], discord.AudioSource]):
+        self.spawn = spawn
+        self.shared_joins = 0  # listeners served by an already running decoder
+        self._decoders: dict[str, list[SharedDecoder]] = {}
+        self._lock = threading.Lock()
+
+    def join(self, path: str, seek: float = 0.0) -> BroadcastSource:
+        """A source for `path` from `seek`, sharing a decoder when one is close enough.
+
+        Spawns ffmpeg when no decoder can serve the offset, so call it from a thread.
+        """
+        with self._lock:
+            for decoder in self._decoders.get(path, []):
+                frame = decoder.frame_at(seek)
+                if decoder.can_join(frame):
+                    self.shared_joins += 1
+                    return self._attach(decoder, frame)
+        decoder = SharedDecoder(self.spawn(path, seek), path, seek)
+        with self._lock:
+            self._decoders.setdefault(path, []).append(decoder)
+            return self._attach(decoder, 0)
+
+    def _attach(self, decoder: SharedDecoder, frame: int) -> BroadcastSource:
+        source = BroadcastSource(decoder, frame, lambda: self._detach(decoder, source))
+        decoder.add(source)
+        return source
+
+    def _detach(self, decoder: SharedDecoder, source: BroadcastSource):
+        # Under the hub lock so `join` never attaches to a decoder that is closing
+        with self._lock:
+            if not decoder.remove(source):
+                return
+            group = self._decoders.get(decoder.path, [])
+            if decoder in group:
+                group.remove(decoder)
+            if not group:
+                self._decoders.pop(decoder.path, None)
+
+    def stats(self) -> dict:
+        """How many decoders are running and how many guilds they serve."""
+        with self._lock:
+            decoders = [d for group in self._decoders.values() for d in group]
+        return {
+            "decoders": len(decoders),
+            "listeners": sum(len(d.listeners) for d in decoders),
+            "shared_joins": self.shared_joins,
+        }
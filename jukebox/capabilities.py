@@ -0,0 +1,107 @@
+"""Discovers which audio tools are available without blocking cog loading."""
+
+import asyncio
+import shutil
+from typing import Optional
+
+from .opus_cache import opus_available
+
+PROBE_TIMEOUT = 10.0
+INSTALL_TIMEOUT = 600.0
+
+
+class Capabilities:
+    """What the host can do, filled in by a background probe shortly after load.
+
+    Until `ready` is set every attribute reports "missing", so callers can tell
+    "still checking" apart from "not installed" by looking at `ready` first.
+    """
+
+    def __init__(self):
+        self.ready = asyncio.Event()
+        self.ffmpeg: Optional[str] = None
+        self.ffprobe: Optional[str] = None
+        self.encoders: set[str] = set()
+        self.opus = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Probe in the background unless a probe is already running."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.refresh())
+
+    async def close(self):
+        """Cancel a probe that is still running."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def wait(self):
+        """Block until the first probe has finished."""
+        await self.ready.wait()
+
+    async def refresh(self):
+        """Look for ffmpeg, ffprobe, their encoders and libopus."""
+        self.ffmpeg = await asyncio.to_thread(shutil.which, "ffmpeg")
+        self.ffprobe = await asyncio.to_thread(shutil.which, "ffprobe")
+        self.encoders = await _list_encoders(self.ffmpeg) if self.ffmpeg else set()
+        self.opus = await asyncio.to_thread(opus_available)
+        self.ready.set()
+
+    def to_dict(self) -> dict:
+        """Probe results for the stats dump."""
+        return {
+            "ready": self.ready.is_set(),
+            "ffmpeg": self.ffmpeg,
+            "ffprobe": self.ffprobe,
+            "libmp3lame": "libmp3lame" in self.encoders,
+            "libopus": self.opus,
+        }
+
+
+async def _list_encoders(ffmpeg: str) -> set[str]:
+    """Names of the encoders an ffmpeg binary was built with."""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            ffmpeg, "-hide_banner", "-encoders",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+    except OSError:
+        return set()
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), PROBE_TIMEOUT)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return set()
+    encoders = set()
+    # Rows look like " A....D libmp3lame  libmp3lame MP3 (MPEG audio layer 3)"
+    for line in stdout.decode(errors="replace").splitlines():
+        fields = line.split()
+        if len(fields) >= 3 and len(fields[0]) == 6 and fields[1] != "=":
+            encoders.add(fields[1])
+    return encoders
+
+
+async def install_ffmpeg() -> str:
+    """Install ffmpeg with apt-get in a subprocess. Returns a short error, or "" on success."""
+    apt = await asyncio.to_thread(shutil.which, "apt-get")
+    if apt is None:
+        return "apt-get isn't available on this system."
+    for args in (("update",), ("install", "-y", "ffmpeg")):
+        proc = await asyncio.create_subprocess_exec(
+            apt, *args,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            _, stderr = await asyncio.wait_for(proc.communicate(), INSTALL_TIMEOUT)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return f"apt-get {args[0]} timed out."
+        if proc.returncode != 0:
+            detail = stderr.decode(errors="replace").strip().splitlines()
+            return detail[-1] if detail else f"apt-get {args[0]} failed."
+    return ""
@@ -0,0 +1,66 @@
+"""Streams uploads straight into the library, hashing them on the way in."""
+
+import asyncio
+import hashlib
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Optional
+
+import aiohttp
+
+from .transcoder import PROGRESS_INTERVAL, ProgressCallback
+
+CHUNK_SIZE = 256 * 1024
+DEFAULT_MAX_UPLOAD_MB = 50
+DEFAULT_MAX_MINUTES = 20
+
+
+class IngestError(Exception):
+    """Raised when an upload is rejected or cannot be downloaded."""
+
+
+async def download(  # pylint: disable=too-many-arguments, too-many-positional-arguments
+    session: aiohttp.ClientSession, url: str, dest: Path, max_bytes: int,
+    expected: Optional[int] = None, progress: Optional[ProgressCallback] = None
+) -> str:
+    """Stream `url` into `dest` chunk by chunk and return the content's SHA-256.
+
+    Nothing is buffered beyond one chunk, and the download is abandoned as soon
+    as it exceeds `max_bytes`, whatever size the server claimed up front.
+    """
+    hasher = hashlib.sha256()
+    received = 0
+    last_report = time.monotonic()
+    f = await asyncio.to_thread(open, dest, "wb")
+    try:
+        async with session.get(url) as response:
+            if response.status != 200:
+                raise IngestError(f"the download failed with HTTP {response.status}")
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                received += len(chunk)
+                if received > max_bytes:
+                    raise IngestError(f"the file is larger than {max_bytes // 1024 // 1024} MB")
+                hasher.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+                now = time.monotonic()
+                if progress and expected and now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    await progress(min(1.0, received / expected))
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise IngestError(f"the download failed: {e}") from e
+    finally:
+        await asyncio.to_thread(f.close)
+    return hasher.hexdigest()
+
+
+def link_into(existing: Path, dest: Path):
+    """Atomically make `dest` another name for `existing`, copying if links aren't supported."""
+    part_path = dest.with_suffix(dest.suffix + ".part")
+    part_path.unlink(missing_ok=True)
+    try:
+        os.link(existing, part_path)
+    except OSError:
+        shutil.copyfile(existing, part_path)
+    os.replace(part_path, dest)
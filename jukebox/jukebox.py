@@ -1,34 +1,74 @@
 """a simple music player that uses FFMPEG to play local tracks."""
+# pylint: disable=too-many-lines
 
 import asyncio
+import io
 import json
+import math
 import os
 import random
 import re
-import shutil
-import subprocess
-import tempfile
 import time
 from pathlib import Path
 from typing import Optional
 
+import aiohttp
 import discord
-import edge_tts
 from redbot.core import commands, Config
-
+from redbot.core.utils.chat_formatting import pagify
+
+from .audio import (
+    Mixer, TrackedSource, ffmpeg_source, format_time, parse_timestamp, progress_bar
+)
+from .broadcast import BroadcastHub
+from .capabilities import Capabilities, install_ffmpeg
+from .ingest import (
+    DEFAULT_MAX_MINUTES, DEFAULT_MAX_UPLOAD_MB, IngestError, download, link_into
+)
+from .metrics import JukeboxMetrics, ffmpeg_processes, own_usage
+from .opus_cache import DEFAULT_OPUS_CACHE_MB, OpusCache
+from .prober import MetadataProber
+from .state import PlaybackCheckpointer, dump_queue, load_queue
+from .store import JukeboxStore, PlaylistCursor
+from .tracks import LibraryIndex, ShuffleSegment, TrackQueue
+from .transcoder import DEFAULT_WORKERS, SUPPORTED_EXTENSIONS, TranscodeError, Transcoder
+from .tts import DEFAULT_CACHE_MB, DEFAULT_TTS_VOICE, EdgeTTSProvider, TTSCache, TTSError
 
 DEFAULT_VOLUME = 1.0
+PREFETCH_FRAMES = 25  # 500 ms decoded ahead of each track
+QUEUE_TIME_LIMIT = 5000  # entries summed for the queue's total time
+STATS_LINES = 25  # lines of `jukebox stats` before the rest is summarized
 
 def sanitize_filename(name: str) -> str:
     """Removes invalid characters from filenames"""
     return re.sub(r'[\\/*?:"<>|]', '_', name)
 
+def _entry_label(entry, library: LibraryIndex) -> str:
+    """Human readable name for a queue entry."""
+    if isinstance(entry, int):
+        return library.name(entry)
+    if isinstance(entry, PlaylistCursor):
+        return f"📜 Playlist {entry.name} ({entry.remaining} more)"
+    if isinstance(entry, dict):
+        return "🗣️ TTS message" if entry.get("tts") else Path(entry["path"]).stem
+    return Path(entry).stem
+
+def _entry_path(entry, library: LibraryIndex) -> Optional[str]:
+    """File a queue entry will play, or None for playlists and TTS."""
+    if isinstance(entry, int):
+        return str(library.path(entry))
+    if isinstance(entry, dict):
+        return None if entry.get("tts") else entry["path"]
+    if isinstance(entry, str):
+        return entry
+    return None
+
 def chunk_list(data, size):
     """Chunks list to keep messages from being too long"""
     for i in range(0, len(data), size):
         yield data[i:i + size]
 
-class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
+class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes, too-many-public-methods
     """a simple music player that uses FFMPEG to play local tracks."""
 
     def __init__(self, bot):
@@ -38,21 +78,147 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
         self.library_path.mkdir(parents=True, exist_ok=True)
 
         self.config = Config.get_conf(self, identifier=0xF00DCAFE, force_registration=True)
-        self.config.register_user(tts_voice="en-US-AriaNeural")
-        self.config.register_guild(volume=DEFAULT_VOLUME)
-
-        self.queue = {}       # guild_id: asyncio.Queue[str]
+        self.config.register_user(tts_voice=DEFAULT_TTS_VOICE)
+        self.config.register_guild(volume=DEFAULT_VOLUME, crossfade=0.0, broadcast=False)
+        self.config.register_global(
+            transcode_workers=DEFAULT_WORKERS, tts_cache_mb=DEFAULT_CACHE_MB,
+            opus_cache_mb=DEFAULT_OPUS_CACHE_MB, max_upload_mb=DEFAULT_MAX_UPLOAD_MB,
+            max_track_minutes=DEFAULT_MAX_MINUTES
+        )
+
+        self.queue = {}       # guild_id: TrackQueue
         self.players = {}     # guild_id: asyncio.Task
         self.current_track = {}  # guild_id: str
         self.playlist_path = self.data_path / "playlists"
         self.playlist_path.mkdir(parents=True, exist_ok=True)
-        self.track_start_time = {}  # guild_id: float
-        if shutil.which("ffmpeg") is None:
-            try:
-                subprocess.run(["apt", "update"], check=True)
-                subprocess.run(["apt", "install", "-y", "ffmpeg"], check=True)
-            except subprocess.CalledProcessError as e:
-                raise RuntimeError(f"Failed to install ffmpeg: {e}") from e
+        self.now_playing = {}  # guild_id: TrackedSource
+        self.text_channels = {}  # guild_id: channel that receives "Now playing"
+        self.metrics = JukeboxMetrics()
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._ingesting: set[str] = set()  # casefolded names of uploads in progress
+        self.broadcast_hub = BroadcastHub(ffmpeg_source)
+        self.opus_cache = OpusCache(
+            self.data_path / "opus_cache", DEFAULT_OPUS_CACHE_MB * 1024 * 1024
+        )
+        self.capabilities = Capabilities()
+        self.transcoder = Transcoder(self.capabilities)
+        self.store = JukeboxStore(self.data_path / "jukebox.db")
+        self.library = LibraryIndex(self.library_path)
+        self.prober = MetadataProber(self.store, self.capabilities)
+        self.checkpointer = PlaybackCheckpointer(self.store, self._snapshot_guild)
+        self.ready = asyncio.Event()  # set once the library and caches have loaded
+        self._warmup_task = None
+        self.tts_cache = TTSCache(
+            self.data_path / "tts_cache", EdgeTTSProvider(), DEFAULT_CACHE_MB * 1024 * 1024
+        )
+
+    async def cog_load(self):
+        """Open storage and start the transcoding workers.
+
+        Anything that grows with the library or the caches loads in the background,
+        so loading the cog takes the same time however much music it holds.
+        """
+        # Tool discovery runs in the background so loading never waits on a subprocess
+        self.capabilities.start()
+        self.session = aiohttp.ClientSession()
+        await self.store.open()
+        self.transcoder.set_workers(await self.config.transcode_workers())
+        self.tts_cache.max_bytes = await self.config.tts_cache_mb() * 1024 * 1024
+        self.opus_cache.max_bytes = await self.config.opus_cache_mb() * 1024 * 1024
+        self._warmup_task = asyncio.create_task(self._warm_up())
+
+    async def _warm_up(self):
+        """Load the library, metadata and caches, then resume saved playback."""
+        try:
+            await self.store.migrate_json(self.playlist_path)
+            await self.library.refresh(self.store)
+            await self.prober.load()
+            await self.tts_cache.load()
+            await self.opus_cache.load()
+            saved = await self.checkpointer.load()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(f"[Jukebox] Failed to load saved data: {e}")
+            # Saved sessions weren't loaded, so nothing tracks them and only
+            # guilds that start playing from now on are written
+            self.checkpointer.start()
+            return
+        finally:
+            # Commands run on whatever loaded rather than waiting forever
+            self.ready.set()
+        self.prober.prefetch(str(self.library.path(i)) for i in self.library.snapshot)
+        await self._restore_sessions(saved)
+
+    async def cog_before_invoke(self, ctx: commands.Context):
+        """Hold commands until the library and caches have loaded."""
+        await self.ready.wait()
+
+    async def cog_unload(self):
+        """Checkpoint playback, leave voice, stop the workers and close storage."""
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+            await asyncio.gather(self._warmup_task, return_exceptions=True)
+        await self.capabilities.close()
+        await self.checkpointer.stop()
+        for guild_id, task in list(self.players.items()):
+            task.cancel()
+            guild = self.bot.get_guild(guild_id)
+            if guild and guild.voice_client:
+                await guild.voice_client.disconnect(force=True)
+        await self.transcoder.close()
+        await self.opus_cache.close()
+        await self.prober.close()
+        await self.store.close()
+        if self.session is not None:
+            await self.session.close()
+
+    def _snapshot_guild(self, guild_id: int) -> Optional[dict]:
+        """Everything needed to resume a guild's playback, or None if it is idle."""
+        guild = self.bot.get_guild(guild_id)
+        task = self.players.get(guild_id)
+        voice = guild.voice_client if guild else None
+        if voice is None or not voice.is_connected() or task is None or task.done():
+            return None
+
+        items = []
+        source = self.now_playing.get(guild_id)
+        if source is not None:
+            items.append({"path": source.path, "seek": round(source.position, 3)})
+        if isinstance(voice.source, Mixer) and voice.source.next is not None:
+            items.append({"path": voice.source.next.path, "seek": voice.source.next.start})
+        queue = self.queue.get(guild_id)
+        if queue:
+            items.extend(dump_queue(queue))
+        if not items:
+            return None
+        return {
+            "voice_channel": voice.channel.id,
+            "text_channel": self.text_channels.get(guild_id),
+            "queue": items,
+        }
+
+    async def _restore_sessions(self, saved: dict[int, dict]):
+        """Rejoin voice and resume every guild that was playing when the cog stopped."""
+        await self.bot.wait_until_red_ready()
+        await self.capabilities.wait()
+        try:
+            if not self.capabilities.ffmpeg:
+                # Keep the saved sessions for a load where they can actually play
+                self.checkpointer.keep(saved)
+                return
+            for guild_id, state in saved.items():
+                guild = self.bot.get_guild(guild_id)
+                if guild is None:
+                    continue
+                voice_channel = guild.get_channel(state["voice_channel"])
+                text_channel = guild.get_channel(state.get("text_channel") or 0)
+                if voice_channel is None or text_channel is None:
+                    continue
+                self.queue[guild_id] = load_queue(state["queue"], self.store, self.library)
+                self._start_player(guild, voice_channel, text_channel)
+        finally:
+            # Only start once restored guilds are playing, or the first checkpoint
+            # would see them idle and delete their saved state
+            self.checkpointer.start()
 
     @commands.group(invoke_without_command=True)
     async def jukebox(self, ctx: commands.Context):
@@ -61,44 +227,205 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
 
     @jukebox.command(name="add")
     async def add(self, ctx: commands.Context, *, name: str):
-        """Upload an MP3 or MP4 file to add to the jukebox library."""
+        """Upload an audio or video file to add to the jukebox library."""
+        formats = ", ".join(ext[1:].upper() for ext in SUPPORTED_EXTENSIONS)
         if not ctx.message.attachments:
-            await ctx.send("Attach an MP3 or MP4 file to this message.")
+            await ctx.send(f"Attach an audio file to this message ({formats}).")
             return
 
         attachment = ctx.message.attachments[0]
-        filename = attachment.filename.lower()
-        if not (filename.endswith(".mp3") or filename.endswith(".mp4")):
-            await ctx.send("Only MP3 and MP4 files are supported.")
+        extension = Path(attachment.filename).suffix.lower()
+        if extension not in SUPPORTED_EXTENSIONS:
+            await ctx.send(f"Only {formats} files are supported.")
+            return
+        if extension != ".mp3" and not await self._check_encoder(ctx):
+            return
+
+        max_mb = await self.config.max_upload_mb()
+        if attachment.size > max_mb * 1024 * 1024:
+            await ctx.send(f"❌ Uploads are limited to `{max_mb}` MB.")
             return
 
         safe_name = sanitize_filename(name.strip())
         dest_path = self.library_path / f"{safe_name}.mp3"
+        if safe_name.casefold() in self._ingesting or await asyncio.to_thread(dest_path.exists):
+            await ctx.send(f"❌ `{safe_name}` is already in the jukebox. Pick another name.")
+            return
 
-        # Use temp file to store the uploaded media
-        with tempfile.TemporaryDirectory() as tmpdir:
-            temp_input_path = Path(tmpdir) / attachment.filename
-            await attachment.save(temp_input_path)
-
-            if filename.endswith(".mp4"):
-                # Convert MP4 to MP3 using ffmpeg
-                ffmpeg_cmd = [
-                    "ffmpeg", "-i", str(temp_input_path),
-                    "-vn", "-acodec", "libmp3lame", "-y", str(dest_path)
-                ]
-                proc = await asyncio.create_subprocess_exec(
-                    *ffmpeg_cmd, stdout=asyncio.subprocess.DEVNULL,
-                    stderr=asyncio.subprocess.DEVNULL
-                )
-                await proc.communicate()
-                if proc.returncode != 0 or not dest_path.exists():
-                    await ctx.send("Failed to convert MP4 to MP3.")
-                    return
+        self._ingesting.add(safe_name.casefold())
+        status = await ctx.send(f"⬇️ Downloading `{safe_name}`...")
+        try:
+            result = await self._ingest(attachment, extension, dest_path, status)
+        except (IngestError, TranscodeError) as e:
+            await status.edit(content=f"❌ Failed to add `{safe_name}`: {e}")
+            return
+        finally:
+            self._ingesting.discard(safe_name.casefold())
+
+        await self.library.add(self.store, safe_name)
+        info = await self.prober.probe(str(dest_path))
+        length = f" ({format_time(info.duration)})" if info and info.duration else ""
+        await status.edit(content=f"{result}{length}")
+
+    async def _ingest(
+        self, attachment: discord.Attachment, extension: str, dest_path: Path,
+        status: discord.Message
+    ) -> str:
+        """Stream an upload into the library as `dest_path` and return a status line.
+
+        The upload is written once, next to its final location, and moved into
+        place atomically. Content already in the library is linked, not stored twice.
+        """
+        safe_name = dest_path.stem
+
+        async def report(action: str, ratio: float):
+            try:
+                await status.edit(content=f"{action} `{safe_name}`: {ratio:.0%}")
+            except discord.HTTPException:
+                pass
+
+        staged = self.library_path / f"{safe_name}.upload{extension}.part"
+        try:
+            digest = await download(
+                self.session, attachment.url, staged,
+                await self.config.max_upload_mb() * 1024 * 1024, attachment.size,
+                lambda ratio: report("⬇️ Downloading", ratio),
+            )
+            existing = await self.store.find_upload(digest)
+            existing_path = self.library_path / f"{existing}.mp3" if existing else None
+            if existing_path and await asyncio.to_thread(existing_path.is_file):
+                await asyncio.to_thread(link_into, existing_path, dest_path)
+                await self.store.record_upload(digest, safe_name)
+                return f"🔗 Added `{safe_name}`, the same audio as `{existing}`."
+
+            max_minutes = await self.config.max_track_minutes()
+            info = await self.prober.inspect(staged)
+            if info and info.duration and info.duration > max_minutes * 60:
+                raise IngestError(f"tracks are limited to {max_minutes} minutes")
+
+            if extension == ".mp3":
+                await asyncio.to_thread(os.replace, staged, dest_path)
             else:
-                # Save MP3 directly
-                shutil.copy(temp_input_path, dest_path)
+                waiting = self.transcoder.pending
+                await status.edit(
+                    content=f"⏳ Queued `{safe_name}` for processing"
+                    + (f" ({waiting} ahead of it)." if waiting else ".")
+                )
+                await self.transcoder.submit(
+                    staged, dest_path, lambda ratio: report("🔄 Processing", ratio)
+                )
+        except OSError as e:
+            raise IngestError(f"could not write the track: {e}") from e
+        finally:
+            await asyncio.to_thread(staged.unlink, True)
+
+        await self.store.record_upload(digest, safe_name)
+        return f"Added `{safe_name}` to the jukebox."
+
+    @jukebox.command(name="limits")
+    @commands.is_owner()
+    async def limits(
+        self, ctx: commands.Context, upload_mb: Optional[int] = None,
+        minutes: Optional[int] = None
+    ):
+        """Show or set the largest upload in MB and the longest track in minutes."""
+        if upload_mb is None:
+            await ctx.send(
+                f"📏 Uploads up to `{await self.config.max_upload_mb()}` MB and "
+                f"`{await self.config.max_track_minutes()}` minutes."
+            )
+            return
+
+        if upload_mb < 1 or (minutes is not None and minutes < 1):
+            await ctx.send("Limits must be at least 1.")
+            return
+
+        await self.config.max_upload_mb.set(upload_mb)
+        if minutes is not None:
+            await self.config.max_track_minutes.set(minutes)
+        await ctx.send(
+            f"✅ Uploads limited to `{upload_mb}` MB and "
+            f"`{await self.config.max_track_minutes()}` minutes."
+        )
+
+    @jukebox.command(name="workers")
+    @commands.is_owner()
+    async def workers(self, ctx: commands.Context, count: Optional[int] = None):
+        """Show or set how many uploads may be converted at once."""
+        if count is None:
+            await ctx.send(
+                f"⚙️ `{self.transcoder.workers}` conversion workers, "
+                f"`{self.transcoder.pending}` uploads waiting."
+            )
+            return
+
+        if not 1 <= count <= 16:
+            await ctx.send("Please choose between 1 and 16 workers.")
+            return
+
+        await self.config.transcode_workers.set(count)
+        self.transcoder.set_workers(count)
+        await ctx.send(f"✅ Up to `{count}` uploads will now be converted at once.")
+
+    @jukebox.command(name="ffmpeg")
+    @commands.is_owner()
+    async def ffmpeg(self, ctx: commands.Context, action: Optional[str] = None):
+        """Show which audio tools were found, or `install` ffmpeg with apt-get."""
+        caps = self.capabilities
+        if action == "install":
+            status = await ctx.send("📦 Installing ffmpeg in the background...")
+            error = await install_ffmpeg()
+            await caps.refresh()
+            if error or not caps.ffmpeg:
+                reason = error or "it still isn't on the PATH"
+                await status.edit(content=f"❌ Couldn't install ffmpeg: {reason}")
+                return
+            await status.edit(content=f"✅ ffmpeg installed at `{caps.ffmpeg}`.")
+            return
+
+        if not caps.ready.is_set():
+            await ctx.send("⏳ Still checking for ffmpeg.")
+            return
+
+        def found(value) -> str:
+            return "✅" if value else "❌"
+
+        await ctx.send(
+            f"{found(caps.ffmpeg)} ffmpeg `{caps.ffmpeg or 'not found'}`\n"
+            f"{found(caps.ffprobe)} ffprobe `{caps.ffprobe or 'not found'}`\n"
+            f"{found('libmp3lame' in caps.encoders)} MP3 encoder (uploads in other formats)\n"
+            f"{found(caps.opus)} libopus (hot-track cache)"
+        )
+
+    @jukebox.command(name="cache")
+    @commands.is_owner()
+    async def cache(self, ctx: commands.Context, size_mb: Optional[int] = None):
+        """Show the hot-track Opus cache, set its size in MB, or pass 0 to clear it."""
+        cache = self.opus_cache
+        if size_mb is None:
+            if not cache.enabled:
+                await ctx.send("⚠️ libopus isn't available, so hot tracks aren't cached.")
+                return
+            plays = cache.hits + cache.misses
+            hit_rate = f"{cache.hits / plays:.0%}" if plays else "n/a"
+            await ctx.send(
+                f"💾 `{len(cache)}` tracks using `{cache.size / 1024 / 1024:.1f}` of "
+                f"`{cache.max_bytes // 1024 // 1024}` MB, hit rate `{hit_rate}`."
+            )
+            return
 
-        await ctx.send(f"Added `{safe_name}` to the jukebox.")
+        if size_mb < 0:
+            await ctx.send("The cache size can't be negative.")
+            return
+
+        if size_mb == 0:
+            await cache.clear()
+            await ctx.send("🧹 Cleared the Opus cache.")
+            return
+
+        await self.config.opus_cache_mb.set(size_mb)
+        cache.max_bytes = size_mb * 1024 * 1024
+        await ctx.send(f"✅ Opus cache limited to `{size_mb}` MB.")
 
 
     @jukebox.command(name="play")
@@ -152,24 +479,61 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
                     break
             return
 
+        if not await self._check_ffmpeg(ctx):
+            return
+
         safe_name = sanitize_filename(name.strip())
         song_path = self.library_path / f"{safe_name}.mp3"
         if not song_path.is_file():
             await ctx.send("Song not found.")
             return
 
-        guild_id = ctx.guild.id
-        self.queue.setdefault(guild_id, []).append(str(song_path))
+        track_id = await self.library.add(self.store, safe_name)
+        self._queue(ctx.guild.id).append(track_id)
         await ctx.send(f"🎶 Queued `{safe_name}`")
 
         # Start or restart playback loop if needed
+        self._ensure_player(ctx)
+
+    async def _check_ffmpeg(self, ctx: commands.Context) -> bool:
+        """Tell the user why playback is unavailable, if it is."""
+        if not self.capabilities.ready.is_set():
+            await ctx.send("⏳ Still checking for ffmpeg, try again in a moment.")
+            return False
+        if not self.capabilities.ffmpeg:
+            await ctx.send("❌ ffmpeg isn't installed, so the jukebox can't play audio.")
+            return False
+        return True
+
+    async def _check_encoder(self, ctx: commands.Context) -> bool:
+        """Tell the user why uploads can't be converted to MP3, if they can't."""
+        if not self.capabilities.ready.is_set():
+            await ctx.send("⏳ Still checking for ffmpeg, try again in a moment.")
+            return False
+        if "libmp3lame" not in self.capabilities.encoders:
+            await ctx.send(
+                "❌ ffmpeg with the MP3 encoder isn't installed, so only MP3 files can be added."
+            )
+            return False
+        return True
+
+    def _ensure_player(self, ctx: commands.Context):
+        """Start the guild's playback loop if it isn't already running."""
+        self._start_player(ctx.guild, ctx.author.voice.channel, ctx.channel)
+
+    def _start_player(self, guild: discord.Guild, voice_channel, text_channel):
+        guild_id = guild.id
+        self.text_channels[guild_id] = text_channel.id
+        self.checkpointer.tracked.add(guild_id)
         task = self.players.get(guild_id)
-        if not task or task.done() or task.cancelled():
-            self.players[guild_id] = self.bot.loop.create_task(self._playback_loop(ctx))
+        if not task or task.done():
+            self.players[guild_id] = self.bot.loop.create_task(
+                self._playback_loop(guild, voice_channel, text_channel)
+            )
 
-    async def _cleanup_voice(self, ctx: commands.Context):
+    async def _cleanup_voice(self, guild: discord.Guild):
         """Disconnects a broken voice client if needed."""
-        vc = ctx.voice_client
+        vc = guild.voice_client
         if vc and not vc.is_connected():
             try:
                 await vc.disconnect(force=True)
@@ -180,73 +544,256 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
         vc = guild.voice_client
         return vc is not None and vc.is_connected()
 
-    async def _prepare_audio(self, guild: discord.Guild, entry):
-        """Prepare the FFmpeg audio source and return it with metadata."""
-        is_dict = isinstance(entry, dict)
-        is_tts = is_dict and entry.get("tts", False)
-        volume_override = entry.get("volume") if is_dict else None
-        volume = volume_override or await self.config.guild(guild).volume()
-
-        if is_dict and "path" in entry:
+    def _queue(self, guild_id: int) -> TrackQueue:
+        if guild_id not in self.queue:
+            self.queue[guild_id] = TrackQueue()
+        return self.queue[guild_id]
+
+    async def _pop_entry(self, guild_id: int):
+        """Take the next playable entry, validating library tracks only as they come up."""
+        queue = self.queue.get(guild_id)
+        while queue:
+            head = queue.peek()
+            if isinstance(head, PlaylistCursor):
+                track = await head.next()
+                if track is None:
+                    queue.discard_head(head)
+                    continue
+                song_path = self.library_path / f"{track}.mp3"
+            else:
+                entry = queue.popleft()
+                if not isinstance(entry, int):
+                    return entry
+                song_path = self.library.path(entry)
+            if await asyncio.to_thread(song_path.is_file):
+                return str(song_path)
+        return None
+
+    async def _prepare_track(self, entry, shared: bool = False) -> TrackedSource:
+        """Spawn and pre-buffer ffmpeg for a queue entry so it can start instantly.
+
+        Hot tracks are decoded from the Opus cache without spawning anything. With
+        `shared`, other tracks are read from a decoder other guilds may already be
+        running for the same file and offset instead of from a new ffmpeg.
+        """
+        if isinstance(entry, dict):
             song_path = entry["path"]
-            seek_time = entry.get("seek", 0)
-            ffmpeg_opts = {}
-            if seek_time:
-                ffmpeg_opts["before_options"] = f"-ss {seek_time}"
-            ffmpeg_opts["options"] = "-vn"
-            source = discord.FFmpegPCMAudio(song_path, **ffmpeg_opts)
+            seek_time = entry.get("seek", 0.0)
         else:
             song_path = entry
-            source = discord.FFmpegPCMAudio(song_path)
-
-        return source, song_path, is_tts, volume
-
-    async def _playback_loop(self, ctx: commands.Context):
-        guild = ctx.guild
-        guild_id = guild.id
-        channel = ctx.author.voice.channel
-
-        await self._cleanup_voice(ctx)
-        voice = ctx.voice_client or await channel.connect()
+            seek_time = 0.0
 
-        while True:
-            try:
-                if not self._is_connected(guild):
-                    break
+        started = time.monotonic()
+        original = await self.opus_cache.open(song_path, seek_time)
+        if original is None:
+            if shared:
+                original = await asyncio.to_thread(self.broadcast_hub.join, song_path, seek_time)
+            else:
+                original = await asyncio.to_thread(ffmpeg_source, song_path, seek_time)
+            self.metrics.ffmpeg_spawn.record(time.monotonic() - started)
+        source = TrackedSource(original, song_path, seek_time)
+        source.announce = not (isinstance(entry, dict) and entry.get("resume"))
+        # Never wait on ffprobe here: use what's cached and fill it in when known
+        source.duration = self.prober.duration(song_path)
+        self.prober.probe_soon(song_path, lambda info: setattr(source, "duration", info.duration))
+        await asyncio.to_thread(source.prime, PREFETCH_FRAMES)
+        self.metrics.first_audio.record(time.monotonic() - started)
+        return source
+
+    async def _next_source(self, guild: discord.Guild) -> Optional[discord.AudioSource]:
+        """Start the next entry's audio: a TTS clip to overlay, or a primed music deck."""
+        entry = await self._pop_entry(guild.id)
+        if entry is None:
+            return None
+        if isinstance(entry, dict) and entry.get("tts"):
+            return await asyncio.to_thread(ffmpeg_source, entry["path"])
+        return await self._prepare_track(entry, await self.config.guild(guild).broadcast())
+
+    async def _prefetch(self, guild: discord.Guild, voice, mixer: Mixer):
+        """Pre-spawn the next entry while the current one is still playing.
+
+        Returns the prepared entry if the mixer stopped while it was starting,
+        so the next mixer can open with it instead of losing it.
+        """
+        queue = self.queue[guild.id]
+        clears = queue.clears
+        source = await self._next_source(guild)
+        if source is None:
+            return None
+        if queue.clears != clears:
+            # Stopped or replaced while this one was starting
+            source.cleanup()
+            return None
+        if not voice.is_playing():
+            return source
+        if isinstance(source, TrackedSource):
+            mixer.set_next(source)
+        else:
+            mixer.add_overlay(source)
+        return None
 
-                if not self.queue.get(guild_id) or not self.queue[guild_id]:
-                    await asyncio.sleep(1)
-                    continue
+    async def _track_changed(self, guild_id: int, source, channel):
+        """Record the deck that is now audible and announce it."""
+        if source is self.now_playing.get(guild_id):
+            return
+        if source is None:
+            self.current_track[guild_id] = None
+            self.now_playing.pop(guild_id, None)
+            return
+        self.current_track[guild_id] = source.path
+        self.now_playing[guild_id] = source
+        if source.announce:
+            await channel.send(f"🎵 Now playing: `{Path(source.path).stem}`")
 
-                entry = self.queue[guild_id].pop(0)
-                source, song_path, is_tts, volume = await self._prepare_audio(guild, entry)
+    async def _playback_loop(self, guild, channel, text_channel):
+        guild_id = guild.id
 
-                self.current_track[guild_id] = song_path if song_path else None
-                if not is_tts:
-                    self.track_start_time[guild_id] = time.time()
+        await self._cleanup_voice(guild)
+        voice = guild.voice_client or await channel.connect()
 
-                transformed = discord.PCMVolumeTransformer(source, volume=volume)
-                playback_done = asyncio.Event()
+        changed = asyncio.Event()
 
-                def after_playing(error):
-                    if error:
-                        print(f"Playback error: {error}")
-                    self.bot.loop.call_soon_threadsafe(playback_done.set)
+        def signal():
+            self.bot.loop.call_soon_threadsafe(changed.set)
 
-                voice.play(transformed, after=after_playing)
+        def after_playing(error):
+            if error:
+                self.metrics.error(guild_id)
+                print(f"[Jukebox] Playback error: {error}")
+            signal()
 
-                if not is_tts and song_path:
-                    await ctx.send(f"🎵 Now playing: `{Path(song_path).stem}`")
+        mixer = None
+        ready = None  # an entry prepared for a mixer that stopped before it could play
+        while self._is_connected(guild):
+            try:
+                if mixer is None or not voice.is_playing():
+                    await self._track_changed(guild_id, None, text_channel)
+                    if ready is None:
+                        ready = await self._next_source(guild)
+                    if ready is None:
+                        mixer = None
+                        await asyncio.sleep(1)
+                        continue
+
+                    settings = self.config.guild(guild)
+                    music = ready if isinstance(ready, TrackedSource) else None
+                    mixer = Mixer(music, await settings.volume(), await settings.crossfade())
+                    mixer.on_track_change = signal
+                    mixer.stats = self.metrics.stream(guild_id)
+                    if music is None:
+                        mixer.add_overlay(ready)
+                    ready = None
+                    changed.clear()
+                    voice.play(mixer, after=after_playing)
+                    await self._track_changed(guild_id, mixer.music, text_channel)
+
+                elif mixer.music is not None and mixer.next is None and self.queue.get(guild_id):
+                    # A mixer with only TTS on it is left to finish first, so the
+                    # entries after it play in order rather than over it
+                    ready = await self._prefetch(guild, voice, mixer)
+                    continue
 
-                await playback_done.wait()
-                self.current_track[guild_id] = None
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=1)
+                except asyncio.TimeoutError:
+                    continue
+                changed.clear()
+                if voice.is_playing():
+                    await self._track_changed(guild_id, mixer.music, text_channel)
 
             except Exception as e: # pylint: disable=broad-exception-caught
+                self.metrics.error(guild_id)
                 print(f"[Jukebox] Playback error: {e}")
                 continue
 
+        if ready is not None:
+            ready.cleanup()
+        await self._track_changed(guild_id, None, text_channel)
         self.players.pop(guild.id, None)
 
+    async def _metrics_snapshot(self) -> dict:
+        """Everything `jukebox stats` reports, as plain JSON-serializable data."""
+        active = {
+            guild_id for guild_id, task in self.players.items() if not task.done()
+        }
+        guilds = {}
+        for guild_id in active | set(self.metrics.streams):
+            stream = self.metrics.stream(guild_id).to_dict()
+            stream["active"] = guild_id in active
+            stream["queued"] = len(self.queue.get(guild_id) or ())
+            guilds[str(guild_id)] = stream
+        return {
+            "time": time.time(),
+            "active_streams": len(active),
+            "errors": self.metrics.errors,
+            "ffmpeg_spawn": self.metrics.ffmpeg_spawn.to_dict(),
+            "first_audio": self.metrics.first_audio.to_dict(),
+            "tts_synthesis": self.tts_cache.latency.to_dict(),
+            "transcodes_pending": self.transcoder.pending,
+            "capabilities": self.capabilities.to_dict(),
+            "broadcast": self.broadcast_hub.stats(),
+            "opus_cache": {
+                "enabled": self.opus_cache.enabled,
+                "tracks": len(self.opus_cache),
+                "size_mb": round(self.opus_cache.size / 1024 / 1024, 1),
+                "hits": self.opus_cache.hits,
+                "misses": self.opus_cache.misses,
+            },
+            "ffmpeg_processes": await asyncio.to_thread(ffmpeg_processes),
+            "process": await asyncio.to_thread(own_usage),
+            "guilds": guilds,
+        }
+
+    @jukebox.command(name="stats")
+    @commands.is_owner()
+    async def stats(self, ctx: commands.Context, dump: Optional[str] = None):
+        """Show stream and ffmpeg statistics, or pass `json` for the full metrics dump."""
+        snapshot = await self._metrics_snapshot()
+        if dump == "json":
+            data = json.dumps(snapshot, indent=2).encode()
+            await ctx.send(file=discord.File(io.BytesIO(data), filename="jukebox_metrics.json"))
+            return
+
+        def latency(stats: dict) -> str:
+            if not stats["count"]:
+                return "n/a"
+            return f"p50 {stats['p50_ms']}ms / p95 {stats['p95_ms']}ms"
+
+        processes = snapshot["ffmpeg_processes"]
+        lines = [
+            "**Jukebox Stats**",
+            f"🎧 Active streams: `{snapshot['active_streams']}`, errors: `{snapshot['errors']}`",
+            f"⚙️ ffmpeg processes: `{len(processes)}` using "
+            f"`{sum(p['cpu_seconds'] for p in processes):.1f}` CPU s, "
+            f"`{sum(p['rss_mb'] for p in processes):.1f}` MB RSS",
+            f"🖥️ Bot process: `{snapshot['process']['cpu_seconds']:.1f}` CPU s, "
+            f"`{snapshot['process']['rss_mb']:.1f}` MB RSS",
+            f"🚀 ffmpeg spawn: `{latency(snapshot['ffmpeg_spawn'])}`, "
+            f"first audio: `{latency(snapshot['first_audio'])}`",
+            f"🗣️ TTS synthesis: `{latency(snapshot['tts_synthesis'])}`",
+            f"📡 Shared decoders: `{snapshot['broadcast']['decoders']}` serving "
+            f"`{snapshot['broadcast']['listeners']}` decks "
+            f"(`{snapshot['broadcast']['shared_joins']}` joins so far)",
+            f"💾 Opus cache: `{snapshot['opus_cache']['tracks']}` tracks, "
+            f"`{snapshot['opus_cache']['hits']}` hits, "
+            f"`{snapshot['opus_cache']['misses']}` misses",
+        ]
+        for guild_id, stream in snapshot["guilds"].items():
+            if not stream["active"]:
+                continue
+            guild = self.bot.get_guild(int(guild_id))
+            lines.append(
+                f"• `{guild.name if guild else guild_id}`: {stream['queued']} queued, "
+                f"{stream['frames_sent']} frames sent, {stream['frames_late']} late, "
+                f"{stream['underruns']} underruns"
+            )
+        if len(lines) > STATS_LINES:
+            hidden = len(lines) - STATS_LINES + 1
+            lines = lines[:STATS_LINES - 1]
+            lines.append(f"…and {hidden} more guilds; use `{ctx.clean_prefix}jukebox stats json`.")
+        for page in pagify("\n".join(lines)):
+            await ctx.send(page)
+
     @jukebox.command(name="volume")
     async def volume(self, ctx: commands.Context, value: Optional[float] = None):
         """Change the playback volume."""
@@ -261,11 +808,44 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
 
         await self.config.guild(ctx.guild).volume.set(value)
         vc = ctx.voice_client
-        if vc and vc.source and isinstance(vc.source, discord.PCMVolumeTransformer):
+        if vc and isinstance(vc.source, Mixer):
             vc.source.volume = value
 
         await ctx.send(f"✅ Volume set to `{value:.2f}`")
 
+    @jukebox.command(name="crossfade")
+    async def crossfade(self, ctx: commands.Context, seconds: Optional[float] = None):
+        """Show or set how many seconds consecutive tracks overlap (0 for gapless cuts)."""
+        if seconds is None:
+            current = await self.config.guild(ctx.guild).crossfade()
+            await ctx.send(f"🎚️ Current crossfade: `{current:.1f}s`")
+            return
+
+        if not 0.0 <= seconds <= 12.0:
+            await ctx.send("Please choose a crossfade between 0 and 12 seconds.")
+            return
+
+        await self.config.guild(ctx.guild).crossfade.set(seconds)
+        vc = ctx.voice_client
+        if vc and isinstance(vc.source, Mixer):
+            vc.source.crossfade = seconds
+
+        await ctx.send(f"✅ Crossfade set to `{seconds:.1f}s`")
+
+    @jukebox.command(name="broadcast")
+    async def broadcast(self, ctx: commands.Context, enabled: Optional[bool] = None):
+        """Show or set whether this server shares decoders with others playing the same track."""
+        if enabled is None:
+            current = await self.config.guild(ctx.guild).broadcast()
+            await ctx.send(f"📡 Shared decoding is `{'on' if current else 'off'}`.")
+            return
+
+        await self.config.guild(ctx.guild).broadcast.set(enabled)
+        await ctx.send(
+            f"✅ Shared decoding turned `{'on' if enabled else 'off'}`, "
+            "starting with the next track."
+        )
+
     @jukebox.command(name="remove")
     async def remove(self, ctx: commands.Context, *, name: str):
         """remove a file from the library."""
@@ -278,6 +858,8 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
 
         try:
             song_path.unlink()
+            self.library.discard(safe_name)
+            self.prober.forget(str(song_path))
             await ctx.send(f"Removed `{safe_name}` from the jukebox.")
         except Exception as e: # pylint: disable=broad-exception-caught
             await ctx.send(f"Failed to remove `{safe_name}`: {e}")
@@ -293,7 +875,7 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
             return
 
         # Clear queue and track
-        self.queue[guild_id] = []
+        self._queue(guild_id).clear()
         self.current_track[guild_id] = None
 
         if voice.is_playing():
@@ -310,42 +892,118 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
             await ctx.send("I'm not in a voice channel.")
             return
 
-        if not voice.is_playing():
+        if not voice.is_playing() or ctx.guild.id not in self.now_playing:
             await ctx.send("No track is currently playing.")
             return
 
-        voice.stop()
+        # The mixer hands over to the prefetched track on its next frame
+        if isinstance(voice.source, Mixer):
+            voice.source.skip()
+        else:
+            voice.stop()
         await ctx.send("⏭️ Skipped the current track.")
 
+    @jukebox.command(name="seek")
+    async def seek(self, ctx: commands.Context, position: str):
+        """Jump to a position in the current track (e.g. `1:30`, `+10`, `-15`)."""
+        voice = ctx.voice_client
+        guild_id = ctx.guild.id
+        source = self.now_playing.get(guild_id)
+
+        if (
+            voice is None or not voice.is_connected() or source is None
+            or not isinstance(voice.source, Mixer)
+        ):
+            await ctx.send("No track is currently playing.")
+            return
+
+        relative = position[:1] if position[:1] in "+-" else ""
+        offset = parse_timestamp(position.lstrip("+-"))
+        if offset is None:
+            await ctx.send("Use a position like `90`, `1:30`, `+10` or `-15`.")
+            return
+
+        target = source.position
+        if relative == "+":
+            target += offset
+        elif relative == "-":
+            target -= offset
+        else:
+            target = offset
+
+        if not math.isfinite(target):
+            await ctx.send("Use a position like `90`, `1:30`, `+10` or `-15`.")
+            return
+        duration = source.duration or self.prober.duration(source.path)
+        if duration is not None and target >= duration:
+            await ctx.send(f"That is past the end of the track (`{format_time(duration)}`).")
+            return
+        target = max(0.0, target)
+
+        replacement = await self._prepare_track({
+            "path": source.path,
+            "seek": target,
+            "resume": True
+        }, await self.config.guild(ctx.guild).broadcast())
+        voice.source.replace(replacement)
+        await self._track_changed(guild_id, replacement, ctx.channel)
+        await ctx.send(f"⏩ Seeking to `{format_time(target)}`.")
+
     @jukebox.command(name="queue")
-    async def queue(self, ctx: commands.Context):
+    async def queue(self, ctx: commands.Context): # pylint: disable=too-many-locals
         """Display the currently playing track and the rest of the queue."""
         guild_id = ctx.guild.id
 
         now_playing = None
+        duration = None
         if guild_id in self.current_track and self.current_track[guild_id]:
             now_playing = Path(self.current_track[guild_id]).stem
+            duration = self.prober.duration(self.current_track[guild_id])
 
-        queue_entries = self.queue.get(guild_id, [])
+        queue = self._queue(guild_id)
+        voice = ctx.voice_client
+        prefetched = None
+        if voice and isinstance(voice.source, Mixer) and voice.source.next is not None:
+            prefetched = voice.source.next.path
+        total = len(queue) + (prefetched is not None)
 
-        if not now_playing and not queue_entries:
+        if not now_playing and not total:
             await ctx.send("📭 Nothing is currently playing and the queue is empty.")
             return
 
-        pages = list(chunk_list(queue_entries, 10))
+        page_count = max(1, math.ceil(total / 10))
         current = 0
+        queue_time, exact = self._queue_time(queue, prefetched)
+        queue_time_text = format_time(queue_time) + ("" if exact else "+")
+
+        def page_entries(index):
+            # The prefetched track has already left the queue but still plays next
+            start = index * 10
+            if prefetched is None:
+                return queue.page(start, 10)
+            if start == 0:
+                return [prefetched, *queue.page(0, 9)]
+            return queue.page(start - 1, 10)
 
         def format_page(index):
             lines = []
             if now_playing:
                 lines.append(f"▶️ **Now Playing:** `{now_playing}`")
-            if queue_entries:
-                lines.append("🎶 **Up Next:**")
-                lines.extend(f"`{Path(track).stem}`" for track in pages[index])
-            return f"**Jukebox Queue** (Page {index + 1}/{len(pages)})\n" + "\n".join(lines)
+                source = self.now_playing.get(guild_id)
+                if source is not None:
+                    lines.append(progress_bar(source.position, duration))
+            if total:
+                lines.append(f"🎶 **Up Next** ({total}, `{queue_time_text}` total):")
+                for track in page_entries(index):
+                    length = self.prober.duration(_entry_path(track, self.library))
+                    lines.append(
+                        f"`{_entry_label(track, self.library)}`"
+                        + (f" `{format_time(length)}`" if length else "")
+                    )
+            return f"**Jukebox Queue** (Page {index + 1}/{page_count})\n" + "\n".join(lines)
 
         message = await ctx.send(format_page(current))
-        if len(pages) > 1:
+        if page_count > 1:
             await message.add_reaction("⬅️")
             await message.add_reaction("➡️")
 
@@ -368,7 +1026,7 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
 
                     if str(reaction.emoji) == "⬅️" and current > 0:
                         current -= 1
-                    elif str(reaction.emoji) == "➡️" and current < len(pages) - 1:
+                    elif str(reaction.emoji) == "➡️" and current < page_count - 1:
                         current += 1
 
                     await message.edit(content=format_page(current))
@@ -376,6 +1034,63 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
                     break
 
 
+    def _queue_time(self, queue: TrackQueue, prefetched: Optional[str]) -> tuple[float, bool]:
+        """Total cached duration of what's queued, and whether every entry was known.
+
+        Unknown tracks are probed in the background so the next call can count them.
+        """
+        entries = queue.page(0, min(len(queue), QUEUE_TIME_LIMIT))
+        if prefetched is not None:
+            entries.insert(0, prefetched)
+        exact = len(queue) <= QUEUE_TIME_LIMIT
+        seconds = 0.0
+        missing = []
+        for entry in entries:
+            path = _entry_path(entry, self.library)
+            length = self.prober.duration(path) if path else None
+            if length is None:
+                exact = False
+                if path and self.prober.cached(path) is None:
+                    missing.append(path)
+            else:
+                seconds += length
+        self.prober.prefetch(missing)
+        return seconds, exact
+
+    @jukebox.command(name="search")
+    async def search(self, ctx: commands.Context, *, query: str):
+        """Find library tracks by name, title, artist or album."""
+        needle = query.casefold()
+        results = []
+        for track_id in self.library.snapshot:
+            name = self.library.name(track_id)
+            path = str(self.library.path(track_id))
+            info = self.prober.cached(path)
+            fields = [name]
+            if info is not None:
+                fields += [info.tags.get(key, "") for key in ("title", "artist", "album")]
+            if any(needle in field.casefold() for field in fields):
+                results.append((name, info))
+            if len(results) > 10:
+                break
+
+        if not results:
+            await ctx.send(f"🔍 No tracks match `{query}`.")
+            return
+
+        lines = [f"🔍 **Results for** `{query}`:"]
+        for name, info in results[:10]:
+            details = []
+            if info is not None:
+                if info.tags.get("artist"):
+                    details.append(info.tags["artist"])
+                if info.duration:
+                    details.append(format_time(info.duration))
+            lines.append(f"`{name}`" + (f" ({', '.join(details)})" if details else ""))
+        if len(results) > 10:
+            lines.append("…and more; try a longer search.")
+        await ctx.send("\n".join(lines))
+
     @jukebox.command(name="shuffle")
     async def shuffle(self, ctx: commands.Context):
         """Shuffle and queue all tracks from the jukebox library."""
@@ -383,18 +1098,22 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
             await ctx.send("Join a voice channel first.")
             return
 
+        if not await self._check_ffmpeg(ctx):
+            return
+
         guild = ctx.guild
         guild_id = guild.id
-        songs = list(self.library_path.glob("*.mp3"))
+        await self.library.refresh(self.store)
+        songs = self.library.snapshot
 
         if not songs:
             await ctx.send("📭 The jukebox library is empty.")
             return
 
-        random.shuffle(songs)
-
-        # Replace or append to the existing queue
-        self.queue[guild_id] = [str(song) for song in songs]
+        # Replace the existing queue with a lazily shuffled pass over the library
+        queue = self._queue(guild_id)
+        queue.clear()
+        queue.append(ShuffleSegment(songs, random.getrandbits(64)))
         await ctx.send(f"🔀 Queued `{len(songs)}` songs in random order.")
 
         # Optional: move bot to the right channel if already connected
@@ -403,25 +1122,10 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
             await voice.move_to(ctx.author.voice.channel)
 
         # Start or restart playback loop if needed
-        task = self.players.get(guild_id)
-        if not task or task.done() or task.cancelled():
-            self.players[guild_id] = self.bot.loop.create_task(self._playback_loop(ctx))
+        self._ensure_player(ctx)
 
-    def _get_playlist_file(self, name: str) -> Path:
-        safe_name = sanitize_filename(name.strip().lower())
-        return self.playlist_path / f"{safe_name}.json"
-
-    def _load_playlist(self, name: str) -> list[str]:
-        path = self._get_playlist_file(name)
-        if not path.is_file():
-            return []
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-
-    def _save_playlist(self, name: str, songs: list[str]):
-        path = self._get_playlist_file(name)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(songs, f)
+    def _playlist_key(self, name: str) -> str:
+        return sanitize_filename(name.strip().lower())
 
     @jukebox.group(name="playlist",invoke_without_command=True)
     async def playlist(self, ctx: commands.Context):
@@ -432,24 +1136,21 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
     @playlist.command(name="create")
     async def playlist_create(self, ctx: commands.Context, name: str):
         """Create a new playlist."""
-        path = self._get_playlist_file(name)
-        if path.exists():
+        if not await self.store.create_playlist(self._playlist_key(name)):
             await ctx.send(f"❌ Playlist `{name}` already exists.")
             return
-        self._save_playlist(name, [])
         await ctx.send(f"✅ Created new playlist `{name}`.")
 
     @playlist.command(name="add")
     async def playlist_add(self, ctx: commands.Context, name: str, *, song_name: str):
         """Add a new track to a playlist from the library."""
-        song_path = self.library_path / f"{sanitize_filename(song_name)}.mp3"
+        safe_name = sanitize_filename(song_name.strip())
+        song_path = self.library_path / f"{safe_name}.mp3"
         if not song_path.exists():
             await ctx.send(f"❌ Song `{song_name}` not found in the jukebox library.")
             return
 
-        playlist = self._load_playlist(name)
-        playlist.append(str(song_path))
-        self._save_playlist(name, playlist)
+        await self.store.append(self._playlist_key(name), safe_name)
         await ctx.send(f"✅ Added `{song_name}` to playlist `{name}`.")
 
     @playlist.command(name="play")
@@ -459,8 +1160,12 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
             await ctx.send("Join a voice channel first.")
             return
 
-        playlist_data = self._load_playlist(name)
-        if not playlist_data:
+        if not await self._check_ffmpeg(ctx):
+            return
+
+        key = self._playlist_key(name)
+        length = await self.store.playlist_length(key)
+        if not length:
             await ctx.send(f"❌ Playlist `{name}` is empty or does not exist.")
             return
 
@@ -480,61 +1185,52 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
             voice.stop()
 
         # Clear queue and current track safely
-        self.queue[guild_id] = []
+        queue = self._queue(guild_id)
+        queue.clear()
         self.current_track[guild_id] = None
 
-        # Add valid songs to queue
-        for song_path in playlist_data:
-            if Path(song_path).is_file():
-                self.queue[guild_id].append(song_path)
+        # Tracks are read and checked just in time, so the first one starts immediately
+        queue.append(PlaylistCursor(self.store, key, length))
 
-        await ctx.send(f"▶️ Playing playlist `{name}` with `{len(self.queue[guild_id])}` tracks.")
+        await ctx.send(f"▶️ Playing playlist `{name}` with `{length}` tracks.")
 
         # Start or restart playback loop
-        task = self.players.get(guild_id)
-        if not task or task.done() or task.cancelled():
-            self.players[guild_id] = self.bot.loop.create_task(self._playback_loop(ctx))
+        self._ensure_player(ctx)
 
     @playlist.command(name="delete")
     async def playlist_delete(self, ctx: commands.Context, name: str):
         """Delete a playlist."""
-        path = self._get_playlist_file(name)
-        if not path.exists():
+        if not await self.store.delete_playlist(self._playlist_key(name)):
             await ctx.send(f"❌ Playlist `{name}` does not exist.")
             return
-
-        try:
-            path.unlink()
-            await ctx.send(f"🗑️ Deleted playlist `{name}`.")
-        except Exception as e: # pylint: disable=broad-exception-caught
-            await ctx.send(f"⚠️ Failed to delete playlist `{name}`: {e}")
+        await ctx.send(f"🗑️ Deleted playlist `{name}`.")
 
     @playlist.command(name="remove")
     async def playlist_remove(self, ctx: commands.Context, name: str, *, track_name: str):
         """Remove a track from a playlist."""
-        playlist = self._load_playlist(name)
-        if not playlist:
+        key = self._playlist_key(name)
+        if not await self.store.playlist_length(key):
             await ctx.send(f"❌ Playlist `{name}` is empty or does not exist.")
             return
 
-        # Match by sanitized stem
-        sanitized = sanitize_filename(track_name.strip().lower())
-        for i, path in enumerate(playlist):
-            if Path(path).stem.lower() == sanitized:
-                removed = playlist.pop(i)
-                self._save_playlist(name, playlist)
-                await ctx.send(f"❎ Removed `{Path(removed).stem}` from playlist `{name}`.")
-                return
+        # Match by sanitized name, ignoring case
+        removed = await self.store.remove(key, sanitize_filename(track_name.strip()))
+        if removed is not None:
+            await ctx.send(f"❎ Removed `{removed}` from playlist `{name}`.")
+            return
 
         await ctx.send(f"❌ Track `{track_name}` not found in playlist `{name}`.")
 
     @commands.command(name="tts")
     async def say(self, ctx: commands.Context, *, text: str):
-        """Speak a TTS message, then resume the current track from the same position."""
+        """Speak a TTS message over the current track, ducking the music while it plays."""
         if not ctx.author.voice or not ctx.author.voice.channel:
             await ctx.send("You must be in a voice channel for me to speak.")
             return
 
+        if not await self._check_ffmpeg(ctx):
+            return
+
         guild = ctx.guild
         guild_id = guild.id
         voice = guild.voice_client
@@ -545,55 +1241,35 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
         else:
             voice = await ctx.author.voice.channel.connect()
 
-        current_track = self.current_track.get(guild_id)
-        queue = self.queue.setdefault(guild_id, [])
-
-        # Estimate current playback position
-        current_pos = 0
-        if current_track and guild_id in self.track_start_time:
-            current_pos = time.time() - self.track_start_time[guild_id]
-            current_pos = max(0, int(current_pos))
-
         # Get TTS voice
         tts_voice = await self.config.user(ctx.author).tts_voice()
         if not tts_voice:
-            tts_voice = "en-US-AriaNeural"
+            tts_voice = DEFAULT_TTS_VOICE
 
-        # Generate TTS audio using edge-tts
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as f:
-            tts_path = f.name
+        # Cached clips play instantly; anything new is synthesized once
         try:
-            communicate = edge_tts.Communicate(text, tts_voice)
-            await communicate.save(tts_path)
-        except Exception as e: # pylint: disable=broad-exception-caught
-            os.unlink(tts_path)
+            tts_path = str(await self.tts_cache.get(text, tts_voice))
+        except TTSError as e:
             await ctx.send(f"❌ TTS generation failed: {e}")
             return
 
-        # Queue TTS at front
-        queue.insert(0, {
-            "path": tts_path,
-            "tts": True,
-            "volume": 1.0
-        })
-
-        # Requeue interrupted track if appropriate
-        if current_track and not isinstance(current_track, dict):
-            queue.insert(1, {
-                "path": current_track,
-                "tts": True,
-                "seek": current_pos
+        # Mix over whatever is playing; otherwise the message is next in line
+        overlay = None
+        if voice.is_playing() and isinstance(voice.source, Mixer):
+            overlay = await asyncio.to_thread(ffmpeg_source, tts_path)
+        # Playback may have ended while ffmpeg was starting
+        if overlay and voice.is_playing() and isinstance(voice.source, Mixer):
+            voice.source.add_overlay(overlay)
+        else:
+            if overlay:
+                overlay.cleanup()
+            self._queue(guild_id).appendleft({
+                "path": tts_path,
+                "tts": True
             })
-            self.current_track[guild_id] = None
-
-        # Stop current audio to trigger playback loop
-        if voice.is_playing():
-            voice.stop()
 
         # Ensure playback loop is running
-        task = self.players.get(guild_id)
-        if not task or task.done() or task.cancelled():
-            self.players[guild_id] = self.bot.loop.create_task(self._playback_loop(ctx))
+        self._ensure_player(ctx)
 
         try:
             await ctx.message.add_reaction("🗣️")
@@ -614,3 +1290,30 @@ class Jukebox(commands.Cog): # pylint: disable=too-many-instance-attributes
 
         await self.config.user(ctx.author).tts_voice.set(voice)
         await ctx.send(f"✅ TTS voice set to `{voice}`")
+
+    @commands.command(name="ttscache")
+    @commands.is_owner()
+    async def ttscache(self, ctx: commands.Context, size_mb: Optional[int] = None):
+        """Show TTS cache usage, set its size in MB, or pass 0 to clear it."""
+        cache = self.tts_cache
+        if size_mb is None:
+            lookups = cache.hits + cache.misses
+            hit_rate = f"{cache.hits / lookups:.0%}" if lookups else "n/a"
+            await ctx.send(
+                f"🗃️ `{len(cache)}` clips using `{cache.size / 1024 / 1024:.1f}` of "
+                f"`{cache.max_bytes // 1024 // 1024}` MB, hit rate `{hit_rate}`."
+            )
+            return
+
+        if size_mb < 0:
+            await ctx.send("The cache size can't be negative.")
+            return
+
+        if size_mb == 0:
+            await cache.clear()
+            await ctx.send("🧹 Cleared the TTS cache.")
+            return
+
+        await self.config.tts_cache_mb.set(size_mb)
+        cache.max_bytes = size_mb * 1024 * 1024
+        await ctx.send(f"✅ TTS cache limited to `{size_mb}` MB.")
@@ -0,0 +1,180 @@
+"""Counters and latency samples for capacity planning of the jukebox's voice nodes."""
+
+import os
+import time
+from collections import deque
+from typing import Optional
+
+# psutil is optional; without it process stats are read from /proc on Linux
+try:
+    import psutil
+    HAS_PSUTIL = True
+except (ImportError, ModuleNotFoundError):
+    HAS_PSUTIL = False
+
+FRAME_DEADLINE = 0.02  # a frame that takes longer than its own length to produce is late
+SAMPLES = 256          # latency samples kept for percentiles
+
+
+class Latency:
+    """Running count, mean and max of a latency, plus recent samples for percentiles."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent: deque[float] = deque(maxlen=SAMPLES)
+
+    def record(self, seconds: float):
+        """Add one sample."""
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self._recent.append(seconds)
+
+    def percentile(self, ratio: float) -> Optional[float]:
+        """The `ratio` percentile of the recent samples, or None before the first one."""
+        if not self._recent:
+            return None
+        ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, int(ratio * len(ordered)))]
+
+    def to_dict(self) -> dict:
+        """Summary in milliseconds."""
+        def ms(value: Optional[float]) -> Optional[float]:
+            return None if value is None else round(value * 1000, 1)
+        return {
+            "count": self.count,
+            "mean_ms": ms(self.total / self.count) if self.count else None,
+            "p50_ms": ms(self.percentile(0.5)),
+            "p95_ms": ms(self.percentile(0.95)),
+            "max_ms": ms(self.max) if self.count else None,
+        }
+
+
+class StreamStats:
+    """Frame counters for one guild's stream, updated from the voice player thread.
+
+    Only plain integer increments happen on that thread, so no lock is needed and
+    the cost per 20 ms frame is a few clock reads.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.frames_sent = 0
+        self.frames_late = 0   # took longer than a frame to produce; listeners hear a gap
+        self.underruns = 0     # the music deck blocked past the deadline waiting on ffmpeg
+        self.errors = 0
+        self.tracks = 0
+
+    def frame(self, elapsed: float, decode: float, new_track: bool = False):
+        """Record one frame that took `elapsed` seconds, `decode` of them reading music."""
+        self.frames_sent += 1
+        if new_track:
+            self.tracks += 1
+        if elapsed > FRAME_DEADLINE:
+            self.frames_late += 1
+        if decode > FRAME_DEADLINE:
+            self.underruns += 1
+
+    def to_dict(self) -> dict:
+        """Counters plus stream uptime in seconds."""
+        return {
+            "uptime": round(time.monotonic() - self.started, 1),
+            "tracks": self.tracks,
+            "frames_sent": self.frames_sent,
+            "frames_late": self.frames_late,
+            "underruns": self.underruns,
+            "errors": self.errors,
+        }
+
+
+class JukeboxMetrics:
+    """Everything the cog measures, keyed by guild where it applies."""
+
+    def __init__(self):
+        self.streams: dict[int, StreamStats] = {}
+        self.ffmpeg_spawn = Latency()   # Popen until ffmpeg is running
+        self.first_audio = Latency()    # Popen until the first frames are decoded
+        self.errors = 0
+
+    def stream(self, guild_id: int) -> StreamStats:
+        """The stats for a guild, created on first use."""
+        if guild_id not in self.streams:
+            self.streams[guild_id] = StreamStats()
+        return self.streams[guild_id]
+
+    def error(self, guild_id: Optional[int] = None):
+        """Count an error, attributed to a guild's stream when known."""
+        self.errors += 1
+        if guild_id is not None:
+            self.stream(guild_id).errors += 1
+
+
+def ffmpeg_processes() -> list[dict]:
+    """CPU seconds and RSS of every ffmpeg child of this process."""
+    if HAS_PSUTIL:
+        processes = []
+        for child in psutil.Process().children():
+            try:
+                if child.name() != "ffmpeg":
+                    continue
+                cpu = child.cpu_times()
+                processes.append({
+                    "pid": child.pid,
+                    "cpu_seconds": round(cpu.user + cpu.system, 2),
+                    "rss_mb": round(child.memory_info().rss / 1024 / 1024, 1),
+                })
+            except psutil.Error:
+                continue
+        return processes
+    return _proc_children("ffmpeg")
+
+
+def _proc_children(name: str) -> list[dict]:
+    """Fallback for `ffmpeg_processes` that parses /proc directly."""
+    if not os.path.isdir("/proc"):
+        return []
+    parent = os.getpid()
+    ticks = os.sysconf("SC_CLK_TCK")
+    page_mb = os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    processes = []
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat", "r", encoding="utf-8") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name is in parentheses and may itself contain spaces
+        comm = stat[stat.find("(") + 1:stat.rfind(")")]
+        fields = stat[stat.rfind(")") + 2:].split()
+        if comm != name or int(fields[1]) != parent:
+            continue
+        processes.append({
+            "pid": int(pid),
+            "cpu_seconds": round((int(fields[11]) + int(fields[12])) / ticks, 2),
+            "rss_mb": round(int(fields[21]) * page_mb, 1),
+        })
+    return processes
+
+
+def own_usage() -> dict:
+    """CPU seconds and RSS of the bot process itself."""
+    if HAS_PSUTIL:
+        process = psutil.Process()
+        cpu = process.cpu_times()
+        rss = process.memory_info().rss
+    else:
+        cpu = os.times()
+        rss = 0
+        try:
+            with open("/proc/self/statm", "r", encoding="utf-8") as f:
+                rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            pass
+    return {
+        "cpu_seconds": round(cpu.user + cpu.system, 2),
+        "rss_mb": round(rss / 1024 / 1024, 1),
+    }
@@ -0,0 +1,214 @@
+"""Pre-encoded Opus packets for frequently played tracks, read through mmap."""
+
+import asyncio
+import hashlib
+import mmap
+import os
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import discord
+
+DEFAULT_OPUS_CACHE_MB = 256
+HOT_PLAYS = 2  # a track is encoded into the cache on its second play
+FRAMES_PER_SECOND = 50
+
+
+def opus_available() -> bool:
+    """Whether libopus can be loaded for in-process encoding and decoding."""
+    try:
+        discord.opus.Decoder()
+    except discord.opus.OpusNotLoaded:
+        return False
+    return True
+
+
+class CachedOpusSource(discord.AudioSource):
+    """Plays a cached track by decoding its packets in-process, no ffmpeg involved.
+
+    The packet data is memory-mapped, so the OS page cache shares it between
+    every guild playing the track, and `offsets` lets playback start at any frame.
+    """
+
+    def __init__(self, data: mmap.mmap, offsets: array, frame: int = 0):
+        self.data = data
+        self.offsets = offsets
+        self.frame = frame
+        self._decoder = discord.opus.Decoder()
+
+    def read(self) -> bytes:
+        if self.frame + 1 >= len(self.offsets):
+            return b""
+        start, end = self.offsets[self.frame], self.offsets[self.frame + 1]
+        self.frame += 1
+        return self._decoder.decode(self.data[start:end])
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        if not self.data.closed:
+            self.data.close()
+
+
+class OpusCache:  # pylint: disable=too-many-instance-attributes
+    """Opus packets per track, keyed by file identity and evicted least recently used.
+
+    Each entry is `<key>.opus` holding the packets back to back and `<key>.idx`
+    holding their byte offsets. Unlinking a file that is still being played is
+    safe because an open mapping keeps its pages alive.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = False
+        self.hits = 0
+        self.misses = 0
+        self.plays: dict[str, int] = {}
+        self._index: OrderedDict[str, int] = OrderedDict()  # key: bytes on disk
+        self._building: set[str] = set()
+        self._builder = asyncio.Lock()  # encode one track at a time
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def size(self) -> int:
+        """Total bytes of cached packets and indexes."""
+        return sum(self._index.values())
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    async def load(self):
+        """Index existing entries and delete partial files left by an interrupted run."""
+        self.enabled = await asyncio.to_thread(opus_available)
+        await asyncio.to_thread(self.directory.mkdir, parents=True, exist_ok=True)
+        self._index = OrderedDict(await asyncio.to_thread(self._scan))
+        await self._evict()
+
+    def _scan(self) -> list[tuple[str, int]]:
+        entries = []  # (key, size, mtime)
+        for path in self.directory.iterdir():
+            if path.suffix == ".part":
+                path.unlink(missing_ok=True)
+            elif path.suffix == ".idx":
+                data = path.with_suffix(".opus")
+                try:
+                    size = path.stat().st_size + data.stat().st_size
+                    entries.append((path.stem, size, data.stat().st_mtime))
+                except OSError:
+                    path.unlink(missing_ok=True)
+            elif path.suffix == ".opus" and not path.with_suffix(".idx").exists():
+                path.unlink(missing_ok=True)
+        entries.sort(key=lambda item: item[2])
+        return [(key, size) for key, size, _ in entries]
+
+    async def close(self):
+        """Stop any encoding in progress."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    @staticmethod
+    async def _key(path: str) -> Optional[str]:
+        try:
+            stat = await asyncio.to_thread(os.stat, path)
+        except OSError:
+            return None
+        return hashlib.sha1(f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}".encode()).hexdigest()
+
+    async def open(self, path: str, seek: float = 0.0) -> Optional[CachedOpusSource]:
+        """A source for `path` from the cache, or None after counting the play as a miss.
+
+        Tracks reaching `HOT_PLAYS` misses are encoded into the cache in the background.
+        """
+        if not self.enabled:
+            return None
+        key = await self._key(path)
+        if key is None:
+            return None
+        if key in self._index:
+            self._index.move_to_end(key)
+            try:
+                source = await asyncio.to_thread(self._map, key, seek)
+            except (OSError, ValueError):
+                self._index.pop(key, None)
+            else:
+                self.hits += 1
+                return source
+
+        self.misses += 1
+        self.plays[path] = self.plays.get(path, 0) + 1
+        if self.plays[path] >= HOT_PLAYS and key not in self._building:
+            self._building.add(key)
+            task = asyncio.create_task(self._build(path, key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return None
+
+    def _map(self, key: str, seek: float) -> CachedOpusSource:
+        offsets = array("Q")
+        offsets.frombytes((self.directory / f"{key}.idx").read_bytes())
+        with open(self.directory / f"{key}.opus", "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        frame = min(round(seek * FRAMES_PER_SECOND), len(offsets) - 1)
+        return CachedOpusSource(data, offsets, frame)
+
+    async def _build(self, path: str, key: str):
+        try:
+            async with self._builder:
+                size = await asyncio.to_thread(self._encode, path, key)
+            self._index[key] = size
+            self.plays.pop(path, None)
+            await self._evict()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(f"[Jukebox] Opus cache error for {path}: {e}")
+        finally:
+            self._building.discard(key)
+
+    def _encode(self, path: str, key: str) -> int:
+        """Decode `path` with ffmpeg once and store it as Opus packets. Runs in a thread."""
+        data_path = self.directory / f"{key}.opus"
+        index_path = self.directory / f"{key}.idx"
+        data_part = data_path.with_name(f"{key}.opus.part")
+        index_part = index_path.with_name(f"{key}.idx.part")
+        source = discord.FFmpegPCMAudio(path, options="-vn")
+        encoder = discord.opus.Encoder()
+        offsets = array("Q", [0])
+        try:
+            with open(data_part, "wb") as f:
+                while pcm := source.read():
+                    packet = encoder.encode(pcm, encoder.SAMPLES_PER_FRAME)
+                    f.write(packet)
+                    offsets.append(offsets[-1] + len(packet))
+            if len(offsets) == 1:
+                raise ValueError("no audio decoded")
+            index_part.write_bytes(offsets.tobytes())
+            # The index is what marks an entry complete, so it is renamed last
+            os.replace(data_part, data_path)
+            os.replace(index_part, index_path)
+        finally:
+            source.cleanup()
+            data_part.unlink(missing_ok=True)
+            index_part.unlink(missing_ok=True)
+        return offsets[-1] + len(offsets) * offsets.itemsize
+
+    async def _evict(self):
+        """Delete least recently used tracks until the cache fits its budget."""
+        total = self.size
+        victims = []
+        while total > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            victims.append(key)
+            total -= size
+        for key in victims:
+            for suffix in (".idx", ".opus"):
+                await asyncio.to_thread((self.directory / f"{key}{suffix}").unlink, True)
+
+    async def clear(self):
+        """Delete every cached track."""
+        self.max_bytes, budget = 0, self.max_bytes
+        await self._evict()
+        self.max_bytes = budget
@@ -0,0 +1,211 @@
+"""Track metadata read with ffprobe in the background and cached in the store."""
+
+import asyncio
+import json
+import os
+from typing import Callable, Iterable, Optional
+
+from .capabilities import Capabilities
+from .store import JukeboxStore
+
+DEFAULT_PROBE_WORKERS = 2
+FLUSH_DELAY = 1.0  # seconds to batch newly probed tracks into one write
+PROBE_TIMEOUT = 30.0  # seconds before a stuck ffprobe is killed
+
+
+class TrackInfo:  # pylint: disable=too-few-public-methods
+    """What ffprobe reported about one file."""
+
+    __slots__ = ("duration", "codec", "bitrate", "tags")
+
+    def __init__(
+        self, duration: Optional[float] = None, codec: Optional[str] = None,
+        bitrate: Optional[int] = None, tags: Optional[dict[str, str]] = None
+    ):
+        self.duration = duration
+        self.codec = codec
+        self.bitrate = bitrate
+        self.tags = tags or {}
+
+    @classmethod
+    def from_ffprobe(cls, output: bytes) -> "TrackInfo":
+        """Parse `ffprobe -print_format json -show_format -show_streams` output."""
+        try:
+            data = json.loads(output)
+        except ValueError:
+            return cls()
+        fmt = data.get("format", {})
+        streams = data.get("streams") or [{}]
+
+        def number(value, kind):
+            try:
+                return kind(value)
+            except (TypeError, ValueError):
+                return None
+
+        tags = {**streams[0].get("tags", {}), **fmt.get("tags", {})}
+        return cls(
+            duration=number(fmt.get("duration"), float),
+            codec=streams[0].get("codec_name"),
+            bitrate=number(fmt.get("bit_rate"), int),
+            tags={key.lower(): str(value) for key, value in tags.items()},
+        )
+
+
+class MetadataProber:  # pylint: disable=too-many-instance-attributes
+    """Runs ffprobe on a bounded number of workers and caches results by file identity.
+
+    A file is identified by (path, mtime, size), so replacing a track re-probes it
+    while unchanged files are never probed twice, even across restarts.
+    """
+
+    def __init__(
+        self, store: JukeboxStore, capabilities: Capabilities,
+        workers: int = DEFAULT_PROBE_WORKERS
+    ):
+        self.store = store
+        self.capabilities = capabilities
+        self.probes = 0
+        self._limit = workers
+        self._workers = asyncio.Semaphore(workers)
+        self._cache: dict[str, tuple[int, int, TrackInfo]] = {}  # path: (mtime_ns, size, info)
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._dirty: dict[str, tuple[int, int, TrackInfo]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def load(self):
+        """Read previously probed metadata from the store."""
+        for path, mtime_ns, size, duration, codec, bitrate, tags in await self.store.load_meta():
+            info = TrackInfo(duration, codec, bitrate, json.loads(tags) if tags else None)
+            self._cache[path] = (mtime_ns, size, info)
+
+    async def close(self):
+        """Cancel background probes and write anything not yet saved."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._flush()
+
+    def cached(self, path: str) -> Optional[TrackInfo]:
+        """Metadata from memory only, without touching the disk."""
+        entry = self._cache.get(str(path))
+        return entry[2] if entry else None
+
+    def duration(self, path: str) -> Optional[float]:
+        """Cached duration of `path` in seconds, if known."""
+        info = self.cached(path)
+        return info.duration if info else None
+
+    def forget(self, path: str):
+        """Drop a deleted file's metadata."""
+        self._cache.pop(str(path), None)
+
+    async def probe(self, path: str) -> Optional[TrackInfo]:
+        """Metadata for `path`, running ffprobe only if the file is new or changed."""
+        path = str(path)
+        try:
+            stat = await asyncio.to_thread(os.stat, path)
+        except OSError:
+            return None
+        entry = self._cache.get(path)
+        if entry and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+            return entry[2]
+
+        # Concurrent requests for the same file share one ffprobe run
+        if path in self._inflight:
+            return await asyncio.shield(self._inflight[path])
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[path] = future
+        try:
+            info = await self._run(path)
+        except BaseException:
+            # Anyone sharing this run just gets no metadata; only the caller sees the error
+            future.set_result(None)
+            raise
+        finally:
+            self._inflight.pop(path, None)
+        future.set_result(info)
+        if info is not None:
+            self._cache[path] = self._dirty[path] = (stat.st_mtime_ns, stat.st_size, info)
+            self._schedule(self._flush_later())
+        return info
+
+    async def inspect(self, path: str) -> Optional[TrackInfo]:
+        """Probe a file without caching the result, e.g. an upload still being vetted."""
+        return await self._run(str(path))
+
+    def probe_soon(self, path: str, callback: Callable[[TrackInfo], None]):
+        """Probe `path` in the background and pass the result to `callback`, if there is one."""
+        async def run():
+            try:
+                info = await self.probe(path)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"[Jukebox] Probe error for {path}: {e}")
+                return
+            if info is not None:
+                callback(info)
+
+        self._schedule(run())
+
+    def prefetch(self, paths: Iterable[str]):
+        """Probe any of `paths` that aren't cached yet in the background."""
+        missing = [str(path) for path in paths if str(path) not in self._cache]
+        if missing:
+            self._schedule(self._probe_all(missing))
+
+    async def _probe_all(self, paths: list[str]):
+        pending = iter(paths)
+
+        async def drain():
+            for path in pending:
+                try:
+                    await self.probe(path)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    print(f"[Jukebox] Probe error for {path}: {e}")
+
+        # One drainer per worker keeps every slot busy without a task per file
+        await asyncio.gather(*(drain() for _ in range(self._limit)))
+
+    def _schedule(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, path: str) -> Optional[TrackInfo]:
+        await self.capabilities.wait()
+        ffprobe = self.capabilities.ffprobe
+        if ffprobe is None:
+            return None
+        async with self._workers:
+            self.probes += 1
+            proc = await asyncio.create_subprocess_exec(
+                ffprobe, "-v", "quiet", "-print_format", "json",
+                "-show_format", "-show_streams", "-select_streams", "a:0", path,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            stdout = None
+            try:
+                stdout, _ = await asyncio.wait_for(proc.communicate(), PROBE_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if proc.returncode is None:
+                    # Timed out or cancelled; don't leave ffprobe running
+                    proc.kill()
+                    await proc.wait()
+        return TrackInfo.from_ffprobe(stdout) if stdout is not None else None
+
+    async def _flush_later(self):
+        await asyncio.sleep(FLUSH_DELAY)
+        await self._flush()
+
+    async def _flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        await self.store.save_meta([
+            (path, mtime_ns, size, info.duration, info.codec, info.bitrate,
+             json.dumps(info.tags) if info.tags else None)
+            for path, (mtime_ns, size, info) in dirty.items()
+        ])
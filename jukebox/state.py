@@ -0,0 +1,131 @@
+"""Crash-safe checkpoints of each guild's playback so it survives reloads and restarts."""
+
+import asyncio
+import json
+from typing import Callable, Optional
+
+from .store import JukeboxStore, PlaylistCursor
+from .tracks import LibraryIndex, ShuffleSegment, TrackQueue
+
+CHECKPOINT_INTERVAL = 5.0  # seconds; also the most position a crash can lose
+
+
+def dump_queue(queue: TrackQueue) -> list:
+    """Serialize a queue compactly: shuffles and playlists become a few fields each."""
+    items = []
+    for item in queue.segments():
+        if isinstance(item, ShuffleSegment):
+            items.append({"shuffle": item.seed, "position": item.position})
+        elif isinstance(item, PlaylistCursor):
+            items.append({
+                "playlist": item.name, "position": item.position, "remaining": item.remaining
+            })
+        elif isinstance(item, dict):
+            # TTS clips are ephemeral and may already be evicted from the cache
+            if not item.get("tts"):
+                items.append({"path": item["path"], "seek": item.get("seek", 0.0)})
+        else:
+            items.append(item)
+    return items
+
+
+def load_queue(items: list, store: JukeboxStore, library: LibraryIndex) -> TrackQueue:
+    """Rebuild a queue saved by `dump_queue`.
+
+    Shuffles are re-derived from the current library, so if it changed since the
+    checkpoint the remaining order differs, but no track repeats within the pass.
+    """
+    queue = TrackQueue()
+    for item in items:
+        if isinstance(item, int):
+            queue.append(item)
+        elif "shuffle" in item:
+            segment = ShuffleSegment(library.snapshot, item["shuffle"], item["position"])
+            if segment:
+                queue.append(segment)
+        elif "playlist" in item:
+            queue.append(PlaylistCursor(
+                store, item["playlist"], item["remaining"], position=item["position"]
+            ))
+        else:
+            queue.append({"path": item["path"], "seek": item["seek"], "resume": True})
+    return queue
+
+
+class PlaybackCheckpointer:
+    """Periodically writes each active guild's snapshot to the store.
+
+    `collect` returns a guild's snapshot dict, or None once it has nothing to
+    resume. Only snapshots that changed since the last write are sent, and they
+    are written in a single SQLite transaction, so a checkpoint is cheap and a
+    crash mid-write leaves the previous one intact.
+    """
+
+    def __init__(
+        self, store: JukeboxStore, collect: Callable[[int], Optional[dict]],
+        interval: float = CHECKPOINT_INTERVAL
+    ):
+        self.store = store
+        self.collect = collect
+        self.interval = interval
+        self.tracked: set[int] = set()
+        self._written: dict[int, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self) -> dict[int, dict]:
+        """Read every saved snapshot."""
+        saved = await self.store.load_states()
+        self._written = dict(saved)
+        self.tracked.update(saved)
+        return {guild_id: json.loads(state) for guild_id, state in saved.items()}
+
+    def keep(self, guild_ids):
+        """Stop tracking guilds but leave their saved snapshots for a later load."""
+        for guild_id in guild_ids:
+            self.tracked.discard(guild_id)
+            self._written.pop(guild_id, None)
+
+    def start(self):
+        """Begin checkpointing in the background."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and write one final checkpoint.
+
+        Does nothing if checkpointing never started, so unloading before saved
+        sessions were restored keeps them for the next load.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.checkpoint()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.checkpoint()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"[Jukebox] Checkpoint error: {e}")
+
+    async def checkpoint(self):
+        """Write every tracked guild whose snapshot changed."""
+        changes: dict[int, Optional[str]] = {}
+        for guild_id in list(self.tracked):
+            snapshot = self.collect(guild_id)
+            state = json.dumps(snapshot, separators=(",", ":")) if snapshot else None
+            if state is None:
+                self.tracked.discard(guild_id)
+            if self._written.get(guild_id) != state:
+                changes[guild_id] = state
+        if not changes:
+            return
+        await self.store.save_states(changes)
+        for guild_id, state in changes.items():
+            if state is None:
+                self._written.pop(guild_id, None)
+            else:
+                self._written[guild_id] = state
@@ -0,0 +1,318 @@
+"""SQLite storage for jukebox playlists and playback state."""
+
+import asyncio
+import json
+import sqlite3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE COLLATE NOCASE
+);
+CREATE TABLE IF NOT EXISTS playlists (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    next_position INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS playlist_entries (
+    playlist_id INTEGER NOT NULL REFERENCES playlists(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    track_id INTEGER NOT NULL REFERENCES tracks(id),
+    PRIMARY KEY (playlist_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS playlist_entries_track ON playlist_entries(playlist_id, track_id);
+CREATE TABLE IF NOT EXISTS guild_state (
+    guild_id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS uploads (
+    sha256 TEXT PRIMARY KEY,
+    track_id INTEGER NOT NULL REFERENCES tracks(id)
+);
+CREATE TABLE IF NOT EXISTS track_meta (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    duration REAL,
+    codec TEXT,
+    bitrate INTEGER,
+    tags TEXT
+);
+"""
+
+
+class JukeboxStore:
+    """Playlists stored as (playlist, position) -> track ID rows.
+
+    Tracks are stored by library name rather than absolute path so the library can
+    move. sqlite3 connections are not async, so every query runs on a single
+    dedicated thread; that also serializes writers, and each change is one
+    transaction, so concurrent edits can't lose each other's writes.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jukebox-db")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def open(self):
+        """Open the database and create any missing tables."""
+        await self._run(self._open)
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+
+    async def close(self):
+        """Close the database and stop the worker thread."""
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+    def _track_id(self, name: str) -> int:
+        self._conn.execute("INSERT OR IGNORE INTO tracks (name) VALUES (?)", (name,))
+        return self._conn.execute("SELECT id FROM tracks WHERE name = ?", (name,)).fetchone()[0]
+
+    def _playlist_id(self, name: str) -> Optional[int]:
+        row = self._conn.execute("SELECT id FROM playlists WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    async def track_ids(self, names: list[str]) -> dict[str, int]:
+        """Return the track ID for each name, registering any that are new."""
+        def track_ids():
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO tracks (name) VALUES (?)", ((n,) for n in names)
+                )
+                return {name: self._track_id(name) for name in names}
+        return await self._run(track_ids)
+
+    async def find_upload(self, sha256: str) -> Optional[str]:
+        """Name of the track first added from content with this hash, if any."""
+        def find():
+            row = self._conn.execute(
+                "SELECT t.name FROM uploads u JOIN tracks t ON t.id = u.track_id"
+                " WHERE u.sha256 = ?",
+                (sha256,),
+            ).fetchone()
+            return row[0] if row else None
+        return await self._run(find)
+
+    async def record_upload(self, sha256: str, name: str):
+        """Remember that `name` holds the content with this hash."""
+        def record():
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO uploads (sha256, track_id) VALUES (?, ?)",
+                    (sha256, self._track_id(name)),
+                )
+        await self._run(record)
+
+    async def create_playlist(self, name: str) -> bool:
+        """Create an empty playlist. Returns False if it already exists."""
+        def create():
+            with self._conn:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO playlists (name) VALUES (?)", (name,)
+                )
+                return cursor.rowcount == 1
+        return await self._run(create)
+
+    async def delete_playlist(self, name: str) -> bool:
+        """Delete a playlist and its entries. Returns False if it didn't exist."""
+        def delete():
+            with self._conn:
+                cursor = self._conn.execute("DELETE FROM playlists WHERE name = ?", (name,))
+                return cursor.rowcount == 1
+        return await self._run(delete)
+
+    async def playlist_length(self, name: str) -> Optional[int]:
+        """Number of entries in a playlist, or None if it doesn't exist."""
+        def length():
+            playlist_id = self._playlist_id(name)
+            if playlist_id is None:
+                return None
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM playlist_entries WHERE playlist_id = ?", (playlist_id,)
+            ).fetchone()[0]
+        return await self._run(length)
+
+    async def append(self, name: str, track: str):
+        """Append a track to a playlist, creating the playlist if needed."""
+        def append():
+            with self._conn:
+                self._conn.execute("INSERT OR IGNORE INTO playlists (name) VALUES (?)", (name,))
+                playlist_id, position = self._conn.execute(
+                    "SELECT id, next_position FROM playlists WHERE name = ?", (name,)
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT INTO playlist_entries (playlist_id, position, track_id)"
+                    " VALUES (?, ?, ?)",
+                    (playlist_id, position, self._track_id(track)),
+                )
+                self._conn.execute(
+                    "UPDATE playlists SET next_position = ? WHERE id = ?",
+                    (position + 1, playlist_id),
+                )
+        await self._run(append)
+
+    async def remove(self, name: str, track: str) -> Optional[str]:
+        """Remove the first occurrence of a track. Returns its stored name if found."""
+        def remove():
+            with self._conn:
+                playlist_id = self._playlist_id(name)
+                if playlist_id is None:
+                    return None
+                row = self._conn.execute(
+                    "SELECT e.position, t.name FROM playlist_entries e"
+                    " JOIN tracks t ON t.id = e.track_id"
+                    " WHERE e.playlist_id = ? AND t.name = ?"
+                    " ORDER BY e.position LIMIT 1",
+                    (playlist_id, track),
+                ).fetchone()
+                if row is None:
+                    return None
+                self._conn.execute(
+                    "DELETE FROM playlist_entries WHERE playlist_id = ? AND position = ?",
+                    (playlist_id, row[0]),
+                )
+                return row[1]
+        return await self._run(remove)
+
+    async def entries(self, name: str, after: int = -1, limit: int = 100) -> list[tuple[int, str]]:
+        """Return up to `limit` (position, track name) pairs after position `after`."""
+        def entries():
+            playlist_id = self._playlist_id(name)
+            if playlist_id is None:
+                return []
+            return self._conn.execute(
+                "SELECT e.position, t.name FROM playlist_entries e"
+                " JOIN tracks t ON t.id = e.track_id"
+                " WHERE e.playlist_id = ? AND e.position > ?"
+                " ORDER BY e.position LIMIT ?",
+                (playlist_id, after, limit),
+            ).fetchall()
+        return await self._run(entries)
+
+    async def save_states(self, states: dict[int, Optional[str]]):
+        """Write changed guild snapshots in one transaction; None deletes a guild's row."""
+        def save():
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO guild_state (guild_id, state) VALUES (?, ?)"
+                    " ON CONFLICT (guild_id) DO UPDATE SET state = excluded.state",
+                    [(gid, state) for gid, state in states.items() if state is not None],
+                )
+                self._conn.executemany(
+                    "DELETE FROM guild_state WHERE guild_id = ?",
+                    [(gid,) for gid, state in states.items() if state is None],
+                )
+        await self._run(save)
+
+    async def load_states(self) -> dict[int, str]:
+        """Every saved guild snapshot."""
+        def load():
+            return dict(self._conn.execute("SELECT guild_id, state FROM guild_state"))
+        return await self._run(load)
+
+    async def save_meta(self, rows: list[tuple]):
+        """Upsert (path, mtime_ns, size, duration, codec, bitrate, tags) rows."""
+        def save():
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO track_meta"
+                    " (path, mtime_ns, size, duration, codec, bitrate, tags)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+        await self._run(save)
+
+    async def load_meta(self) -> list[tuple]:
+        """Every cached metadata row."""
+        def load():
+            return self._conn.execute(
+                "SELECT path, mtime_ns, size, duration, codec, bitrate, tags FROM track_meta"
+            ).fetchall()
+        return await self._run(load)
+
+    async def migrate_json(self, directory: Path) -> int:
+        """Import legacy `<name>.json` playlists, renaming each file once it is stored."""
+        def migrate():
+            migrated = 0
+            for path in sorted(directory.glob("*.json")):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        songs = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if not isinstance(songs, list) or not all(isinstance(s, str) for s in songs):
+                    print(f"[Jukebox] Skipping {path.name}: not a list of track names")
+                    continue
+                try:
+                    with self._conn:
+                        self._conn.execute(
+                            "INSERT OR IGNORE INTO playlists (name) VALUES (?)", (path.stem,)
+                        )
+                        playlist_id, start = self._conn.execute(
+                            "SELECT id, next_position FROM playlists WHERE name = ?",
+                            (path.stem,),
+                        ).fetchone()
+                        rows = [
+                            (playlist_id, start + i, self._track_id(Path(song).stem))
+                            for i, song in enumerate(songs)
+                        ]
+                        self._conn.executemany(
+                            "INSERT INTO playlist_entries (playlist_id, position, track_id)"
+                            " VALUES (?, ?, ?)",
+                            rows,
+                        )
+                        self._conn.execute(
+                            "UPDATE playlists SET next_position = ? WHERE id = ?",
+                            (start + len(rows), playlist_id),
+                        )
+                        # Renamed inside the transaction, so a failure rolls the import
+                        # back instead of importing the file again on the next load
+                        path.rename(path.with_suffix(".json.migrated"))
+                except OSError as e:
+                    print(f"[Jukebox] Couldn't migrate {path.name}: {e}")
+                    continue
+                migrated += 1
+            return migrated
+        return await self._run(migrate)
+
+
+class PlaylistCursor:  # pylint: disable=too-few-public-methods
+    """Walks a playlist in position order, fetching one page of entries at a time."""
+
+    def __init__(  # pylint: disable=too-many-arguments, too-many-positional-arguments
+        self, store: JukeboxStore, name: str, length: int, page_size: int = 100,
+        position: int = -1
+    ):
+        self.store = store
+        self.name = name
+        self.remaining = length
+        self.page_size = page_size
+        self.position = position
+        self._page: deque[tuple[int, str]] = deque()
+
+    async def next(self) -> Optional[str]:
+        """Return the next track name, or None once the playlist is exhausted."""
+        if not self._page:
+            self._page.extend(await self.store.entries(self.name, self.position, self.page_size))
+        if not self._page:
+            self.remaining = 0
+            return None
+        self.position, track = self._page.popleft()
+        self.remaining = max(0, self.remaining - 1)
+        return track
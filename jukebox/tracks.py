@@ -0,0 +1,209 @@
+"""Compact track identifiers and the per-guild play queue."""
+
+import asyncio
+import random
+from array import array
+from collections import deque
+from pathlib import Path
+from typing import Optional
+
+from .store import JukeboxStore
+
+
+class LibraryIndex:
+    """Maps library track names to the store's integer track IDs.
+
+    One index is shared by every guild, and `snapshot` is only rebuilt when the
+    library changes, so any number of shuffles can reference it without copying.
+    """
+
+    def __init__(self, library_path: Path):
+        self.library_path = library_path
+        self.snapshot = array("q")
+        self._names: dict[int, str] = {}
+        self._ids: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.snapshot)
+
+    def name(self, track_id: int) -> str:
+        """Library name of a track ID."""
+        return self._names.get(track_id, f"#{track_id}")
+
+    def path(self, track_id: int) -> Path:
+        """Library file for a track ID."""
+        return self.library_path / f"{self.name(track_id)}.mp3"
+
+    def get(self, name: str) -> Optional[int]:
+        """Track ID for a library name, if it has been indexed."""
+        return self._ids.get(name.casefold())
+
+    async def refresh(self, store: JukeboxStore):
+        """Re-scan the library, registering new files and dropping deleted ones."""
+        names = await asyncio.to_thread(
+            lambda: sorted(p.stem for p in self.library_path.glob("*.mp3"))
+        )
+        known = {name.casefold() for name in names}
+        missing = [name for name in names if name.casefold() not in self._ids]
+        if missing:
+            for name, track_id in (await store.track_ids(missing)).items():
+                self._names[track_id] = name
+                self._ids[name.casefold()] = track_id
+        current = array("q", sorted(self._ids[key] for key in known))
+        if current != self.snapshot:
+            self.snapshot = current
+
+    async def add(self, store: JukeboxStore, name: str) -> int:
+        """Register a single new library file and return its ID."""
+        track_id = self.get(name)
+        if track_id is None:
+            track_id = (await store.track_ids([name]))[name]
+            self._names[track_id] = name
+            self._ids[name.casefold()] = track_id
+        if track_id not in self.snapshot:
+            self.snapshot = array("q", sorted((*self.snapshot, track_id)))
+        return track_id
+
+    def discard(self, name: str):
+        """Drop a deleted file from future shuffles. Queued copies are skipped at play time."""
+        track_id = self.get(name)
+        if track_id is not None and track_id in self.snapshot:
+            self.snapshot = array("q", (i for i in self.snapshot if i != track_id))
+
+
+class Permutation:  # pylint: disable=too-few-public-methods
+    """A seeded pseudo-random permutation of range(size) computed per index in O(1) memory.
+
+    A small Feistel network permutes the next power-of-four domain; indices that
+    land outside `size` are walked through the cipher again until they land inside.
+    """
+
+    ROUNDS = 4
+
+    def __init__(self, size: int, seed: int):
+        self.size = size
+        bits = max(2, (max(size, 2) - 1).bit_length())
+        self._half = (bits + 1) // 2
+        self._mask = (1 << self._half) - 1
+        rng = random.Random(seed)
+        self._keys = [rng.getrandbits(32) for _ in range(self.ROUNDS)]
+
+    def __getitem__(self, index: int) -> int:
+        value = index
+        while True:
+            left, right = value >> self._half, value & self._mask
+            for key in self._keys:
+                mixed = ((right ^ key) * 0x45D9F3B) & 0xFFFFFFFF
+                mixed ^= mixed >> 16
+                left, right = right, left ^ (mixed & self._mask)
+            value = (left << self._half) | right
+            if value < self.size:
+                return value
+
+
+class ShuffleSegment:
+    """A shuffled pass over a library snapshot, stored as (snapshot, seed, position)."""
+
+    def __init__(self, ids: array, seed: int, position: int = 0):
+        self.ids = ids
+        self.seed = seed
+        self.position = position
+        self._order = Permutation(len(ids), seed)
+
+    def __len__(self) -> int:
+        return len(self.ids) - self.position
+
+    def __getitem__(self, offset: int) -> int:
+        return self.ids[self._order[self.position + offset]]
+
+    def pop(self) -> int:
+        """Take the next track ID."""
+        track_id = self[0]
+        self.position += 1
+        return track_id
+
+
+class TrackQueue:
+    """A guild's upcoming entries.
+
+    Plain entries are track IDs or dicts for TTS and seeks. Shuffles and playlists
+    are single lazy segments, so queueing a whole library costs a few bytes and
+    popping, pushing to the front and reading a page never copy the queue.
+    """
+
+    def __init__(self):
+        self._items: deque = deque()
+        self._length = 0
+        self.clears = 0  # bumped by `clear`, so work begun on older contents can tell
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __bool__(self) -> bool:
+        return self._length > 0
+
+    @staticmethod
+    def _size(item) -> int:
+        return len(item) if isinstance(item, ShuffleSegment) else 1
+
+    def append(self, entry):
+        """Add an entry or segment to the back of the queue."""
+        self._items.append(entry)
+        self._length += self._size(entry)
+
+    def appendleft(self, entry):
+        """Add an entry to the front of the queue."""
+        self._items.appendleft(entry)
+        self._length += self._size(entry)
+
+    def clear(self):
+        """Remove everything."""
+        self._items.clear()
+        self._length = 0
+        self.clears += 1
+
+    def peek(self):
+        """The item at the front, which may be a PlaylistCursor the caller must drain."""
+        return self._items[0] if self._items else None
+
+    def popleft(self):
+        """Remove and return the next entry, expanding shuffles one track at a time."""
+        head = self._items[0]
+        if isinstance(head, ShuffleSegment):
+            track_id = head.pop()
+            self._length -= 1
+            if not head:
+                self._items.popleft()
+            return track_id
+        self._items.popleft()
+        self._length -= 1
+        return head
+
+    def discard_head(self, item):
+        """Drop an exhausted PlaylistCursor from the front."""
+        if self._items and self._items[0] is item:
+            self._items.popleft()
+            self._length -= 1
+
+    def segments(self) -> list:
+        """Every queued item with shuffles and playlists left unexpanded."""
+        return list(self._items)
+
+    def page(self, start: int, count: int) -> list:
+        """Entries at positions start..start+count, stepping over whole segments."""
+        rows = []
+        offset = start
+        for item in self._items:
+            size = self._size(item)
+            if offset >= size:
+                offset -= size
+                continue
+            if isinstance(item, ShuffleSegment):
+                take = min(size - offset, count - len(rows))
+                rows.extend(item[offset + i] for i in range(take))
+            else:
+                rows.append(item)
+            offset = 0
+            if len(rows) >= count:
+                break
+        return rows
@@ -0,0 +1,194 @@
+"""Background transcoding pipeline that converts non-MP3 uploads into library MP3s."""
+
+import asyncio
+import os
+import re
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from .capabilities import Capabilities
+
+SUPPORTED_EXTENSIONS = (".mp3", ".mp4", ".flac", ".wav", ".m4a", ".webm")
+DEFAULT_WORKERS = 2
+PROGRESS_INTERVAL = 2.0  # seconds between progress callbacks
+
+ProgressCallback = Callable[[float], Awaitable[None]]
+
+_DURATION_RE = re.compile(rb"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+class TranscodeError(Exception):
+    """Raised when an upload cannot be normalized into the library."""
+
+
+class TranscodeJob:  # pylint: disable=too-few-public-methods
+    """A single queued conversion and the future its submitter is waiting on."""
+
+    def __init__(self, source: Path, dest: Path, progress: Optional[ProgressCallback]):
+        self.source = source
+        self.dest = dest
+        self.progress = progress
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class Transcoder:
+    """A job queue drained by a bounded pool of ffmpeg workers."""
+
+    def __init__(self, capabilities: Capabilities, workers: int = DEFAULT_WORKERS):
+        self.capabilities = capabilities
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._workers: list[asyncio.Task] = []
+        self._target = max(1, workers)
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs waiting for a free worker."""
+        return self._queue.qsize()
+
+    @property
+    def workers(self) -> int:
+        """Configured number of concurrent ffmpeg processes."""
+        return self._target
+
+    def start(self):
+        """Spawn worker tasks up to the configured limit."""
+        self._workers = [t for t in self._workers if not t.done()]
+        while len(self._workers) < self._target:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    def set_workers(self, count: int):
+        """Resize the pool. Surplus workers retire once the backlog ahead of them drains."""
+        count = max(1, count)
+        surplus = self._target - count
+        self._target = count
+        for _ in range(surplus):
+            self._queue.put_nowait(None)
+        self.start()
+
+    async def close(self):
+        """Stop all workers and fail any jobs that never started."""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            if job is not None and not job.future.done():
+                job.future.set_exception(TranscodeError("The jukebox was unloaded."))
+
+    async def submit(
+        self, source: Path, dest: Path, progress: Optional[ProgressCallback] = None
+    ) -> Path:
+        """Queue `source` for normalization into `dest` and wait for it to finish."""
+        job = TranscodeJob(source, dest, progress)
+        await self._queue.put(job)
+        return await job.future
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            if job is None:
+                if len([t for t in self._workers if not t.done()]) > self._target:
+                    self._workers.remove(asyncio.current_task())
+                    return
+                continue
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.set_exception(TranscodeError("Conversion was cancelled."))
+                raise
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                if not job.future.done():
+                    job.future.set_result(job.dest)
+
+    async def _run(self, job: TranscodeJob):
+        """Convert the upload with ffmpeg and move the result into place."""
+        part_path = job.dest.with_suffix(job.dest.suffix + ".part")
+        try:
+            await self._ffmpeg(job, part_path)
+            await asyncio.to_thread(os.replace, part_path, job.dest)
+        except OSError as e:
+            raise TranscodeError(f"could not write the track: {e}") from e
+        finally:
+            await asyncio.to_thread(part_path.unlink, True)
+
+        if job.progress:
+            await job.progress(1.0)
+
+    async def _ffmpeg(self, job: TranscodeJob, output: Path):
+        await self.capabilities.wait()
+        ffmpeg = self.capabilities.ffmpeg
+        if ffmpeg is None:
+            raise TranscodeError("ffmpeg is not installed.")
+        if "libmp3lame" not in self.capabilities.encoders:
+            raise TranscodeError("ffmpeg was built without the MP3 encoder.")
+        proc = await asyncio.create_subprocess_exec(
+            ffmpeg, "-hide_banner", "-nostdin", "-y",
+            "-i", str(job.source),
+            "-vn", "-acodec", "libmp3lame", "-q:a", "2", "-f", "mp3",
+            "-progress", "pipe:1", "-nostats",
+            str(output),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        duration = asyncio.get_running_loop().create_future()
+        stderr_task = asyncio.create_task(_read_stderr(proc.stderr, duration))
+        try:
+            await _report_progress(proc.stdout, duration, job.progress)
+            stderr_tail = await stderr_task
+            await proc.wait()
+        except asyncio.CancelledError:
+            proc.kill()
+            stderr_task.cancel()
+            await proc.wait()
+            raise
+
+        if proc.returncode != 0:
+            detail = stderr_tail.decode(errors="replace").strip().splitlines()
+            reason = detail[-1] if detail else f"exit code {proc.returncode}"
+            raise TranscodeError(f"ffmpeg could not convert the file: {reason}")
+
+
+async def _read_stderr(stream, duration: asyncio.Future) -> bytes:
+    """Drain ffmpeg's stderr, resolving the input duration once it is printed."""
+    tail = b""
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        tail = (tail + line)[-2048:]
+        if not duration.done():
+            match = _DURATION_RE.search(line)
+            if match:
+                hours, minutes, seconds = match.groups()
+                duration.set_result(int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+    if not duration.done():
+        duration.set_result(None)
+    return tail
+
+
+async def _report_progress(stream, duration: asyncio.Future, progress: Optional[ProgressCallback]):
+    """Parse `-progress pipe:1` output and forward throttled completion ratios."""
+    last_report = 0.0
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        key, _, value = line.decode(errors="replace").strip().partition("=")
+        if key not in ("out_time_us", "out_time_ms") or progress is None or not duration.done():
+            continue
+        total = duration.result()
+        now = time.monotonic()
+        if not total or now - last_report < PROGRESS_INTERVAL:
+            continue
+        try:
+            ratio = min(1.0, int(value) / 1_000_000 / total)
+        except ValueError:
+            continue
+        last_report = now
+        await progress(ratio)
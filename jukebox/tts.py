@@ -0,0 +1,155 @@
+"""Text-to-speech synthesis backed by a size-capped on-disk cache."""
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import edge_tts
+
+from .metrics import Latency
+
+DEFAULT_TTS_VOICE = "en-US-AriaNeural"
+DEFAULT_CACHE_MB = 64
+PIN_SECONDS = 300  # recently used clips may still be queued, so never evict them
+
+
+class TTSError(Exception):
+    """Raised when a provider fails to synthesize speech."""
+
+
+class TTSProvider:  # pylint: disable=too-few-public-methods
+    """Interface for speech synthesizers.
+
+    Implementations write an audio file ffmpeg can read to `path`. Swap in a local
+    provider to run the cog without network access.
+    """
+
+    async def synthesize(self, text: str, voice: str, path: Path):
+        """Write `text` spoken by `voice` to `path`."""
+        raise NotImplementedError
+
+
+class EdgeTTSProvider(TTSProvider):  # pylint: disable=too-few-public-methods
+    """Synthesizes speech with Microsoft Edge's online voices."""
+
+    async def synthesize(self, text: str, voice: str, path: Path):
+        await edge_tts.Communicate(text, voice).save(str(path))
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace. Case is kept because it changes how acronyms are read."""
+    return " ".join(text.split())
+
+
+class TTSCache:  # pylint: disable=too-many-instance-attributes
+    """Caches synthesized clips keyed by (voice, normalized text) with LRU eviction."""
+
+    def __init__(self, directory: Path, provider: TTSProvider, max_bytes: int):
+        self.directory = directory
+        self.provider = provider
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.latency = Latency()  # synthesis time of cache misses
+        self._index: OrderedDict[str, tuple[int, float]] = OrderedDict()  # key: (size, last use)
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    @property
+    def size(self) -> int:
+        """Total bytes of cached clips."""
+        return sum(size for size, _ in self._index.values())
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    async def load(self):
+        """Index existing clips and delete partial files left by an interrupted run."""
+        self._index = OrderedDict(await asyncio.to_thread(self._scan))
+        await self._evict()
+
+    def _scan(self) -> list[tuple[str, tuple[int, float]]]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.directory.iterdir():
+            if path.suffix == ".part":
+                path.unlink(missing_ok=True)
+            elif path.suffix == ".mp3":
+                stat = path.stat()
+                entries.append((path.stem, (stat.st_size, stat.st_mtime)))
+        entries.sort(key=lambda item: item[1][1])
+        return entries
+
+    async def get(self, text: str, voice: str) -> Path:
+        """Return a clip of `text` spoken by `voice`, synthesizing it on a miss."""
+        text = normalize_text(text)
+        key = hashlib.sha256(f"{voice}\0{text}".encode()).hexdigest()
+        path = self.directory / f"{key}.mp3"
+
+        if key in self._index:
+            self.hits += 1
+            size, _ = self._index.pop(key)
+            self._index[key] = (size, time.time())
+            return path
+
+        # Identical requests that arrive together share one synthesis
+        if key in self._inflight:
+            self.hits += 1
+            return await asyncio.shield(self._inflight[key])
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            size = await self._synthesize(text, voice, path)
+        except asyncio.CancelledError:
+            # Cancelling the shared future would cancel everyone waiting on it too
+            future.set_exception(TTSError("synthesis was cancelled"))
+            future.exception()
+            raise
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            error = e if isinstance(e, TTSError) else TTSError(str(e) or type(e).__name__)
+            future.set_exception(error)
+            future.exception()  # mark retrieved in case nobody else was waiting
+            raise error from e
+        finally:
+            self._inflight.pop(key, None)
+
+        self._index[key] = (size, time.time())
+        future.set_result(path)
+        await self._evict()
+        return path
+
+    async def _synthesize(self, text: str, voice: str, path: Path) -> int:
+        part_path = path.with_suffix(".part")
+        started = time.monotonic()
+        try:
+            await self.provider.synthesize(text, voice, part_path)
+            self.latency.record(time.monotonic() - started)
+            await asyncio.to_thread(os.replace, part_path, path)
+            return (await asyncio.to_thread(path.stat)).st_size
+        finally:
+            await asyncio.to_thread(part_path.unlink, True)
+
+    async def _evict(self):
+        """Delete least recently used clips until the cache fits its budget."""
+        total = self.size
+        cutoff = time.time() - PIN_SECONDS
+        victims = []
+        while total > self.max_bytes and self._index:
+            key, (size, last_used) = next(iter(self._index.items()))
+            if last_used > cutoff:
+                break
+            del self._index[key]
+            victims.append(self.directory / f"{key}.mp3")
+            total -= size
+        for path in victims:
+            await asyncio.to_thread(path.unlink, True)
+
+    async def clear(self):
+        """Delete every cached clip."""
+        keys, self._index = list(self._index), OrderedDict()
+        for key in keys:
+            await asyncio.to_thread((self.directory / f"{key}.mp3").unlink, True)